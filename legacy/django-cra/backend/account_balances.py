@@ -0,0 +1,63 @@
+"""
+Verification of stored account balances.
+
+Account.balance is maintained incrementally: imports and Transaction
+save/delete apply the change in amount in the same database transaction.
+This module recomputes balances from scratch in one grouped query to detect
+(and optionally repair) any drift, e.g. after rows were edited outside the
+application.
+"""
+
+from decimal import Decimal
+from typing import List
+
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Account
+
+CENTS = Decimal('0.01')
+
+
+def verify_account_balances(accounts, fix: bool = False) -> List[dict]:
+    """
+    Compare each account's stored balance with the sum of its transactions.
+
+    Args:
+        accounts: Account QuerySet to check
+        fix: Store the recomputed balance of every drifted account (one bulk update)
+
+    Returns:
+        One dict per account with id, name, bank, old_balance (stored),
+        new_balance (recomputed) and drift (new - old), as floats
+    """
+    balance_field = Account._meta.get_field('balance')
+    rows = list(
+        accounts.annotate(
+            computed=Coalesce(
+                Sum('transaction__amount'), Value(0),
+                output_field=DecimalField(max_digits=balance_field.max_digits, decimal_places=balance_field.decimal_places),
+            )
+        ).order_by('id')
+    )
+
+    report = []
+    drifted = []
+    for account in rows:
+        old_balance = account.balance
+        new_balance = Decimal(account.computed).quantize(CENTS)
+        if new_balance != old_balance:
+            account.balance = new_balance
+            drifted.append(account)
+        report.append({
+            'id': account.id,
+            'name': account.name,
+            'bank': account.bank,
+            'old_balance': float(old_balance),
+            'new_balance': float(new_balance),
+            'drift': float(new_balance - old_balance),
+        })
+
+    if fix and drifted:
+        Account.objects.bulk_update(drifted, ['balance'])
+    return report
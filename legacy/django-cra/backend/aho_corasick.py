@@ -0,0 +1,91 @@
+"""
+Aho-Corasick multi-pattern string matcher.
+
+Compiles a dictionary of keywords into a single automaton so one linear pass
+over a text reports every keyword occurrence, instead of testing each keyword
+with a separate substring search.
+"""
+
+from collections import deque
+from typing import Dict, Generic, Hashable, Iterator, List, Set, Tuple, TypeVar
+
+T = TypeVar('T', bound=Hashable)
+
+
+class AhoCorasick(Generic[T]):
+    """
+    Keyword automaton mapping each pattern to one or more payload values.
+
+    Usage:
+        automaton = AhoCorasick()
+        automaton.add('STARBUCKS', 'Dining Out')
+        automaton.build()
+        for start, end, value in automaton.iter_matches('STARBUCKS #123'):
+            ...
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, T]]] = [[]]  # (pattern length, value)
+        self._built = False
+
+    def __len__(self):
+        return len(self._goto)
+
+    def add(self, pattern: str, value: T) -> None:
+        """Register a non-empty pattern. Must be called before build()."""
+        if not pattern:
+            raise ValueError("Pattern cannot be empty")
+        if self._built:
+            raise RuntimeError("Cannot add patterns after the automaton is built")
+
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), value))
+
+    def build(self) -> 'AhoCorasick[T]':
+        """Compute failure links breadth-first and merge outputs along them."""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+        self._built = True
+        return self
+
+    def iter_matches(self, text: str) -> Iterator[Tuple[int, int, T]]:
+        """Yield (start, end, value) for every pattern occurrence, in order of end position."""
+        if not self._built:
+            self.build()
+
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        state = 0
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                end = index + 1
+                for length, value in output[state]:
+                    yield end - length, end, value
+
+    def find_values(self, text: str) -> Set[T]:
+        """Return the set of payload values whose patterns occur in text."""
+        return {value for _, _, value in self.iter_matches(text)}
@@ -0,0 +1,178 @@
+"""
+Streaming statistics over expense amounts.
+
+Mean and variance per category come from the spending rollup: every rollup
+row stores the count, sum and Welford M2 of its expenses, and rows are
+combined with Chan's parallel update, so no individual amount is loaded.
+Median and median absolute deviation (MAD) are computed inside the database
+with window functions, returning at most two rows per category.
+
+Both feed per-category outlier detection: an expense is unusual when its
+robust z-score ``(amount - median) / (1.4826 * MAD)`` exceeds
+``ROBUST_Z_CUTOFF``; categories whose MAD is zero (mostly identical amounts)
+fall back to ``mean + STDDEV_CUTOFF * std``.
+"""
+
+import math
+from datetime import date
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, Variance, When, Window
+from django.db.models.functions import Abs, RowNumber
+
+from .models import SpendingRollup, Transaction
+from .rollups import split_date_range
+
+ROBUST_Z_CUTOFF = 3.5
+STDDEV_CUTOFF = 2
+MAD_SCALE = 1.4826  # Makes the MAD a consistent estimator of the standard deviation for normal data
+
+
+class RunningStats:
+    """Count, mean and M2 (sum of squared deviations) of a stream of values, updated with Welford's method."""
+
+    __slots__ = ('count', 'mean', 'm2')
+
+    def __init__(self, count: int = 0, mean: float = 0.0, m2: float = 0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    @classmethod
+    def from_aggregate(cls, count: int, total, m2: float) -> 'RunningStats':
+        """Build from a stored (count, sum, M2) aggregate."""
+        return cls(count, float(total) / count if count else 0.0, float(m2 or 0))
+
+    def add(self, value: float) -> None:
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def merge(self, other: 'RunningStats') -> 'RunningStats':
+        """Combine with the statistics of another, disjoint set of values (Chan et al.)."""
+        if not other.count:
+            return self
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        return self
+
+    @property
+    def variance(self) -> float:
+        """Population variance."""
+        return self.m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(max(self.variance, 0.0))
+
+
+def category_expense_stats(user, start_date: date, end_date: date, account_id: Optional[int] = None) -> Dict[Optional[str], RunningStats]:
+    """
+    Mean and variance of expense amounts per category name between two dates.
+
+    Whole months are merged from SpendingRollup rows; the partial months at
+    the edges are aggregated by the database. Costs two queries.
+    """
+    stats: Dict[Optional[str], RunningStats] = {}
+    full_months, edges = split_date_range(start_date, end_date)
+
+    if full_months:
+        rollup = SpendingRollup.objects.filter(user=user, month__range=full_months, expense_count__gt=0)
+        if account_id is not None:
+            rollup = rollup.filter(account_id=account_id)
+        rows = rollup.values_list('category__name', 'expense_count', 'expense_total', 'expense_m2')
+        for category, count, total, m2 in rows:
+            stats.setdefault(category, RunningStats()).merge(RunningStats.from_aggregate(count, total, m2))
+
+    raw = Transaction.objects.filter(edges, user=user, amount__gt=0)
+    if account_id is not None:
+        raw = raw.filter(account_id=account_id)
+    rows = (
+        raw.values('category__name')
+        .annotate(count=Count('id'), total=Sum('amount'), variance=Variance('amount'))
+        .order_by()
+    )
+    for row in rows:
+        stats.setdefault(row['category__name'], RunningStats()).merge(
+            RunningStats.from_aggregate(row['count'], row['total'], float(row['variance'] or 0) * row['count'])
+        )
+    return stats
+
+
+def _category_filter(category: Optional[str]) -> Q:
+    if category is None:
+        return Q(category__name__isnull=True)
+    return Q(category__name=category)
+
+
+def _per_category_medians(queryset, expression) -> Dict[Optional[str], Decimal]:
+    """Median of ``expression`` per category name, selecting only the middle row(s) of each category."""
+    ranked = queryset.annotate(
+        value=expression,
+        position=Window(RowNumber(), partition_by=[F('category__name')], order_by=expression.asc()),
+        size=Window(Count('id'), partition_by=[F('category__name')]),
+    ).order_by()
+    # Row (size + 1) / 2 and (size + 2) / 2 are the middle rows: the same one for odd sizes
+    middle = ranked.filter(Q(position=(F('size') + 1) / 2) | Q(position=(F('size') + 2) / 2))
+
+    values: Dict[Optional[str], List[Decimal]] = {}
+    for category, value in middle.values_list('category__name', 'value'):
+        values.setdefault(category, []).append(Decimal(value))
+    return {category: sum(middle_values) / len(middle_values) for category, middle_values in values.items()}
+
+
+def category_median_mad(expenses) -> Dict[Optional[str], Tuple[Decimal, Decimal]]:
+    """
+    Median and median absolute deviation of amounts per category name.
+
+    Computed in the database with two queries; only the middle rows of each
+    category are fetched.
+    """
+    medians = _per_category_medians(expenses, F('amount'))
+    if not medians:
+        return {}
+
+    median_expression = Case(
+        *[When(_category_filter(category), then=Value(median)) for category, median in medians.items()],
+        output_field=DecimalField(max_digits=14, decimal_places=4),
+    )
+    deviation = Abs(F('amount') - median_expression, output_field=DecimalField(max_digits=14, decimal_places=4))
+    mads = _per_category_medians(expenses, deviation)
+    return {category: (median, mads.get(category, Decimal('0'))) for category, median in medians.items()}
+
+
+def category_outlier_thresholds(expenses, stats: Dict[Optional[str], RunningStats]) -> Dict[Optional[str], float]:
+    """Amount above which an expense is unusual for its category."""
+    thresholds = {}
+    for category, (median, mad) in category_median_mad(expenses).items():
+        if mad > 0:
+            thresholds[category] = float(median) + ROBUST_Z_CUTOFF * MAD_SCALE * float(mad)
+        elif category in stats:
+            thresholds[category] = stats[category].mean + STDDEV_CUTOFF * stats[category].std
+    return thresholds
+
+
+def find_unusual_transactions(expenses, stats: Dict[Optional[str], RunningStats], limit: int = 5):
+    """
+    Expenses that are outliers within their own category, largest first.
+
+    Args:
+        expenses: QuerySet of expense transactions to search
+        stats: Per-category RunningStats of the same transactions (see category_expense_stats)
+        limit: Maximum number of transactions returned
+    """
+    thresholds = category_outlier_thresholds(expenses, stats)
+    if not thresholds:
+        return Transaction.objects.none().values('date', 'description', 'amount', 'category__name')
+
+    unusual = Q()
+    for category, threshold in thresholds.items():
+        unusual |= _category_filter(category) & Q(amount__gt=threshold)
+    return expenses.filter(unusual).order_by('-amount').values(
+        'date', 'description', 'amount', 'category__name'
+    )[:limit]
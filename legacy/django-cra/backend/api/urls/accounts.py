@@ -5,6 +5,7 @@ from backend.views import (
     update_account,
     delete_account,
     refresh_account_balances,
+    get_account_balance_history,
 )
 
 app_name = 'accounts'
@@ -14,5 +15,6 @@ urlpatterns = [
     path('create/', create_account, name='create'),
     path('<int:account_id>/', update_account, name='update'),
     path('<int:account_id>/delete/', delete_account, name='delete'),
+    path('<int:account_id>/balance-history/', get_account_balance_history, name='balance_history'),
     path('refresh-balances/', refresh_account_balances, name='refresh_balances'),
 ] 
\ No newline at end of file
@@ -2,6 +2,7 @@ from django.urls import path
 from backend.auto_categorization_views import (
     auto_categorize_transactions,
     get_categorization_suggestions,
+    get_batch_categorization_suggestions,
     get_categorization_rules,
     create_categorization_rule,
     update_suggestions,
@@ -20,6 +21,7 @@ urlpatterns = [
     path('apply-preview/', apply_categorization_preview, name='apply_preview'),
     path('apply-to-similar/', apply_category_to_similar_transactions, name='apply_to_similar'),
     path('similar-count/', get_similar_transactions_count, name='similar_count'),
+    path('suggestions/', get_batch_categorization_suggestions, name='batch_suggestions'),
     path('suggestions/<int:transaction_id>/', get_categorization_suggestions, name='suggestions'),
     path('update-suggestions/', update_suggestions, name='update_suggestions'),
     path('rules/', get_categorization_rules, name='rules_list'),
@@ -5,6 +5,8 @@ from backend.views import (
     update_transaction_category,
     get_most_recent_transaction_date,
     upload_file,
+    upload_multiple_files,
+    get_import_job_status,
 )
 
 app_name = 'transactions'
@@ -12,6 +14,8 @@ app_name = 'transactions'
 urlpatterns = [
     path('', get_transactions, name='list'),
     path('upload/', upload_file, name='upload'),
+    path('upload-multiple/', upload_multiple_files, name='upload_multiple'),
+    path('import-jobs/<int:job_id>/', get_import_job_status, name='import_job_status'),
     path('missing-categories/', transactions_missing_categories, name='missing_categories'),
     path('<int:transaction_id>/update-category/', update_transaction_category, name='update_category'),
     path('latest/<str:table_name>/', get_most_recent_transaction_date, name='latest_date'),
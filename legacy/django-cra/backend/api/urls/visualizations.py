@@ -1,8 +1,9 @@
 from django.urls import path
-from backend.views import get_visualization_data
+from backend.views import get_top_merchants, get_visualization_data
 
 app_name = 'visualizations'
 
 urlpatterns = [
     path('', get_visualization_data, name='dashboard'),
+    path('merchants/', get_top_merchants, name='top-merchants'),
 ] 
\ No newline at end of file
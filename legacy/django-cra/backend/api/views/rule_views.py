@@ -3,7 +3,7 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import status
 from django.db import transaction
-from django.db.models import Q, Count
+from django.db.models import F, Q, Count
 from django.utils import timezone
 from datetime import datetime, timedelta
 import json
@@ -12,6 +12,7 @@ import re
 from ...models import CategorizationRule, RuleGroup, RuleUsage, Transaction, Category
 from ...serializers import CategorizationRuleSerializer, RuleGroupSerializer, RuleUsageSerializer
 from ...categorization_service import AutoCategorizationService
+from ...rollups import refresh_spending_rollup, slices_for_transactions
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -234,26 +235,29 @@ def apply_rule_to_transactions(request, rule_id):
         # Get uncategorized transactions
         transactions = Transaction.objects.filter(category__isnull=True)
         
-        matched_count = 0
-        for transaction in transactions:
-            service = AutoCategorizationService()
-            if service._rule_matches(transaction, rule):
-                transaction.category = rule.category
-                transaction.auto_categorized = True
-                transaction.confidence_score = 0.9  # High confidence for manual rules
-                transaction.save()
-                
-                # Record usage
-                RuleUsage.objects.create(
-                    rule=rule,
-                    transaction=transaction,
-                    confidence_score=0.9,
-                    was_applied=True
+        matched = []
+        service = AutoCategorizationService()
+        for txn in transactions:
+            if service._rule_matches(txn, rule):
+                txn.category = rule.category
+                txn.auto_categorized = True
+                txn.confidence_score = 0.9  # High confidence for manual rules
+                matched.append(txn)
+        matched_count = len(matched)
+        
+        # Write all matches, their usage records and the rule stats at once
+        with transaction.atomic():
+            Transaction.objects.bulk_update(matched, ['category', 'auto_categorized', 'confidence_score'])
+            RuleUsage.objects.bulk_create([
+                RuleUsage(rule=rule, transaction=txn, confidence_score=0.9, was_applied=True)
+                for txn in matched
+            ])
+            if matched_count:
+                CategorizationRule.objects.filter(id=rule.id).update(
+                    match_count=F('match_count') + matched_count,
+                    last_matched=timezone.now()
                 )
-                
-                # Update rule stats
-                rule.increment_match_count()
-                matched_count += 1
+            refresh_spending_rollup(slices_for_transactions(matched))
         
         return Response({
             'success': True,
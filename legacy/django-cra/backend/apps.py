@@ -1,6 +1,31 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import post_migrate
+
+
+def _ensure_description_index(sender, using, **kwargs):
+    from django.db import connections
+    from .description_index import has_fts_index, install_description_index
+    connection = connections[using]
+    if has_fts_index(connection):
+        install_description_index(connection)
+
+
+def _fail_interrupted_imports(sender, **kwargs):
+    # Once per process, on the first request rather than in ready(), which also runs for migrate
+    request_started.disconnect(dispatch_uid='backend.fail_interrupted_imports')
+    from .import_jobs import fail_interrupted_jobs
+    fail_interrupted_jobs()
 
 
 class BackendConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'backend'
+
+    def ready(self):
+        from . import response_cache  # noqa: F401 -- connects the data version receivers
+
+        # Table rebuilds in later migrations drop the SQLite FTS triggers; restore them
+        post_migrate.connect(_ensure_description_index, sender=self)
+        # Import jobs run in process memory, so those a restart interrupted can never finish
+        request_started.connect(_fail_interrupted_imports, dispatch_uid='backend.fail_interrupted_imports')
@@ -4,6 +4,11 @@ from rest_framework import status
 from django.db import transaction
 from .models import Transaction, Category, CategorizationRule
 from .categorization_service import AutoCategorizationService
+from .categorization_preview import preview_page
+from .category_classifier import record_categorization
+from .merchants import similarity_key
+from .rollups import refresh_spending_rollup, slices_for_queryset, slices_for_transactions
+from .transaction_search import same_description
 from .serializers import TransactionSerializer, CategorySerializer
 
 @api_view(['POST'])
@@ -37,6 +42,19 @@ def auto_categorize_transactions(request):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+MAX_SUGGESTION_BATCH = 200
+
+def _serialize_suggestions(suggestions):
+    return [
+        {
+            'category_id': s['category'].id,
+            'category_name': s['category'].name,
+            'confidence': round(s['confidence'], 2),
+            'reason': s['reason']
+        }
+        for s in suggestions
+    ]
+
 @api_view(['POST'])
 def get_categorization_suggestions(request, transaction_id):
     """
@@ -50,15 +68,7 @@ def get_categorization_suggestions(request, transaction_id):
         
         return Response({
             'transaction_id': transaction_id,
-            'suggestions': [
-                {
-                    'category_id': s['category'].id,
-                    'category_name': s['category'].name,
-                    'confidence': round(s['confidence'], 2),
-                    'reason': s['reason']
-                }
-                for s in suggestions
-            ]
+            'suggestions': _serialize_suggestions(suggestions)
         })
         
     except Transaction.DoesNotExist:
@@ -70,6 +80,42 @@ def get_categorization_suggestions(request, transaction_id):
             'error': str(e)
         }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+@api_view(['POST'])
+def get_batch_categorization_suggestions(request):
+    """
+    Get categorization suggestions for a page of transactions in one call.
+    
+    Body: {"transaction_ids": [...], "limit": 3}
+    """
+    try:
+        transaction_ids = [int(transaction_id) for transaction_id in request.data.get('transaction_ids', [])]
+        limit = int(request.data.get('limit', 3))
+    except (TypeError, ValueError):
+        return Response({
+            'error': 'transaction_ids must be a list of transaction IDs'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    if len(transaction_ids) > MAX_SUGGESTION_BATCH:
+        return Response({
+            'error': f'At most {MAX_SUGGESTION_BATCH} transactions per request'
+        }, status=status.HTTP_400_BAD_REQUEST)
+    
+    transactions = Transaction.objects.filter(user=request.user, id__in=transaction_ids).select_related('category')
+    position = {transaction_id: index for index, transaction_id in enumerate(transaction_ids)}
+    transactions = sorted(transactions, key=lambda t: position[t.id])
+    service = AutoCategorizationService()
+    suggestions = service.get_batch_categorization_suggestions(transactions, limit)
+    
+    return Response({
+        'results': [
+            {
+                'transaction_id': transaction_obj.id,
+                'suggestions': _serialize_suggestions(transaction_suggestions)
+            }
+            for transaction_obj, transaction_suggestions in zip(transactions, suggestions)
+        ]
+    })
+
 @api_view(['GET'])
 def get_categorization_rules(request):
     """Get all categorization rules."""
@@ -147,15 +193,9 @@ def update_suggestions(request):
 def preview_auto_categorization(request):
     """
     Generate preview of auto-categorization suggestions without applying them.
-    Supports pagination to handle large datasets.
+    Supports page numbers and an ``after`` keyset cursor (a transaction id).
     """
     try:
-        # Debug logging
-        print(f"Request data: {request.data}")
-        print(f"Request data type: {type(request.data)}")
-        
-        service = AutoCategorizationService()
-        
         # Handle potential data type issues
         try:
             confidence_threshold = float(request.data.get('confidence_threshold', 0.6))
@@ -163,101 +203,30 @@ def preview_auto_categorization(request):
             confidence_threshold = 0.6
             
         try:
-            page = int(request.data.get('page', 1))
+            page = max(int(request.data.get('page', 1)), 1)
         except (ValueError, TypeError):
             page = 1
             
         try:
-            page_size = int(request.data.get('page_size', 20))
+            page_size = max(int(request.data.get('page_size', 20)), 1)
         except (ValueError, TypeError):
             page_size = 20
         
-        print(f"Parsed values - confidence: {confidence_threshold}, page: {page}, page_size: {page_size}")
-        
-        # Get uncategorized transactions with pagination
-        uncategorized = Transaction.objects.filter(category__isnull=True)
-        total_count = uncategorized.count()
-        
-        # Calculate pagination
-        start_index = (page - 1) * page_size
-        end_index = start_index + page_size
-        paginated_transactions = uncategorized[start_index:end_index]
-        
-        preview_data = []
-        page_stats = {
-            'total_processed': 0,
-            'high_confidence': 0,
-            'medium_confidence': 0,
-            'low_confidence': 0,
-            'no_suggestion': 0,
-            'user_rules_applied': 0
-        }
-        
-        # Process only the current page of transactions
-        for transaction in paginated_transactions:
-            page_stats['total_processed'] += 1
-            
-            category, confidence = service.categorize_transaction(transaction)
-            
-            # Always include the transaction in preview data, regardless of whether it has a suggestion
-            suggestion_data = {
-                'transaction_id': transaction.id,
-                'description': transaction.description,
-                'amount': float(transaction.amount),
-                'date': transaction.date.isoformat(),
-                'account_name': transaction.account.name if transaction.account else 'Unknown',
-                'suggested_category': {
-                    'id': category.id,
-                    'name': category.name
-                } if category else None,
-                'confidence': round(confidence, 3) if category else 0,
-                'reason': 'Auto-match' if category and confidence < 0.9 else 'User rule' if category and confidence >= 0.9 else 'No suggestion',
-                'confidence_level': 'high' if category and confidence >= 0.8 else 'medium' if category and confidence >= 0.5 else 'low' if category else 'none'
-            }
-            
-            preview_data.append(suggestion_data)
-            
-            # Update page stats
-            if category:
-                if confidence >= 0.9:
-                    page_stats['user_rules_applied'] += 1
-                elif confidence >= 0.8:
-                    page_stats['high_confidence'] += 1
-                elif confidence >= 0.5:
-                    page_stats['medium_confidence'] += 1
-                else:
-                    page_stats['low_confidence'] += 1
-            else:
-                page_stats['no_suggestion'] += 1
-        
-        # Sort by confidence (highest first)
-        preview_data.sort(key=lambda x: x['confidence'], reverse=True)
+        try:
+            after = request.data.get('after')
+            after = int(after) if after is not None else None
+        except (ValueError, TypeError):
+            after = None
         
-        # Calculate pagination info
-        total_pages = (total_count + page_size - 1) // page_size
-        has_next = page < total_pages
-        has_previous = page > 1
+        preview = preview_page(request.user, page, page_size, after)
         
         return Response({
             'success': True,
-            'preview_data': preview_data,
-            'page_stats': page_stats,
-            'pagination': {
-                'current_page': page,
-                'total_pages': total_pages,
-                'page_size': page_size,
-                'total_count': total_count,
-                'has_next': has_next,
-                'has_previous': has_previous
-            },
+            **preview,
             'confidence_threshold': confidence_threshold
         })
         
     except Exception as e:
-        print(f"Error in preview_auto_categorization: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
         return Response({
             'success': False,
             'error': str(e)
@@ -267,6 +236,10 @@ def preview_auto_categorization(request):
 def apply_categorization_preview(request):
     """
     Apply the categorization changes from a preview.
+    
+    All transactions and categories are loaded with one in_bulk query each,
+    checked against the requesting user in memory and written with a single
+    bulk_update. Each change gets an entry in ``results``.
     """
     try:
         changes = request.data.get('changes', [])
@@ -275,48 +248,90 @@ def apply_categorization_preview(request):
             return Response({
                 'success': True,
                 'message': 'No changes to apply',
-                'applied_count': 0
+                'applied_count': 0,
+                'errors': [],
+                'results': []
             })
         
-        applied_count = 0
+        def _ids(key):
+            ids = set()
+            for change in changes:
+                try:
+                    ids.add(int(change[key]))
+                except (KeyError, TypeError, ValueError):
+                    pass
+            return ids
+        
+        transactions = Transaction.objects.in_bulk(_ids('transaction_id'))
+        categories = Category.objects.in_bulk(_ids('category_id'))
+        
+        results = []
         errors = []
+        updated = {}  # transaction id -> Transaction with the change applied
+        recategorized = {}
+        classifier_changes = []
         
         for change in changes:
+            transaction_id = change.get('transaction_id')
+            category_id = change.get('category_id')
+            action = change.get('action', 'categorize')  # 'categorize' or 'remove'
+            error = None
+            
             try:
-                transaction_id = change['transaction_id']
-                category_id = change['category_id']
-                action = change.get('action', 'categorize')  # 'categorize' or 'remove'
-                
-                transaction = Transaction.objects.get(id=transaction_id)
-                
-                if action == 'categorize':
-                    category = Category.objects.get(id=category_id)
-                    transaction.category = category
-                    transaction.auto_categorized = True
-                    transaction.confidence_score = change.get('confidence', 0.0)
-                    transaction.suggested_category = None  # Clear suggestion
-                    transaction.save()
-                    applied_count += 1
-                    
-                elif action == 'remove':
-                    # Remove the suggestion but keep transaction uncategorized
-                    transaction.suggested_category = None
-                    transaction.confidence_score = None
-                    transaction.save()
-                    applied_count += 1
-                    
-            except Transaction.DoesNotExist:
-                errors.append(f"Transaction {transaction_id} not found")
-            except Category.DoesNotExist:
-                errors.append(f"Category {category_id} not found")
-            except Exception as e:
-                errors.append(f"Error processing transaction {transaction_id}: {str(e)}")
+                txn = transactions.get(int(transaction_id))
+            except (TypeError, ValueError):
+                txn = None
+            
+            if txn is None or txn.user_id != request.user.id:
+                error = f"Transaction {transaction_id} not found"
+            elif action == 'categorize':
+                try:
+                    category = categories.get(int(category_id))
+                except (TypeError, ValueError):
+                    category = None
+                if category is None or category.user_id != request.user.id:
+                    error = f"Category {category_id} not found"
+                else:
+                    try:
+                        confidence = float(change.get('confidence', 0.0))
+                    except (TypeError, ValueError):
+                        confidence = 0.0
+                    classifier_changes.append((txn.similarity_key, txn.category_id, category.id, 1))
+                    txn.category = category
+                    txn.auto_categorized = True
+                    txn.confidence_score = confidence
+                    txn.suggested_category = None  # Clear suggestion
+                    updated[txn.id] = txn
+                    recategorized[txn.id] = txn
+            elif action == 'remove':
+                # Remove the suggestion but keep transaction uncategorized
+                txn.suggested_category = None
+                txn.confidence_score = None
+                updated[txn.id] = txn
+            else:
+                error = f"Unknown action '{action}' for transaction {transaction_id}"
+            
+            if error:
+                errors.append(error)
+                results.append({'transaction_id': transaction_id, 'success': False, 'error': error})
+            else:
+                results.append({'transaction_id': transaction_id, 'success': True, 'action': action})
         
+        with transaction.atomic():
+            Transaction.objects.bulk_update(
+                list(updated.values()),
+                ['category', 'auto_categorized', 'confidence_score', 'suggested_category']
+            )
+            refresh_spending_rollup(slices_for_transactions(recategorized.values()))
+        record_categorization(request.user.id, classifier_changes)
+        
+        applied_count = sum(1 for result in results if result['success'])
         return Response({
             'success': True,
             'message': f'Applied {applied_count} changes successfully',
             'applied_count': applied_count,
-            'errors': errors
+            'errors': errors,
+            'results': results
         })
         
     except Exception as e:
@@ -343,8 +358,7 @@ def get_similar_transactions_count(request):
         # Get the description from the transaction if not provided
         if not description:
             try:
-                transaction = Transaction.objects.get(id=transaction_id)
-                description = transaction.description
+                description = Transaction.objects.get(user=request.user, id=transaction_id).description
             except Transaction.DoesNotExist:
                 return Response({
                     'success': False,
@@ -352,9 +366,9 @@ def get_similar_transactions_count(request):
                 }, status=status.HTTP_404_NOT_FOUND)
         
         # Count uncategorized transactions with the same description
-        similar_count = Transaction.objects.filter(
-            description=description,
-            category__isnull=True
+        similar_count = same_description(
+            Transaction.objects.filter(user=request.user, category__isnull=True),
+            description
         ).count()
         
         return Response({
@@ -372,7 +386,10 @@ def get_similar_transactions_count(request):
 @api_view(['POST'])
 def apply_category_to_similar_transactions(request):
     """
-    Apply a category to all transactions with the same description.
+    Apply a category to all uncategorized transactions with the same description.
+    
+    The matching rows are changed with a single UPDATE located through the
+    merchant key index; the spending rollup and caches are refreshed once.
     """
     try:
         transaction_id = request.data.get('transaction_id')
@@ -387,7 +404,7 @@ def apply_category_to_similar_transactions(request):
         
         # Get the category
         try:
-            category = Category.objects.get(id=category_id)
+            category = Category.objects.get(user=request.user, id=category_id)
         except Category.DoesNotExist:
             return Response({
                 'success': False,
@@ -397,8 +414,7 @@ def apply_category_to_similar_transactions(request):
         # Get the description from the transaction if not provided
         if not description:
             try:
-                transaction = Transaction.objects.get(id=transaction_id)
-                description = transaction.description
+                description = Transaction.objects.get(user=request.user, id=transaction_id).description
             except Transaction.DoesNotExist:
                 return Response({
                     'success': False,
@@ -406,19 +422,21 @@ def apply_category_to_similar_transactions(request):
                 }, status=status.HTTP_404_NOT_FOUND)
         
         # Find all uncategorized transactions with the same description
-        similar_transactions = Transaction.objects.filter(
-            description=description,
-            category__isnull=True
+        similar_transactions = same_description(
+            Transaction.objects.filter(user=request.user, category__isnull=True),
+            description
         )
         
-        # Apply the category to all similar transactions
-        updated_count = 0
-        for transaction in similar_transactions:
-            transaction.category = category
-            transaction.auto_categorized = True
-            transaction.suggested_category = None
-            transaction.save()
-            updated_count += 1
+        # Apply the category to all similar transactions at once
+        with transaction.atomic():
+            rollup_slices = slices_for_queryset(similar_transactions)
+            updated_count = similar_transactions.update(
+                category=category,
+                auto_categorized=True,
+                suggested_category=None
+            )
+            refresh_spending_rollup(rollup_slices)
+        record_categorization(request.user.id, [(similarity_key(description), None, category.id, updated_count)])
         
         return Response({
             'success': True,
@@ -13,7 +13,10 @@ from django.conf import settings
 from django.db import connection
 from django.core.management import call_command
 from django.utils import timezone
+from django.core.cache import cache
 from .models import BackupSettings, DatabaseBackup
+from .category_classifier import clear_classifiers
+from .rule_engine import clear_rule_set_cache
 
 
 class DatabaseBackupService:
@@ -217,11 +220,20 @@ class DatabaseBackupService:
             # Validate that the restore was successful
             self._validate_restore()
             
+            # Cached responses, data versions and in-process models describe the replaced database
+            self._reset_cached_data()
+            
             return True
             
         except Exception as e:
             raise Exception(f"Restore failed: {str(e)}")
     
+    def _reset_cached_data(self):
+        """Drop everything cached from the database contents before a restore"""
+        cache.clear()
+        clear_classifiers()
+        clear_rule_set_cache()
+    
     def _restore_backup_metadata(self, current_backups, current_settings):
         """Restore backup records and settings after database restore"""
         try:
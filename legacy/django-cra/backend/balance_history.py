@@ -0,0 +1,105 @@
+"""
+Account balance over time.
+
+An account's balance on a day is the sum of its transaction amounts up to
+and including that day (the same definition as Account.balance). The series
+is computed in the database: a running-sum window over the account's
+transactions in (date, id) order, reduced to the last row of each day, week,
+month or year bucket. Only one row per bucket reaches Python, so decades of
+history cost a handful of rows at coarse intervals.
+"""
+
+from datetime import date
+from decimal import Decimal
+from typing import Optional
+
+from django.db.models import DecimalField, F, Max, Min, Sum, Window
+from django.db.models.functions import RowNumber, TruncMonth, TruncWeek, TruncYear
+
+from .models import Transaction
+
+# Finest to coarsest; 'auto' picks the finest one that fits max_points
+INTERVALS = {
+    'day': None,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'year': TruncYear,
+}
+INTERVAL_DAYS = {'day': 1, 'week': 7, 'month': 30, 'year': 365}
+DEFAULT_MAX_POINTS = 1000
+
+_AMOUNT = DecimalField(max_digits=14, decimal_places=2)
+CENTS = Decimal('0.01')
+
+
+def choose_interval(start_date: date, end_date: date, max_points: int = DEFAULT_MAX_POINTS) -> str:
+    """Finest interval yielding at most ``max_points`` buckets between two dates."""
+    span_days = (end_date - start_date).days + 1
+    for interval, days in INTERVAL_DAYS.items():
+        if span_days / days <= max_points:
+            return interval
+    return 'year'
+
+
+def balance_history(account, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                    interval: str = 'day', max_points: int = DEFAULT_MAX_POINTS) -> dict:
+    """
+    Closing balance of ``account`` per bucket.
+
+    Args:
+        account: Account to chart
+        start_date / end_date: Inclusive range; default to the first/last transaction
+        interval: 'day', 'week', 'month', 'year' or 'auto'
+        max_points: Upper bound on buckets when interval is 'auto'
+
+    Returns:
+        Dict with interval, opening_balance (before start_date) and points: one
+        {date, balance, net} per bucket with transactions, where date is the
+        bucket start, balance the closing balance and net the bucket's total
+    """
+    if interval not in INTERVALS and interval != 'auto':
+        raise ValueError(f"interval must be one of {', '.join([*INTERVALS, 'auto'])}")
+
+    transactions = Transaction.objects.filter(account=account)
+    if interval == 'auto':
+        if start_date is None or end_date is None:
+            bounds = transactions.aggregate(first=Min('date'), last=Max('date'))
+            start_date = start_date or bounds['first']
+            end_date = end_date or bounds['last']
+        interval = choose_interval(start_date, end_date, max_points) if start_date and end_date else 'day'
+
+    opening_balance = Decimal('0')
+    if start_date:
+        opening_balance = transactions.filter(date__lt=start_date).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        transactions = transactions.filter(date__gte=start_date)
+    if end_date:
+        transactions = transactions.filter(date__lte=end_date)
+
+    truncate = INTERVALS[interval]
+    bucket = F('date') if truncate is None else truncate('date')
+    rows = (
+        transactions
+        .annotate(
+            bucket=bucket,
+            running=Window(Sum('amount'), order_by=[F('date').asc(), F('id').asc()], output_field=_AMOUNT),
+            net=Window(Sum('amount'), partition_by=[bucket], output_field=_AMOUNT),
+            position=Window(RowNumber(), partition_by=[bucket], order_by=[F('date').desc(), F('id').desc()]),
+        )
+        .filter(position=1)
+        .order_by('bucket')
+        .values_list('bucket', 'running', 'net')
+    )
+
+    opening_balance = Decimal(opening_balance).quantize(CENTS)
+    return {
+        'interval': interval,
+        'opening_balance': float(opening_balance),
+        'points': [
+            {
+                'date': bucket_start.isoformat(),
+                'balance': float((opening_balance + Decimal(running)).quantize(CENTS)),
+                'net': float(Decimal(net).quantize(CENTS)),
+            }
+            for bucket_start, running, net in rows
+        ],
+    }
@@ -0,0 +1,219 @@
+"""
+Bank statement format registry.
+
+Every supported export layout registers a BankFormat with a cheap ``sniff``
+check over the first few KB of the file. Detection reads that sample once,
+guesses the text encoding from it, and picks the first registered format
+that recognizes it; the file is then parsed exactly once with the options
+the format declares, instead of being re-read per guessed layout or encoding.
+A guess made from the sample is checked against the rest of the file's
+bytes before parsing, so a non-ASCII byte past the sample falls back to the
+next encoding instead of being replaced.
+"""
+
+import codecs
+import csv
+import io
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+SNIFF_BYTES = 8192
+VALIDATE_BLOCK_BYTES = 1024 * 1024
+
+# Encodings tried in order, from the strictest to latin-1, which decodes any byte sequence
+ENCODING_FALLBACKS = ('utf-8', 'cp1252', 'latin-1')
+
+# Magic numbers of legacy .xls (OLE2 compound document) and .xlsx (zip) workbooks
+EXCEL_SIGNATURES = (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', b'PK\x03\x04')
+
+
+def detect_encoding(raw: bytes) -> str:
+    """
+    Pick a text encoding from a byte sample.
+
+    UTF-8 (with or without BOM) is preferred; otherwise cp1252, which bank
+    exports produced on Windows commonly use, and finally latin-1, which can
+    decode any byte sequence.
+    """
+    if raw.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        # Incremental decoding tolerates a multi-byte character cut off at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(raw, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    try:
+        raw.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def _decodes_as(file_path: str, encoding: str) -> bool:
+    """Whether the whole file decodes with ``encoding``, read block by block."""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    try:
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(VALIDATE_BLOCK_BYTES), b''):
+                decoder.decode(block)
+        decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def detect_file_encoding(file_path: str, raw: bytes) -> str:
+    """
+    Pick a text encoding for a whole file from its leading bytes ``raw``.
+
+    The guess of detect_encoding only covers the sample; when the file is
+    longer, each encoding from the guess on is checked against the whole
+    file until one decodes it (latin-1 always does).
+    """
+    encoding = detect_encoding(raw)
+    if len(raw) < SNIFF_BYTES:
+        return encoding
+    if encoding == 'utf-8-sig':
+        candidates = (encoding,) + ENCODING_FALLBACKS[1:]
+    else:
+        candidates = ENCODING_FALLBACKS[ENCODING_FALLBACKS.index(encoding):]
+    for candidate in candidates:
+        if candidate == 'latin-1' or _decodes_as(file_path, candidate):
+            return candidate
+    return 'latin-1'
+
+
+class StatementSample:
+    """The first SNIFF_BYTES of an upload, read and decoded once for all sniffers."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        with open(file_path, 'rb') as f:
+            self.raw = f.read(SNIFF_BYTES)
+        self.is_excel = self.raw.startswith(EXCEL_SIGNATURES)
+        self.encoding = None if self.is_excel else detect_file_encoding(file_path, self.raw)
+        self._rows = None
+
+    @property
+    def rows(self) -> List[List[str]]:
+        """Leading CSV rows of the sample with surrounding whitespace stripped (empty for workbooks)."""
+        if self._rows is None:
+            if self.is_excel:
+                self._rows = []
+            else:
+                text = self.raw.decode(self.encoding, errors='replace')
+                if len(self.raw) == SNIFF_BYTES:
+                    # Drop the last, possibly truncated, line
+                    text = text[:text.rfind('\n') + 1]
+                self._rows = [[cell.strip() for cell in row] for row in csv.reader(io.StringIO(text))]
+        return self._rows
+
+    def row(self, index: int) -> List[str]:
+        return self.rows[index] if index < len(self.rows) else []
+
+
+class BankFormat:
+    """
+    One bank export layout.
+
+    Args:
+        key: Unique format name, also used as the statement format by the ingestion pipeline
+        file_type: Upload file_type this layout belongs to ('TD', 'Amex', 'Scotiabank')
+        sniff: Returns True if a StatementSample looks like this layout
+        normalize: Converts a parsed DataFrame into the common ingestion frame
+        raw_model: Bank-specific model storing the raw rows
+        build_records: Builds raw_model instances from a normalized frame
+        source: Transaction.source value
+        read_options: Extra keyword arguments for pandas read_csv/read_excel
+        clean_columns: Fixes up column names of every parsed frame or chunk
+    """
+
+    def __init__(self, key: str, file_type: str, sniff: Callable[[StatementSample], bool],
+                 normalize: Callable, raw_model, build_records: Callable, source: str,
+                 read_options: Optional[dict] = None,
+                 clean_columns: Optional[Callable[[pd.DataFrame], pd.DataFrame]] = None):
+        self.key = key
+        self.file_type = file_type
+        self.sniff = sniff
+        self.normalize = normalize
+        self.raw_model = raw_model
+        self.build_records = build_records
+        self.source = source
+        self.read_options = read_options or {}
+        self.clean_columns = clean_columns
+
+    def _clean(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self.clean_columns(df) if self.clean_columns else df
+
+    def read(self, sample: StatementSample) -> pd.DataFrame:
+        """Parse the whole file."""
+        if sample.is_excel:
+            df = pd.read_excel(sample.file_path, **self.read_options)
+        else:
+            df = pd.read_csv(sample.file_path, encoding=sample.encoding, **self.read_options)
+        return self._clean(df)
+
+    def read_chunks(self, sample: StatementSample, chunk_size: int) -> Iterator[pd.DataFrame]:
+        """
+        Parse the file ``chunk_size`` rows at a time.
+
+        Workbooks cannot be read incrementally; they are read whole and handed out in slices.
+        """
+        if sample.is_excel:
+            df = self.read(sample)
+            for start in range(0, len(df), chunk_size):
+                yield df.iloc[start:start + chunk_size]
+            return
+
+        reader = pd.read_csv(sample.file_path, encoding=sample.encoding, chunksize=chunk_size, **self.read_options)
+        with reader:
+            for chunk in reader:
+                yield self._clean(chunk)
+
+
+class UnsupportedFileType(ValueError):
+    """Raised when an upload's file_type has no parser."""
+
+
+class UnrecognizedStatement(ValueError):
+    """Raised when a file matches none of the layouts registered for its file_type."""
+
+
+# key -> BankFormat, in registration order (detection tries them in this order)
+BANK_FORMATS: Dict[str, BankFormat] = {}
+
+
+def register_bank_format(bank_format: BankFormat) -> BankFormat:
+    """Add a layout to the registry. Register more specific layouts before generic ones."""
+    BANK_FORMATS[bank_format.key] = bank_format
+    return bank_format
+
+
+def detect_bank_format(file_path: str, file_type: Optional[str] = None) -> Tuple[BankFormat, StatementSample]:
+    """
+    Identify the layout of an uploaded export from its first few KB.
+
+    Args:
+        file_path: Stored upload
+        file_type: Restrict detection to this upload file_type; None or 'auto' tries every layout
+
+    Returns:
+        Tuple of (BankFormat, StatementSample); pass the sample on to BankFormat.read
+    """
+    if file_type in (None, '', 'auto'):
+        candidates = list(BANK_FORMATS.values())
+    else:
+        candidates = [fmt for fmt in BANK_FORMATS.values() if fmt.file_type == file_type]
+        if not candidates:
+            raise UnsupportedFileType(file_type)
+
+    sample = StatementSample(file_path)
+    for bank_format in candidates:
+        if bank_format.sniff(sample):
+            return bank_format, sample
+
+    raise UnrecognizedStatement(
+        f"File does not match any known {file_type + ' ' if file_type and file_type != 'auto' else ''}statement layout"
+    )
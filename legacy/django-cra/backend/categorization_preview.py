@@ -0,0 +1,152 @@
+"""
+Auto-categorization preview of a user's uncategorized transactions.
+
+The preview pages through the uncategorized transactions in id order. The
+ordered id list is read once per data version (one index-only query) and
+cached, so any page or keyset cursor maps to an id range without OFFSET
+scans. Suggestions are evaluated in aligned blocks of PREVIEW_BLOCK_SIZE
+transactions: one keyset range query with the account joined, one
+similar-transaction prefetch and a pass of the compiled rule set over the
+block. Evaluated blocks are cached per (user, data version, rules version),
+so flipping pages or changing the threshold reuses them and only blocks
+nobody looked at yet are computed.
+"""
+
+from bisect import bisect_right
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+
+from .categorization_service import AutoCategorizationService
+from .models import Transaction
+from .response_cache import CACHE_SECONDS, user_cache_key
+from .rule_engine import get_rules_version
+
+PREVIEW_BLOCK_SIZE = 500
+
+
+def _confidence_level(category, confidence: float) -> str:
+    if not category:
+        return 'none'
+    if confidence >= 0.8:
+        return 'high'
+    if confidence >= 0.5:
+        return 'medium'
+    return 'low'
+
+
+def uncategorized_ids(user) -> List[int]:
+    """Ids of the user's uncategorized transactions in ascending order, cached per data version."""
+    key = user_cache_key('preview_ids', user.id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            Transaction.objects.filter(user=user, category__isnull=True)
+            .order_by('id')
+            .values_list('id', flat=True)
+        )
+        cache.set(key, ids, CACHE_SECONDS)
+    return ids
+
+
+def evaluate_block(user, first_id: int, last_id: int, service: AutoCategorizationService) -> Dict[int, dict]:
+    """Suggestions for the user's uncategorized transactions with ids in [first_id, last_id]."""
+    transactions = list(
+        Transaction.objects.filter(user=user, category__isnull=True, id__gte=first_id, id__lte=last_id)
+        .select_related('account')
+        .order_by('id')
+    )
+    service.similar.prefetch(transactions)
+
+    preview = {}
+    for transaction in transactions:
+        # A preview applies nothing, so rule usage is not recorded
+        category, confidence = service.categorize_transaction(transaction, usage_log=[])
+        preview[transaction.id] = {
+            'transaction_id': transaction.id,
+            'description': transaction.description,
+            'amount': float(transaction.amount),
+            'date': transaction.date.isoformat(),
+            'account_name': transaction.account.name if transaction.account else 'Unknown',
+            'suggested_category': {
+                'id': category.id,
+                'name': category.name
+            } if category else None,
+            'confidence': round(confidence, 3) if category else 0,
+            'reason': 'Auto-match' if category and confidence < 0.9 else 'User rule' if category and confidence >= 0.9 else 'No suggestion',
+            'confidence_level': _confidence_level(category, confidence)
+        }
+    return preview
+
+
+def preview_page(user, page: int = 1, page_size: int = 20, after: Optional[int] = None) -> dict:
+    """
+    One page of the auto-categorization preview.
+
+    Args:
+        user: Owner of the transactions
+        page: 1-based page number (ignored when ``after`` is given)
+        page_size: Transactions per page
+        after: Keyset cursor; the page starts after this transaction id
+
+    Returns:
+        Dict with preview_data (sorted by confidence, highest first),
+        page_stats and pagination
+    """
+    ids = uncategorized_ids(user)
+    start = bisect_right(ids, after) if after is not None else (page - 1) * page_size
+    page_ids = ids[start:start + page_size]
+
+    service = None
+    rules_version = get_rules_version(user.id)
+    preview = {}
+    # A page past the end (e.g. after applying the last page) has no blocks to evaluate
+    last_block = (start + len(page_ids) - 1) // PREVIEW_BLOCK_SIZE if page_ids else -1
+    for block in range(start // PREVIEW_BLOCK_SIZE, last_block + 1):
+        block_ids = ids[block * PREVIEW_BLOCK_SIZE:(block + 1) * PREVIEW_BLOCK_SIZE]
+        key = user_cache_key('preview_block', user.id, rules_version, block_ids[0], block_ids[-1])
+        evaluated = cache.get(key)
+        if evaluated is None:
+            service = service or AutoCategorizationService()
+            evaluated = evaluate_block(user, block_ids[0], block_ids[-1], service)
+            cache.set(key, evaluated, CACHE_SECONDS)
+        preview.update(evaluated)
+
+    preview_data = [preview[transaction_id] for transaction_id in page_ids if transaction_id in preview]
+
+    page_stats = {
+        'total_processed': len(preview_data),
+        'high_confidence': 0,
+        'medium_confidence': 0,
+        'low_confidence': 0,
+        'no_suggestion': 0,
+        'user_rules_applied': 0
+    }
+    for item in preview_data:
+        if item['suggested_category'] is None:
+            page_stats['no_suggestion'] += 1
+        elif item['reason'] == 'User rule':
+            page_stats['user_rules_applied'] += 1
+        else:
+            page_stats[f"{item['confidence_level']}_confidence"] += 1
+
+    # Sort by confidence (highest first)
+    preview_data.sort(key=lambda x: x['confidence'], reverse=True)
+
+    total_count = len(ids)
+    total_pages = (total_count + page_size - 1) // page_size
+    current_page = start // page_size + 1
+    has_next = start + page_size < total_count
+    return {
+        'preview_data': preview_data,
+        'page_stats': page_stats,
+        'pagination': {
+            'current_page': current_page,
+            'total_pages': total_pages,
+            'page_size': page_size,
+            'total_count': total_count,
+            'has_next': has_next,
+            'has_previous': start > 0,
+            'next_cursor': page_ids[-1] if has_next and page_ids else None
+        }
+    }
@@ -1,17 +1,27 @@
-import re
-import json
 from decimal import Decimal
-from datetime import datetime
+from django.db.models import F
+from django.utils import timezone
 from typing import Optional, Tuple, List, Dict
 from .models import Transaction, Category, CategorizationRule
+from .aho_corasick import AhoCorasick
+from .rollups import refresh_spending_rollup
+from .rule_engine import CompiledRule, CompiledRuleSet, PreparedTransaction, extract_merchant_name, get_compiled_rule_set
+from .category_classifier import get_classifier
+from .merchants import similarity_key
+from .similar_transactions import SimilarTransactionIndex
 
 class AutoCategorizationService:
     """
     Service for automatically categorizing transactions based on rules and patterns.
     """
     
+    _default_automaton = None  # Built on first use from the default rules
+    
     def __init__(self):
         self.default_rules = self._get_default_rules()
+        self._rule_sets = {}  # user_id -> CompiledRuleSet
+        self._default_categories = {}  # user_id -> {'root': {name: Category}, 'sub': {name: Category}}
+        self.similar = SimilarTransactionIndex()
     
     def _get_default_rules(self) -> Dict[str, List[str]]:
         """
@@ -104,7 +114,7 @@ class AutoCategorizationService:
             ]
         }
     
-    def categorize_transaction(self, transaction: Transaction) -> Tuple[Optional[Category], float]:
+    def categorize_transaction(self, transaction: Transaction, usage_log: Optional[List] = None) -> Tuple[Optional[Category], float]:
         """
         Categorize a single transaction and return the category and confidence score.
         
@@ -113,6 +123,11 @@ class AutoCategorizationService:
         2. Default auto-categorization rules (fallback)
         3. Recurring pattern detection (last resort)
         
+        Args:
+            transaction: Transaction to categorize
+            usage_log: Optional list collecting (rule, transaction) pairs for user rule
+                matches instead of writing RuleUsage records immediately (used by bulk runs)
+        
         Returns:
             Tuple of (Category or None, confidence_score)
         """
@@ -122,7 +137,7 @@ class AutoCategorizationService:
         
         # STEP 1: Check user-created rules first (ABSOLUTE PRIORITY)
         # User rules completely override auto-categorization
-        user_rule_category, user_rule_confidence = self._check_user_rules(transaction)
+        user_rule_category, user_rule_confidence = self._check_user_rules(transaction, usage_log)
         if user_rule_category:
             return user_rule_category, user_rule_confidence
         
@@ -130,7 +145,7 @@ class AutoCategorizationService:
         description = transaction.description.upper()
         amount = abs(float(transaction.amount))
         
-        default_category, default_confidence = self._check_default_rules(description, amount)
+        default_category, default_confidence = self._check_default_rules(description, amount, transaction.user_id)
         if default_category:
             return default_category, default_confidence
         
@@ -141,7 +156,7 @@ class AutoCategorizationService:
         
         return None, 0.0
     
-    def _check_user_rules(self, transaction: Transaction) -> Tuple[Optional[Category], float]:
+    def _check_user_rules(self, transaction: Transaction, usage_log: Optional[List] = None) -> Tuple[Optional[Category], float]:
         """
         Check against user-defined categorization rules.
         
@@ -151,217 +166,60 @@ class AutoCategorizationService:
         """
         from .models import RuleUsage
         
-        # Get all active user rules, ordered by priority (highest first)
-        rules = CategorizationRule.objects.filter(is_active=True).order_by('-priority')
-        
-        for rule in rules:
-            if self._rule_matches(transaction, rule):
-                # Only suggest subcategories (categories with a parent)
-                if rule.category.parent is not None:
-                    # Record rule usage for analytics
-                    RuleUsage.objects.create(
-                        rule=rule,
-                        transaction=transaction,
-                        confidence_score=0.95,  # Very high confidence for user rules
-                        was_applied=True
-                    )
-                    
-                    # Update rule statistics
-                    rule.increment_match_count()
-                    
-                    # Return immediately - user rules have absolute priority
-                    return rule.category, 0.95  # Very high confidence for user rules
-                else:
-                    # If the rule points to a root category, skip it
-                    continue
+        # Rules are compiled once per user and reused while the user's rules are unchanged
+        rule_set = self.get_rule_set(transaction.user_id)
+        if not rule_set:
+            return None, 0.0
         
-        return None, 0.0
+        prepared = PreparedTransaction(transaction, is_recurring=self._is_recurring_payment)
+        compiled = rule_set.match(prepared)
+        if compiled is None:
+            return None, 0.0
+        
+        rule = compiled.rule
+        
+        if usage_log is not None:
+            # Bulk runs write usage records and rule statistics in batches
+            usage_log.append((rule, transaction))
+            return compiled.category, 0.95
+        
+        # Record rule usage for analytics
+        RuleUsage.objects.create(
+            rule=rule,
+            transaction=transaction,
+            confidence_score=0.95,  # Very high confidence for user rules
+            was_applied=True
+        )
+        
+        # Update rule statistics
+        rule.increment_match_count()
+        
+        # Return immediately - user rules have absolute priority
+        return compiled.category, 0.95  # Very high confidence for user rules
+    
+    def get_rule_set(self, user_id: int) -> CompiledRuleSet:
+        """
+        Get the compiled rule set for a user.
+        
+        The version stamp is checked once per user for the lifetime of this
+        service instance, so a bulk run issues a single rules query per user.
+        """
+        rule_set = self._rule_sets.get(user_id)
+        if rule_set is None:
+            rule_set = get_compiled_rule_set(user_id)
+            self._rule_sets[user_id] = rule_set
+        return rule_set
     
     def _rule_matches(self, transaction: Transaction, rule: CategorizationRule) -> bool:
         """Check if a transaction matches a specific rule."""
-        description = transaction.description
-        amount = abs(float(transaction.amount))
-        
-        # Apply case sensitivity
-        if rule.case_sensitive:
-            search_description = description
-            search_pattern = rule.pattern
-        else:
-            search_description = description.upper()
-            search_pattern = rule.pattern.upper()
-        
-        if rule.rule_type == 'keyword':
-            keywords = [k.strip() for k in rule.pattern.split(',')]
-            if not rule.case_sensitive:
-                keywords = [k.upper() for k in keywords]
-            return any(keyword in search_description for keyword in keywords)
-        
-        elif rule.rule_type == 'contains':
-            return search_pattern in search_description
-        
-        elif rule.rule_type == 'exact':
-            return search_description == search_pattern
-        
-        elif rule.rule_type == 'regex':
-            try:
-                flags = 0 if rule.case_sensitive else re.IGNORECASE
-                return bool(re.search(rule.pattern, description, flags))
-            except re.error:
-                return False
-        
-        elif rule.rule_type == 'amount_range':
-            try:
-                range_data = json.loads(rule.pattern)
-                min_amount = range_data.get('min', 0)
-                max_amount = range_data.get('max', float('inf'))
-                return min_amount <= amount <= max_amount
-            except (json.JSONDecodeError, KeyError):
-                return False
-        
-        elif rule.rule_type == 'amount_exact':
-            try:
-                target_amount = float(rule.pattern)
-                return abs(amount - target_amount) < 0.01  # Allow for small floating point differences
-            except ValueError:
-                return False
-        
-        elif rule.rule_type == 'amount_greater':
-            try:
-                min_amount = float(rule.pattern)
-                return amount > min_amount
-            except ValueError:
-                return False
-        
-        elif rule.rule_type == 'amount_less':
-            try:
-                max_amount = float(rule.pattern)
-                return amount < max_amount
-            except ValueError:
-                return False
-        
-        elif rule.rule_type == 'merchant':
-            # Extract merchant name from description (simplified)
-            merchant_name = self._extract_merchant_name(description)
-            if not rule.case_sensitive:
-                merchant_name = merchant_name.upper()
-                search_pattern = rule.pattern.upper()
-            return search_pattern in merchant_name
-        
-        elif rule.rule_type == 'date_range':
-            try:
-                range_data = json.loads(rule.pattern)
-                start_date = datetime.strptime(range_data.get('start', ''), '%Y-%m-%d').date()
-                end_date = datetime.strptime(range_data.get('end', ''), '%Y-%m-%d').date()
-                return start_date <= transaction.date <= end_date
-            except (json.JSONDecodeError, KeyError, ValueError):
-                return False
-        
-        elif rule.rule_type == 'day_of_week':
-            try:
-                target_days = [int(d) for d in rule.pattern.split(',')]  # 0=Monday, 6=Sunday
-                return transaction.date.weekday() in target_days
-            except (ValueError, AttributeError):
-                return False
-        
-        elif rule.rule_type == 'recurring':
-            return self._is_recurring_payment(transaction)
-        
-        elif rule.rule_type == 'combined':
-            return self._evaluate_combined_rule(transaction, rule)
-        
-        return False
+        prepared = PreparedTransaction(transaction, is_recurring=self._is_recurring_payment)
+        return CompiledRule(rule).matches(prepared)
     
     def _extract_merchant_name(self, description: str) -> str:
         """Extract merchant name from transaction description."""
-        # Simple merchant extraction - remove common prefixes/suffixes
-        merchant = description.strip()
-        
-        # Remove common prefixes
-        prefixes_to_remove = [
-            'POS ', 'DEBIT ', 'CREDIT ', 'PURCHASE ', 'PAYMENT ',
-            'TRANSFER ', 'WITHDRAWAL ', 'DEPOSIT ', 'ATM '
-        ]
-        
-        for prefix in prefixes_to_remove:
-            if merchant.upper().startswith(prefix):
-                merchant = merchant[len(prefix):].strip()
-                break
-        
-        # Remove common suffixes
-        suffixes_to_remove = [
-            ' #', ' REF:', ' AUTH:', ' ID:', ' TID:',
-            ' TERM:', ' SEQ:', ' BATCH:'
-        ]
-        
-        for suffix in suffixes_to_remove:
-            if suffix in merchant.upper():
-                merchant = merchant[:merchant.upper().find(suffix)].strip()
-                break
-        
-        return merchant
+        return extract_merchant_name(description)
     
-    def _evaluate_combined_rule(self, transaction: Transaction, rule: CategorizationRule) -> bool:
-        """Evaluate a combined rule with multiple conditions."""
-        conditions = rule.conditions or {}
-        operator = conditions.get('operator', 'AND')  # AND or OR
-        
-        # Get individual condition results
-        results = []
-        
-        # Description conditions
-        if 'description_contains' in conditions:
-            search_text = conditions['description_contains']
-            if not rule.case_sensitive:
-                search_text = search_text.upper()
-                description = transaction.description.upper()
-            else:
-                description = transaction.description
-            results.append(search_text in description)
-        
-        if 'description_regex' in conditions:
-            try:
-                flags = 0 if rule.case_sensitive else re.IGNORECASE
-                results.append(bool(re.search(conditions['description_regex'], transaction.description, flags)))
-            except re.error:
-                results.append(False)
-        
-        # Amount conditions
-        amount = abs(float(transaction.amount))
-        if 'amount_min' in conditions:
-            results.append(amount >= float(conditions['amount_min']))
-        
-        if 'amount_max' in conditions:
-            results.append(amount <= float(conditions['amount_max']))
-        
-        if 'amount_exact' in conditions:
-            target_amount = float(conditions['amount_exact'])
-            results.append(abs(amount - target_amount) < 0.01)
-        
-        # Date conditions
-        if 'date_after' in conditions:
-            try:
-                after_date = datetime.strptime(conditions['date_after'], '%Y-%m-%d').date()
-                results.append(transaction.date >= after_date)
-            except ValueError:
-                results.append(False)
-        
-        if 'date_before' in conditions:
-            try:
-                before_date = datetime.strptime(conditions['date_before'], '%Y-%m-%d').date()
-                results.append(transaction.date <= before_date)
-            except ValueError:
-                results.append(False)
-        
-        # Evaluate results based on operator
-        if not results:
-            return False
-        
-        if operator.upper() == 'OR':
-            return any(results)
-        else:  # AND
-            return all(results)
-    
-    def _check_default_rules(self, description: str, amount: float) -> Tuple[Optional[Category], float]:
+    def _check_default_rules(self, description: str, amount: float, user_id: int) -> Tuple[Optional[Category], float]:
         """Check against default categorization rules."""
         
         # Map default rule categories to their corresponding subcategories
@@ -384,82 +242,120 @@ class AutoCategorizationService:
             'Vaping': 'Vaping'
         }
         
-        for category_name, keywords in self.default_rules.items():
-            for keyword in keywords:
-                if keyword in description:
-                    try:
-                        # Get the mapped subcategory name
-                        subcategory_name = category_mapping.get(category_name, category_name)
-                        
-                        # Find the subcategory (category with a parent)
-                        category = Category.objects.get(name=subcategory_name, parent__isnull=False)
-                        confidence = 0.8  # Good confidence for default rules
-                        
-                        # Boost confidence for exact merchant matches
-                        if any(merchant in description for merchant in keywords[:5]):  # Top 5 merchants
-                            confidence = 0.85
-                        
-                        return category, confidence
-                    except Category.DoesNotExist:
-                        # If subcategory doesn't exist, try to find the root category and create a subcategory
-                        try:
-                            root_category = Category.objects.get(name=category_name, parent__isnull=True)
-                            # Create the subcategory under the root category
-                            category = Category.objects.create(
-                                name=subcategory_name,
-                                parent=root_category
-                            )
-                            return category, 0.8
-                        except Category.DoesNotExist:
-                            # If neither root nor subcategory exists, skip this rule
-                            continue
+        # One linear pass over the description yields every keyword hit, recorded
+        # as the lowest matching keyword index per default category
+        hits = {}
+        for _, _, (category_index, keyword_index) in self._get_default_automaton().iter_matches(description):
+            if category_index not in hits or keyword_index < hits[category_index]:
+                hits[category_index] = keyword_index
+        
+        category_names = list(self.default_rules)
+        
+        # First matching category (in dictionary order) wins
+        for category_index in sorted(hits):
+            category_name = category_names[category_index]
+            subcategory_name = category_mapping.get(category_name, category_name)
+            
+            category, created = self._resolve_default_category(user_id, category_name, subcategory_name)
+            if category is None:
+                # If neither root nor subcategory exists, skip this rule
+                continue
+            if created:
+                return category, 0.8
+            
+            confidence = 0.8  # Good confidence for default rules
+            
+            # Boost confidence for exact merchant matches
+            if hits[category_index] < 5:  # Top 5 merchants
+                confidence = 0.85
+            
+            return category, confidence
         
         return None, 0.0
     
+    def _get_default_automaton(self) -> AhoCorasick:
+        """Compile the default merchant dictionary into one automaton, shared by all instances."""
+        automaton = AutoCategorizationService._default_automaton
+        if automaton is None:
+            automaton = AhoCorasick()
+            for category_index, keywords in enumerate(self.default_rules.values()):
+                for keyword_index, keyword in enumerate(keywords):
+                    automaton.add(keyword, (category_index, keyword_index))
+            automaton.build()
+            AutoCategorizationService._default_automaton = automaton
+        return automaton
+    
+    def _resolve_default_category(self, user_id: int, category_name: str, subcategory_name: str) -> Tuple[Optional[Category], bool]:
+        """
+        Find the user's subcategory for a default rule, creating it under the
+        matching root category if needed.
+        
+        The user's categories are loaded in one query and cached for the
+        lifetime of this service instance.
+        
+        Returns:
+            Tuple of (Category or None, created)
+        """
+        categories = self._default_categories.get(user_id)
+        if categories is None:
+            categories = {'root': {}, 'sub': {}}
+            for category in Category.objects.filter(user_id=user_id).order_by('id'):
+                level = 'root' if category.parent_id is None else 'sub'
+                categories[level].setdefault(category.name, category)
+            self._default_categories[user_id] = categories
+        
+        category = categories['sub'].get(subcategory_name)
+        if category is not None:
+            return category, False
+        
+        root_category = categories['root'].get(category_name)
+        if root_category is None:
+            return None, False
+        
+        # Create the subcategory under the root category
+        category = Category.objects.create(
+            user_id=user_id,
+            name=subcategory_name,
+            parent=root_category
+        )
+        categories['sub'][subcategory_name] = category
+        return category, True
+    
     def _check_recurring_patterns(self, transaction: Transaction) -> Tuple[Optional[Category], float]:
         """Check for recurring payment patterns. Only suggests subcategories."""
-        # Look for similar transactions in the past
-        similar_transactions = Transaction.objects.filter(
-            description__icontains=transaction.description[:20],  # First 20 chars
-            account=transaction.account,
-            category__isnull=False
-        ).exclude(id=transaction.id)[:5]
-        
-        if similar_transactions.exists():
-            # Get the most common category from similar transactions
-            categories = [t.category for t in similar_transactions if t.category]
-            if categories:
-                most_common_category = max(set(categories), key=categories.count)
-                # Only suggest subcategories (categories with a parent)
-                if most_common_category.parent is not None:
-                    confidence = len([c for c in categories if c == most_common_category]) / len(categories)
-                    return most_common_category, min(confidence * 0.7, 0.75)  # Lower confidence for pattern matching
+        # Categories of similar transactions in the same account, most common first
+        category_counts = self.similar.category_counts(transaction, same_account=True)
+        if category_counts:
+            most_common_category, count = category_counts[0]
+            # Only suggest subcategories (categories with a parent)
+            if most_common_category.parent_id is not None:
+                confidence = count / sum(n for _, n in category_counts)
+                return most_common_category, min(confidence * 0.7, 0.75)  # Lower confidence for pattern matching
         
         return None, 0.0
     
     def _is_recurring_payment(self, transaction: Transaction) -> bool:
         """Check if a transaction appears to be a recurring payment."""
-        # Simplified check for recurring payments
-        amount = abs(float(transaction.amount))
-        
-        # Look for transactions with same amount and similar description
-        similar_count = Transaction.objects.filter(
-            amount=transaction.amount,
-            description__icontains=transaction.description[:15],
-            account=transaction.account
-        ).exclude(id=transaction.id).count()
-        
+        # Transactions with the same amount and similarity key in the same account
+        similar_count = self.similar.count_similar(transaction, same_account=True, same_amount=True)
         return similar_count >= 2  # At least 2 other similar transactions
     
-    def bulk_categorize_transactions(self, queryset=None, confidence_threshold=0.6) -> Dict[str, int]:
+    def bulk_categorize_transactions(self, queryset=None, confidence_threshold=0.6, chunk_size=2000) -> Dict[str, int]:
         """
         Categorize multiple transactions in bulk.
         
         User rules have ABSOLUTE PRIORITY and will override auto-categorization.
         
+        Transactions are read in pk-ordered chunks and evaluated in memory;
+        each chunk is written back with a single bulk_update, rule usage records
+        are inserted with bulk_create and rule match counts are updated once per rule. The
+        similar transactions of each chunk are loaded with one query. The
+        spending rollup is refreshed once for all recategorized months.
+        
         Args:
             queryset: QuerySet of transactions to categorize (defaults to uncategorized)
             confidence_threshold: Minimum confidence score to auto-assign category
+            chunk_size: Number of transactions fetched and written per batch
         
         Returns:
             Dictionary with categorization statistics
@@ -475,17 +371,24 @@ class AutoCategorizationService:
             'no_match': 0
         }
         
-        for transaction in queryset:
+        batch = []
+        usage_log = []
+        rule_match_counts = {}  # rule_id -> matches across the whole run
+        recategorized_slices = set()  # Spending rollup slices whose category totals changed
+        
+        for transaction in self._iter_with_neighbours(queryset, chunk_size):
             stats['total_processed'] += 1
             
-            category, confidence = self.categorize_transaction(transaction)
+            category, confidence = self.categorize_transaction(transaction, usage_log)
             
             if category and confidence >= confidence_threshold:
+                if transaction.category_id != category.id:
+                    recategorized_slices.add((transaction.user_id, transaction.account_id, transaction.date.replace(day=1)))
                 transaction.category = category
                 transaction.auto_categorized = True
                 transaction.confidence_score = confidence
                 transaction.suggested_category = None  # Clear suggestion since it's now categorized
-                transaction.save()
+                batch.append(transaction)
                 
                 # Track if this was categorized by user rule or auto-categorization
                 if confidence >= 0.9:  # User rules have very high confidence
@@ -496,7 +399,7 @@ class AutoCategorizationService:
             elif category and confidence > 0.3:  # Low confidence but some match
                 transaction.confidence_score = confidence
                 transaction.suggested_category = category  # Store the suggestion
-                transaction.save()
+                batch.append(transaction)
                 stats['needs_review'] += 1
             
             else:
@@ -504,51 +407,137 @@ class AutoCategorizationService:
                 if category:
                     transaction.suggested_category = category
                     transaction.confidence_score = confidence
-                    transaction.save()
+                    batch.append(transaction)
                 stats['no_match'] += 1
+            
+            if len(batch) >= chunk_size:
+                self._write_categorization_batch(batch, usage_log, rule_match_counts)
+                batch, usage_log = [], []
+        
+        self._write_categorization_batch(batch, usage_log, rule_match_counts)
+        self._update_rule_match_counts(rule_match_counts)
+        refresh_spending_rollup(recategorized_slices)
         
         return stats
     
+    def _iter_with_neighbours(self, queryset, chunk_size: int):
+        """
+        Iterate a queryset in pk order, loading the similar transactions of
+        each chunk with one query before yielding it.
+        
+        Each chunk is its own keyset query (pk greater than the last one seen)
+        instead of a server-side cursor, so callers can write the rows back
+        between chunks without the open cursor skipping or repeating rows.
+        """
+        last_pk = None
+        while True:
+            page = queryset.order_by('pk')
+            if last_pk is not None:
+                page = page.filter(pk__gt=last_pk)
+            chunk = list(page[:chunk_size])
+            if not chunk:
+                return
+            last_pk = chunk[-1].pk
+            # Reload per chunk so categories written for earlier chunks are seen
+            self.similar.clear()
+            self.similar.prefetch(chunk)
+            yield from chunk
+    
+    def _write_categorization_batch(self, batch: List[Transaction], usage_log: List, rule_match_counts: Dict[int, int]) -> None:
+        """Write one chunk of categorization results and its rule usage records."""
+        from .models import RuleUsage
+        
+        if batch:
+            Transaction.objects.bulk_update(
+                batch,
+                ['category', 'auto_categorized', 'confidence_score', 'suggested_category'],
+                batch_size=len(batch)
+            )
+        
+        if usage_log:
+            RuleUsage.objects.bulk_create([
+                RuleUsage(
+                    rule=rule,
+                    transaction=transaction,
+                    confidence_score=0.95,  # Very high confidence for user rules
+                    was_applied=True
+                )
+                for rule, transaction in usage_log
+            ])
+            for rule, _ in usage_log:
+                rule_match_counts[rule.id] = rule_match_counts.get(rule.id, 0) + 1
+    
+    def _update_rule_match_counts(self, rule_match_counts: Dict[int, int]) -> None:
+        """Apply aggregated match statistics with one UPDATE per matched rule."""
+        now = timezone.now()
+        for rule_id, count in rule_match_counts.items():
+            CategorizationRule.objects.filter(id=rule_id).update(
+                match_count=F('match_count') + count,
+                last_matched=now
+            )
+    
     def get_categorization_suggestions(self, transaction: Transaction, limit=3) -> List[Dict]:
         """
         Get categorization suggestions for a transaction with confidence scores.
         Only suggests subcategories, not root categories.
         """
-        suggestions = []
-        
-        # Get primary suggestion
-        category, confidence = self.categorize_transaction(transaction)
-        if category and category.parent is not None:  # Only suggest subcategories
-            suggestions.append({
-                'category': category,
-                'confidence': confidence,
-                'reason': 'Auto-match'
-            })
-        
-        # Get alternative suggestions from similar transactions
-        similar_transactions = Transaction.objects.filter(
-            description__icontains=transaction.description[:10],
-            category__isnull=False
-        ).exclude(id=transaction.id)[:10]
-        
-        category_counts = {}
-        for t in similar_transactions:
-            if t.category and t.category.parent is not None:  # Only count subcategories
-                category_counts[t.category] = category_counts.get(t.category, 0) + 1
-        
-        # Sort by frequency and add to suggestions
-        for cat, count in sorted(category_counts.items(), key=lambda x: x[1], reverse=True):
-            if cat not in [s['category'] for s in suggestions]:
-                confidence = min(count / len(similar_transactions) * 0.6, 0.7)
+        return self.get_batch_categorization_suggestions([transaction], limit)[0]
+    
+    def get_batch_categorization_suggestions(self, transactions: List[Transaction], limit=3) -> List[List[Dict]]:
+        """
+        Get categorization suggestions for several transactions (e.g. a page) at once.
+        
+        The primary suggestion comes from categorize_transaction; alternatives
+        come from the user's in-memory category classifier. Similar transactions
+        and suggested categories are loaded once for the whole batch. Looking up
+        suggestions records no rule usage.
+        
+        Returns:
+            One list of suggestions per transaction, in input order
+        """
+        self.similar.prefetch(transactions)
+        
+        # Primary suggestions, then classifier votes for every transaction
+        primaries = []
+        votes = []
+        classifiers = {}
+        for transaction in transactions:
+            primaries.append(self.categorize_transaction(transaction, usage_log=[]))
+            classifier = classifiers.get(transaction.user_id)
+            if classifier is None:
+                classifier = classifiers[transaction.user_id] = get_classifier(transaction.user_id)
+            votes.append(classifier.score(transaction.similarity_key or similarity_key(transaction.description)))
+        
+        categories = Category.objects.in_bulk({category_id for scores in votes for category_id, _, _ in scores})
+        
+        results = []
+        for (category, confidence), scores in zip(primaries, votes):
+            suggestions = []
+            if category and category.parent_id is not None:  # Only suggest subcategories
                 suggestions.append({
-                    'category': cat,
+                    'category': category,
                     'confidence': confidence,
-                    'reason': f'Similar transactions ({count} matches)'
+                    'reason': 'Auto-match'
                 })
+            
+            # Most likely first; only subcategories are suggested
+            for category_id, probability, matches in scores:
+                if probability < 0.05:  # The rest are even less likely
+                    break
+                cat = categories.get(category_id)
+                if cat is None or cat.parent_id is None or cat in [s['category'] for s in suggestions]:
+                    continue
+                suggestions.append({
+                    'category': cat,
+                    'confidence': min(probability * 0.6, 0.7),
+                    'reason': f'Similar transactions ({matches} matches)' if matches else 'Similar descriptions'
+                })
+            
+            results.append(suggestions[:limit])
         
-        return suggestions[:limit]
+        return results
     
-    def update_suggestions_for_uncategorized(self) -> Dict[str, int]:
+    def update_suggestions_for_uncategorized(self, chunk_size=2000) -> Dict[str, int]:
         """
         Update suggested categories for all uncategorized transactions.
         This is useful for refreshing suggestions without changing existing categorizations.
@@ -561,17 +550,28 @@ class AutoCategorizationService:
             'no_suggestion': 0
         }
         
-        for transaction in uncategorized:
+        batch = []
+        usage_log = []
+        rule_match_counts = {}
+        
+        for transaction in self._iter_with_neighbours(uncategorized, chunk_size):
             stats['total_processed'] += 1
             
-            category, confidence = self.categorize_transaction(transaction)
+            category, confidence = self.categorize_transaction(transaction, usage_log)
             
             if category:
                 transaction.suggested_category = category
                 transaction.confidence_score = confidence
-                transaction.save()
+                batch.append(transaction)
                 stats['suggestions_updated'] += 1
             else:
                 stats['no_suggestion'] += 1
+            
+            if len(batch) >= chunk_size:
+                self._write_categorization_batch(batch, usage_log, rule_match_counts)
+                batch, usage_log = [], []
+        
+        self._write_categorization_batch(batch, usage_log, rule_match_counts)
+        self._update_rule_match_counts(rule_match_counts)
         
         return stats 
\ No newline at end of file
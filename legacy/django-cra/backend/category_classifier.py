@@ -0,0 +1,178 @@
+"""
+Per-user naive Bayes classifier suggesting categories from descriptions.
+
+The model is a token -> category frequency table built from the user's
+categorized transactions. Tokens are the words of Transaction.similarity_key
+plus the whole key, so transactions of the same merchant vote for their
+category directly while shared words ("PHARMACY", "GAS") still count for
+merchants never categorized before. Building it is one aggregated query over
+(similarity_key, category); scoring a transaction only touches the tables of
+its own few tokens.
+
+Models live in process memory and are stamped with the user's data version
+(see response_cache). A model whose version is outdated is rebuilt on next
+use; categorization views call record_categorization so their own changes
+are applied to the model instead of forcing a rebuild. A published model is
+never modified: changes go to a copy that replaces it, so concurrent
+requests always score against a complete model.
+"""
+
+import math
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from django.db import transaction
+from django.db.models import Count
+
+from .models import Transaction
+from .response_cache import get_data_version
+
+SMOOTHING = 1.0
+
+_classifiers: Dict[int, 'CategoryClassifier'] = {}
+_lock = threading.Lock()
+
+
+def _features(key: str) -> List[str]:
+    # The whole key is prefixed so it never collides with a single word
+    return [*dict.fromkeys(key.split()), f'={key}']
+
+
+class CategoryClassifier:
+    """Multinomial naive Bayes over similarity-key tokens, with Laplace smoothing."""
+
+    def __init__(self, version: int):
+        self.version = version
+        self.token_counts = defaultdict(lambda: defaultdict(int))  # token -> category_id -> occurrences
+        self.category_tokens = defaultdict(int)  # category_id -> token occurrences
+        self.category_counts = defaultdict(int)  # category_id -> transactions
+        self.total = 0
+
+    def copy(self) -> 'CategoryClassifier':
+        """Independent copy of the model, to change without affecting readers of this one."""
+        clone = CategoryClassifier(self.version)
+        for token, counts in self.token_counts.items():
+            clone.token_counts[token] = defaultdict(int, counts)
+        clone.category_tokens = defaultdict(int, self.category_tokens)
+        clone.category_counts = defaultdict(int, self.category_counts)
+        clone.total = self.total
+        return clone
+
+    def update(self, key: str, category_id: int, count: int = 1) -> None:
+        """Add ``count`` transactions with this key to a category (negative to remove them)."""
+        if not key or category_id is None or not count:
+            return
+        features = _features(key)
+        for feature in features:
+            counts = self.token_counts[feature]
+            counts[category_id] += count
+            if counts[category_id] <= 0:
+                del counts[category_id]
+                if not counts:
+                    del self.token_counts[feature]
+        self.category_tokens[category_id] += count * len(features)
+        self.category_counts[category_id] += count
+        if self.category_counts[category_id] <= 0:
+            del self.category_counts[category_id]
+            del self.category_tokens[category_id]
+        self.total += count
+
+    def score(self, key: str) -> List[Tuple[int, float, int]]:
+        """
+        Rank the categories of transactions sharing a token with ``key``.
+
+        Returns:
+            (category_id, probability, same-key votes) tuples, most likely first;
+            probabilities are normalized over the returned categories
+        """
+        if not key:
+            return []
+        features = [feature for feature in _features(key) if feature in self.token_counts]
+        candidates = {category_id for feature in features for category_id in self.token_counts[feature]}
+        if not candidates:
+            return []
+
+        vocabulary = len(self.token_counts)
+        prior_total = self.total + SMOOTHING * len(self.category_counts)
+        log_scores = {}
+        for category_id in candidates:
+            denominator = self.category_tokens[category_id] + SMOOTHING * vocabulary
+            log_score = math.log((self.category_counts[category_id] + SMOOTHING) / prior_total)
+            for feature in features:
+                log_score += math.log((self.token_counts[feature].get(category_id, 0) + SMOOTHING) / denominator)
+            log_scores[category_id] = log_score
+
+        best = max(log_scores.values())
+        weights = {category_id: math.exp(log_score - best) for category_id, log_score in log_scores.items()}
+        total_weight = sum(weights.values())
+        exact = self.token_counts.get(f'={key}', {})
+        return sorted(
+            ((category_id, weight / total_weight, exact.get(category_id, 0)) for category_id, weight in weights.items()),
+            key=lambda item: (-item[1], item[0])
+        )
+
+
+def build_classifier(user_id: int, version: int) -> CategoryClassifier:
+    """Train a classifier on the user's categorized transactions with one aggregated query."""
+    classifier = CategoryClassifier(version)
+    rows = (
+        Transaction.objects.filter(user_id=user_id, category__isnull=False)
+        .exclude(similarity_key='')
+        .values('similarity_key', 'category_id')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('similarity_key', 'category_id', 'count')
+    )
+    for key, category_id, count in rows:
+        classifier.update(key, category_id, count)
+    return classifier
+
+
+def get_classifier(user_id: int) -> CategoryClassifier:
+    """The user's classifier, rebuilt when their data changed since it was trained."""
+    version = get_data_version(user_id)
+    classifier = _classifiers.get(user_id)
+    if classifier is None or classifier.version != version:
+        classifier = build_classifier(user_id, version)
+        with _lock:
+            _classifiers[user_id] = classifier
+    return classifier
+
+
+def clear_classifiers() -> None:
+    """Forget every loaded classifier (e.g. after the database was replaced)."""
+    with _lock:
+        _classifiers.clear()
+
+
+def record_categorization(user_id: int, changes: Iterable[Tuple[str, int, int, int]]) -> None:
+    """
+    Apply category changes made by the caller to the user's loaded classifier.
+
+    Args:
+        changes: (similarity_key, old_category_id, new_category_id, count) tuples
+
+    Call after refresh_spending_rollup has announced the change, so the model
+    is re-stamped with the data version that includes it. If any other change
+    bumped the version in between, the model is left outdated and rebuilt.
+    """
+    with _lock:
+        current = _classifiers.get(user_id)
+        if current is None:
+            return
+        # Requests may be scoring with the current model, so the changes go to a copy
+        classifier = current.copy()
+        version = classifier.version
+        for key, old_category_id, new_category_id, count in changes:
+            if old_category_id != new_category_id:
+                classifier.update(key, old_category_id, -count)
+                classifier.update(key, new_category_id, count)
+        _classifiers[user_id] = classifier
+
+    def restamp():
+        # Data versions grow by one per bump, so exactly one bump means ours
+        if get_data_version(user_id) == version + 1:
+            classifier.version = version + 1
+
+    transaction.on_commit(restamp)
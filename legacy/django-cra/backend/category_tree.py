@@ -0,0 +1,75 @@
+"""
+Category tree with per-node transaction counts.
+
+The tree is assembled in memory from one categories query and one grouped
+transaction count; each node's count covers its whole subtree and is rolled
+up from the leaves. The result is cached under the user's data version
+(see response_cache), so category changes and recategorization invalidate it.
+"""
+
+from typing import Dict, List, Optional
+
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Category, Transaction
+from .response_cache import CACHE_SECONDS, user_cache_key
+
+
+def build_category_tree(user) -> List[dict]:
+    """
+    Active categories as nested dicts shaped like CategoryTreeSerializer output.
+
+    Transaction counts include every descendant, inactive ones too, matching
+    Category.get_transaction_count.
+    """
+    categories = list(
+        Category.objects.filter(user=user)
+        .order_by('name')
+        .values('id', 'name', 'parent_id', 'description', 'color', 'is_active')
+    )
+    counts: Dict[Optional[int], int] = dict(
+        Transaction.objects.filter(user=user, category__isnull=False)
+        .values('category_id')
+        .annotate(count=Count('id'))
+        .order_by()
+        .values_list('category_id', 'count')
+    )
+
+    children: Dict[Optional[int], List[dict]] = {}
+    for category in categories:
+        children.setdefault(category['parent_id'], []).append(category)
+
+    def subtree_count(category: dict) -> int:
+        total = counts.get(category['id'], 0)
+        for child in children.get(category['id'], ()):
+            total += subtree_count(child)
+        category['transaction_count'] = total
+        return total
+
+    def node(category: dict) -> dict:
+        return {
+            'id': category['id'],
+            'name': category['name'],
+            'parent': category['parent_id'],
+            'description': category['description'],
+            'color': category['color'],
+            'is_active': category['is_active'],
+            'subcategories': [node(child) for child in children.get(category['id'], ()) if child['is_active']],
+            'transaction_count': category['transaction_count'],
+        }
+
+    roots = children.get(None, [])
+    for root in roots:
+        subtree_count(root)
+    return [node(root) for root in roots if root['is_active']]
+
+
+def cached_category_tree(user) -> List[dict]:
+    """Cached build_category_tree."""
+    key = user_cache_key('category_tree', user.id)
+    tree = cache.get(key)
+    if tree is None:
+        tree = build_category_tree(user)
+        cache.set(key, tree, CACHE_SECONDS)
+    return tree
@@ -0,0 +1,109 @@
+"""
+Database-specific text index over Transaction.description.
+
+SQLite gets an FTS5 table that mirrors the description column through
+triggers (an external-content index, so descriptions are not stored twice).
+PostgreSQL gets a pg_trgm GIN index on ``UPPER(description)``, which serves
+the ``UPPER(...) LIKE UPPER(...)`` queries Django emits for ``icontains``.
+
+SQLite drops triggers when Django rebuilds a table during a migration, so the
+index is re-checked after every ``migrate`` and rebuilt if it was incomplete.
+"""
+
+from django.db import DatabaseError, OperationalError, transaction
+
+FTS_TABLE = 'backend_transaction_fts'
+TRGM_INDEX = 'backend_transaction_description_trgm'
+
+_SQLITE_TRIGGERS = {
+    f'{FTS_TABLE}_ai': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON backend_transaction BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+        END""",
+    f'{FTS_TABLE}_ad': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON backend_transaction BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+        END""",
+    f'{FTS_TABLE}_au': f"""
+        CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF description ON backend_transaction BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description) VALUES ('delete', old.id, old.description);
+            INSERT INTO {FTS_TABLE}(rowid, description) VALUES (new.id, new.description);
+        END""",
+}
+
+
+def _sqlite_objects(cursor):
+    cursor.execute(
+        "SELECT name FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = 'backend_transaction')",
+        [FTS_TABLE],
+    )
+    return {row[0] for row in cursor.fetchall()}
+
+
+# connection alias -> whether the SQLite FTS table exists
+_fts_available = {}
+
+
+def install_description_index(connection) -> bool:
+    """
+    Create the description index for ``connection`` if any part of it is missing.
+
+    Returns False when the database cannot provide one (SQLite built without
+    FTS5, PostgreSQL without pg_trgm, other backends); searches then fall
+    back to plain ``icontains`` scans.
+    """
+    _fts_available.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            existing = _sqlite_objects(cursor)
+            if FTS_TABLE in existing and existing.issuperset(_SQLITE_TRIGGERS):
+                return True
+            try:
+                cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                    f"description, content='backend_transaction', content_rowid='id', "
+                    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+                )
+            except OperationalError:
+                return False
+            for sql in _SQLITE_TRIGGERS.values():
+                cursor.execute(sql)
+            # Rows written while the triggers were missing are only picked up by a rebuild
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+            return True
+
+        if connection.vendor == 'postgresql':
+            try:
+                # Savepoint: creating the extension needs privileges the database user may lack
+                with transaction.atomic(using=connection.alias):
+                    cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+                    cursor.execute(
+                        f"CREATE INDEX IF NOT EXISTS {TRGM_INDEX} ON backend_transaction "
+                        f"USING gin (UPPER(description) gin_trgm_ops)"
+                    )
+            except DatabaseError:
+                return False
+            return True
+
+    return False
+
+
+def drop_description_index(connection) -> None:
+    _fts_available.pop(connection.alias, None)
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for name in _SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif connection.vendor == 'postgresql':
+            cursor.execute(f"DROP INDEX IF EXISTS {TRGM_INDEX}")
+
+
+def has_fts_index(connection) -> bool:
+    """True if ``connection`` is SQLite with the FTS5 description table in place."""
+    if connection.vendor != 'sqlite':
+        return False
+    if connection.alias not in _fts_available:
+        with connection.cursor() as cursor:
+            _fts_available[connection.alias] = FTS_TABLE in _sqlite_objects(cursor)
+    return _fts_available[connection.alias]
@@ -0,0 +1,44 @@
+"""
+Transaction fingerprints for idempotent imports.
+
+A fingerprint identifies a transaction by its content: account, date,
+normalized description, amount and its ordinal among identical rows on the
+same day. Re-importing an overlapping statement yields the same fingerprints,
+so already-imported rows can be skipped with a set-membership check.
+"""
+
+import hashlib
+import re
+from datetime import date
+from decimal import Decimal, ROUND_HALF_UP
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_description(description: str) -> str:
+    """Uppercase and collapse whitespace so cosmetic differences don't change the fingerprint."""
+    return _WHITESPACE.sub(' ', str(description)).strip().upper()
+
+
+def transaction_fingerprint(account_id: int, transaction_date: date, description: str, amount, ordinal: int = 0) -> str:
+    """
+    SHA-256 hex digest of a transaction's identifying content.
+
+    Args:
+        account_id: Account the transaction belongs to
+        transaction_date: Transaction date
+        description: Raw or normalized description
+        amount: Signed amount (float, Decimal or str), rounded to cents
+        ordinal: Position among otherwise identical transactions on the same day
+    """
+    cents = Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if cents == 0:
+        cents = Decimal('0.00')  # Avoid distinct fingerprints for 0.00 and -0.00
+    canonical = '|'.join([
+        str(account_id),
+        transaction_date.isoformat(),
+        normalize_description(description),
+        str(cents),
+        str(ordinal),
+    ])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
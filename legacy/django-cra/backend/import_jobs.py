@@ -0,0 +1,236 @@
+"""
+Background statement imports.
+
+An upload request only stores the files and creates an ImportJob; the job
+then runs on a small thread pool:
+
+1. Parse - every file is read, normalized and fingerprinted in parallel.
+   This is the CPU/IO heavy part and touches no tables.
+2. Import - parsed files are written one after another, so concurrent
+   writers never contend for the database (SQLite allows a single writer).
+3. Categorize - the newly inserted transactions are auto-categorized as a
+   follow-on stage of the same job.
+
+Progress is recorded on ImportJob/ImportJobFile rows, which the status
+endpoint reports back to the client. The executors live in process memory,
+so jobs still unfinished when the server process starts were interrupted by
+a restart; fail_interrupted_jobs marks them failed on the first request.
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .categorization_service import AutoCategorizationService
+from .ingestion import UnsupportedFileType, prepare_file, should_stream, stream_file, write_statement
+from .models import ImportJob, ImportJobFile, Transaction
+
+logger = logging.getLogger(__name__)
+
+# Jobs run one at a time so their write stages never overlap; files within a
+# job are parsed on a separate pool so a waiting job cannot starve its parsers.
+_job_executor: Optional[ThreadPoolExecutor] = None
+_parse_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+UNFINISHED_JOB_STATUSES = ('queued', 'parsing', 'importing', 'categorizing')
+UNFINISHED_FILE_STATUSES = ('queued', 'parsing', 'parsed')
+INTERRUPTED_ERROR = "Import interrupted by a server restart; please upload the files again"
+
+# Jobs created before this moment belong to an earlier server process
+_process_started = timezone.now()
+
+
+def _get_job_executor() -> ThreadPoolExecutor:
+    global _job_executor
+    with _executor_lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='import-job')
+    return _job_executor
+
+
+def _get_parse_executor() -> ThreadPoolExecutor:
+    global _parse_executor
+    with _executor_lock:
+        if _parse_executor is None:
+            _parse_executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'IMPORT_WORKER_THREADS', 4),
+                thread_name_prefix='import-parse',
+            )
+    return _parse_executor
+
+
+def enqueue_import_job(job: ImportJob) -> None:
+    """Start processing a job once the transaction that created it commits."""
+    transaction.on_commit(lambda: _get_job_executor().submit(run_import_job, job.id))
+
+
+def fail_interrupted_jobs() -> int:
+    """
+    Mark jobs left unfinished by an earlier server process as failed.
+
+    Their executor is gone, so nothing would ever finish them and clients
+    would poll them forever. Files already imported keep their status;
+    stored uploads that were never processed are removed.
+
+    Returns:
+        Number of jobs marked failed
+    """
+    jobs = ImportJob.objects.filter(status__in=UNFINISHED_JOB_STATUSES, created_at__lt=_process_started)
+    job_ids = list(jobs.values_list('id', flat=True))
+    if not job_ids:
+        return 0
+
+    job_files = ImportJobFile.objects.filter(job_id__in=job_ids, status__in=UNFINISHED_FILE_STATUSES)
+    for file_path in job_files.values_list('file_path', flat=True):
+        _remove_upload(file_path)
+    with transaction.atomic():
+        job_files.update(status='failed', error=INTERRUPTED_ERROR)
+        ImportJob.objects.filter(id__in=job_ids).update(
+            status='failed', error=INTERRUPTED_ERROR, finished_at=timezone.now()
+        )
+    logger.warning("Marked %d interrupted import job(s) as failed", len(job_ids))
+    return len(job_ids)
+
+
+def _close_connections(func):
+    """Worker threads get their own connections; close them when the task ends."""
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+def _remove_upload(file_path: str) -> None:
+    if os.path.exists(file_path):
+        os.remove(file_path)
+
+
+def _file_error(error: Exception) -> str:
+    if isinstance(error, UnsupportedFileType):
+        return "Unsupported file type"
+    return f"Error processing file: {str(error)}"
+
+
+# Returned by the parse stage for files too large to hold in memory; they are
+# read and written chunk by chunk during the import stage instead
+STREAM = 'stream'
+
+
+@_close_connections
+def _parse_job_file(job_file_id: int, file_type: str, account_id: int):
+    """Parse one stored upload. Returns (frame, statement_format), STREAM, or None if parsing failed."""
+    job_file = ImportJobFile.objects.get(id=job_file_id)
+    if should_stream(job_file.file_path):
+        return STREAM
+
+    job_file.status = 'parsing'
+    job_file.save(update_fields=['status'])
+
+    try:
+        frame, statement_format = prepare_file(job_file.file_path, file_type, account_id)
+    except Exception as e:
+        job_file.status = 'failed'
+        job_file.error = _file_error(e)
+        job_file.save(update_fields=['status', 'error'])
+        return None
+    finally:
+        _remove_upload(job_file.file_path)
+
+    job_file.status = 'parsed'
+    job_file.rows_parsed = len(frame)
+    job_file.save(update_fields=['status', 'rows_parsed'])
+    return frame, statement_format
+
+
+def _categorize_new_transactions(job: ImportJob, inserted_ranges: List[tuple]) -> dict:
+    """Auto-categorize the rows inserted by this job."""
+    first_id = min(first for first, _ in inserted_ranges)
+    last_id = max(last for _, last in inserted_ranges)
+    queryset = Transaction.objects.filter(
+        user=job.user,
+        account=job.account,
+        id__gte=first_id,
+        id__lte=last_id,
+        category__isnull=True,
+    )
+    service = AutoCategorizationService()
+    return service.bulk_categorize_transactions(queryset)
+
+
+@_close_connections
+def run_import_job(job_id: int) -> None:
+    """Parse, import and categorize every file of an import job."""
+    job = ImportJob.objects.select_related('user', 'account').get(id=job_id)
+    job_files = list(job.files.all())
+
+    job.status = 'parsing'
+    job.started_at = timezone.now()
+    job.save(update_fields=['status', 'started_at'])
+
+    try:
+        # Stage 1: parse all files concurrently
+        futures = [
+            _get_parse_executor().submit(_parse_job_file, job_file.id, job.file_type, job.account_id)
+            for job_file in job_files
+        ]
+        parsed = [future.result() for future in futures]
+
+        # Stage 2: write sequentially
+        job.status = 'importing'
+        job.save(update_fields=['status'])
+
+        inserted_ranges = []
+        for job_file, result in zip(job_files, parsed):
+            if result is None:
+                continue
+            try:
+                if result == STREAM:
+                    ImportJobFile.objects.filter(id=job_file.id).update(status='parsing')
+                    counts = stream_file(job_file.file_path, job.file_type, job.account, job.user)
+                else:
+                    frame, statement_format = result
+                    counts = write_statement(frame, statement_format, job.account, job.user)
+            except Exception as e:
+                ImportJobFile.objects.filter(id=job_file.id).update(status='failed', error=_file_error(e))
+                continue
+            finally:
+                _remove_upload(job_file.file_path)
+
+            ImportJobFile.objects.filter(id=job_file.id).update(
+                status='imported',
+                rows_parsed=counts['rows_inserted'] + counts['duplicates_skipped'],
+                rows_inserted=counts['rows_inserted'],
+                duplicates_skipped=counts['duplicates_skipped'],
+            )
+            job.rows_inserted += counts['rows_inserted']
+            job.duplicates_skipped += counts['duplicates_skipped']
+            if counts['first_id'] is not None:
+                inserted_ranges.append((counts['first_id'], counts['last_id']))
+        job.save(update_fields=['rows_inserted', 'duplicates_skipped'])
+
+        # Stage 3: categorize what was inserted
+        if inserted_ranges:
+            job.status = 'categorizing'
+            job.save(update_fields=['status'])
+            job.categorization_stats = _categorize_new_transactions(job, inserted_ranges)
+
+        job.status = 'completed'
+    except Exception as e:
+        logger.exception("Import job %s failed", job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    finally:
+        for job_file in job_files:
+            _remove_upload(job_file.file_path)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'categorization_stats', 'finished_at'])
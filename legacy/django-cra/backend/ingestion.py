@@ -0,0 +1,497 @@
+"""
+Bank statement ingestion pipeline.
+
+Each bank format is normalized with vectorized pandas operations (date parsing,
+amount cleaning, uppercasing, sign normalization) into a common frame with
+``date``, ``description`` and ``amount`` columns plus the bank's raw columns.
+The raw bank table and ``Transaction`` rows are then written with
+``bulk_create`` inside one atomic block.
+
+Large CSV exports are streamed: they are read ``STREAM_CHUNK_SIZE`` rows at a
+time and each chunk is normalized and written before the next one is read, so
+peak memory stays bounded by the chunk size rather than the file size.
+
+The layouts themselves are registered in ``bank_formats``; detection sniffs
+the first few KB of an upload, so each file is parsed exactly once.
+"""
+
+import logging
+import os
+import sys
+import time
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+
+from .bank_formats import (
+    BANK_FORMATS, BankFormat, StatementSample, UnrecognizedStatement, UnsupportedFileType,
+    detect_bank_format, register_bank_format,
+)
+from .fingerprint import normalize_description, transaction_fingerprint
+from .merchants import merchant_key, similarity_key
+from .rollups import refresh_spending_rollup
+from .models import Account, Transaction, TDTransaction, AmexTransaction, ScotiabankTransaction
+
+logger = logging.getLogger(__name__)
+
+BULK_BATCH_SIZE = 1000
+STREAM_CHUNK_SIZE = 20000
+
+
+def _parse_dates(values: pd.Series, date_format: str) -> pd.Series:
+    """Parse a column of date strings; unparseable values become NaT."""
+    return pd.to_datetime(values.astype(str).str.strip(), format=date_format, errors='coerce')
+
+
+def _clean_amounts(values: pd.Series) -> pd.Series:
+    """Strip dollar signs, commas and whitespace and convert to float (blank/invalid -> 0.0)."""
+    cleaned = values.astype(str).str.replace(r'[$,\s]', '', regex=True)
+    return pd.to_numeric(cleaned, errors='coerce').fillna(0.0)
+
+
+def _upper_text(values: pd.Series) -> pd.Series:
+    """Uppercase a text column for consistency, treating missing values as empty."""
+    return values.fillna('').astype(str).str.strip().str.upper()
+
+
+def _text(df: pd.DataFrame, column: str) -> pd.Series:
+    """Optional raw text column, empty when the export doesn't include it."""
+    if column not in df.columns:
+        return pd.Series('', index=df.index)
+    return df[column].fillna('').astype(str)
+
+
+def _finalize(frame: pd.DataFrame, date_columns: List[str], require_description: bool = False) -> pd.DataFrame:
+    """
+    Drop rows with invalid dates and convert dates to datetime.date.
+
+    Rows with an empty description are kept (a blank memo is still a charge)
+    unless ``require_description`` is set.
+    """
+    valid = frame['description'] != '' if require_description else pd.Series(True, index=frame.index)
+    for column in date_columns:
+        valid &= frame[column].notna()
+    frame = frame[valid].copy()
+    for column in date_columns:
+        frame[column] = frame[column].dt.date
+    return frame
+
+
+def normalize_td(df: pd.DataFrame) -> pd.DataFrame:
+    """TD export with headers: Date ("01 Jan 2025"), Description, Amount (signed)."""
+    amount = _clean_amounts(df['Amount'])
+    frame = pd.DataFrame({
+        'date': _parse_dates(df['Date'], '%d %b %Y'),
+        'description': _upper_text(df['Description']),
+        'amount': amount,
+        'credit_amt': amount.where(amount > 0),
+        'debit_amt': amount.abs().where(amount < 0),
+    })
+    return _finalize(frame, ['date'])
+
+
+def normalize_td_headerless(df: pd.DataFrame) -> pd.DataFrame:
+    """TD headerless export: DATE (MM/DD/YYYY), DESCRIPTION, CREDIT, DEBIT, BALANCE."""
+    # In TD format: CREDIT column = charges (expenses), DEBIT column = payments (credits)
+    credit = _clean_amounts(df['CREDIT'])
+    debit = _clean_amounts(df['DEBIT'])
+    frame = pd.DataFrame({
+        'date': _parse_dates(df['DATE'], '%m/%d/%Y'),
+        'description': _upper_text(df['DESCRIPTION']),
+        # Net amount (negative for charges/expenses, positive for payments/credits)
+        'amount': debit - credit,
+        'credit_amt': credit.where(credit > 0),
+        'debit_amt': debit.where(debit > 0),
+    })
+    # Headerless TD rows without a description have always been skipped
+    return _finalize(frame, ['date'], require_description=True)
+
+
+def normalize_amex(df: pd.DataFrame) -> pd.DataFrame:
+    """Amex export with lower_snake_case columns (date, date_processed, description, amount, ...)."""
+    frame = pd.DataFrame({
+        'date': _parse_dates(df['date'], '%d %b %Y'),
+        'date_processed': _parse_dates(df['date_processed'], '%d %b %Y'),
+        'description': _upper_text(df['description']),
+        'amount': _clean_amounts(df['amount']),
+        'cardmember': _text(df, 'cardmember'),
+        'merchant': _text(df, 'merchant'),
+    })
+    for column in ['commission', 'exc_rate']:
+        values = df[column] if column in df.columns else pd.Series(index=df.index, dtype=float)
+        frame[column] = pd.to_numeric(values, errors='coerce').fillna(0)
+    return _finalize(frame, ['date', 'date_processed'])
+
+
+def normalize_scotiabank(df: pd.DataFrame) -> pd.DataFrame:
+    """Scotiabank export: Date (YYYY-MM-DD), Description, Sub-description, Status, Type of Transaction, Amount."""
+    frame = pd.DataFrame({
+        'date': _parse_dates(df['Date'], '%Y-%m-%d'),
+        'description': _upper_text(df['Description']),
+        'amount': _clean_amounts(df['Amount']),
+        'sub_description': _text(df, 'Sub-description'),
+        'status': _text(df, 'Status'),
+        'transaction_type': _text(df, 'Type of Transaction'),
+    })
+    return _finalize(frame, ['date'])
+
+
+def _optional(value):
+    """Convert pandas missing values to None for nullable model fields."""
+    return None if pd.isna(value) else value
+
+
+def _td_records(frame: pd.DataFrame) -> List[TDTransaction]:
+    return [
+        TDTransaction(
+            date=row.date,
+            charge_name=row.description,
+            credit_amt=_optional(row.credit_amt),
+            debit_amt=_optional(row.debit_amt),
+            balance=None  # Not used
+        )
+        for row in frame.itertuples(index=False)
+    ]
+
+
+def _amex_records(frame: pd.DataFrame) -> List[AmexTransaction]:
+    return [
+        AmexTransaction(
+            date=row.date,
+            date_processed=row.date_processed,
+            description=row.description,
+            cardmember=row.cardmember,
+            amount=row.amount,
+            commission=row.commission,
+            exc_rate=row.exc_rate,
+            merchant=row.merchant
+        )
+        for row in frame.itertuples(index=False)
+    ]
+
+
+def _scotiabank_records(frame: pd.DataFrame) -> List[ScotiabankTransaction]:
+    return [
+        ScotiabankTransaction(
+            date=row.date,
+            description=row.description,
+            sub_description=row.sub_description,
+            status=row.status,
+            transaction_type=row.transaction_type,
+            amount=row.amount
+        )
+        for row in frame.itertuples(index=False)
+    ]
+
+
+def _strip_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def _amex_columns(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = df.columns.str.lower().str.replace(' ', '_')
+    return df.rename(columns={'exchange_rate': 'exc_rate'})
+
+
+def _has_columns(row: List[str], *columns: str) -> bool:
+    return set(columns).issubset(row)
+
+
+TD_HEADERLESS_COLUMNS = ['DATE', 'DESCRIPTION', 'CREDIT', 'DEBIT', 'BALANCE']
+AMEX_PREAMBLE_ROWS = 11  # Amex exports start with account details above the header row
+
+
+def sniff_td_headerless(sample: StatementSample) -> bool:
+    """
+    TD headerless format (DATE, DESCRIPTION, CREDIT, DEBIT, BALANCE).
+
+    Look for patterns that indicate headerless format in the first row:
+    1. 5 columns
+    2. First column looks like a date (MM/DD/YYYY format)
+    3. Second column looks like a description (not a typical header word)
+    """
+    first_row = sample.row(0)
+    return (
+        len(first_row) == 5 and
+        first_row[0].count('/') == 2 and  # Date format MM/DD/YYYY
+        not any(header_word in first_row[1].upper() for header_word in ['DESCRIPTION', 'MERCHANT'])
+    )
+
+
+def sniff_td(sample: StatementSample) -> bool:
+    return _has_columns(sample.row(0), 'Date', 'Description', 'Amount')
+
+
+def sniff_scotiabank(sample: StatementSample) -> bool:
+    header = sample.row(0)
+    return (
+        _has_columns(header, 'Date', 'Description', 'Amount') and
+        any(column in header for column in ['Sub-description', 'Status', 'Type of Transaction'])
+    )
+
+
+def sniff_amex(sample: StatementSample) -> bool:
+    # Amex statements are downloaded as Excel workbooks; CSV copies keep the same preamble
+    if sample.is_excel:
+        return True
+    header = [column.lower().replace(' ', '_') for column in sample.row(AMEX_PREAMBLE_ROWS)]
+    return _has_columns(header, 'date', 'date_processed', 'description', 'amount')
+
+
+# More specific layouts first: detection without a file_type tries them in this order
+register_bank_format(BankFormat(
+    'td_headerless', 'TD', sniff_td_headerless, normalize_td_headerless, TDTransaction, _td_records, 'TD',
+    read_options={'header': None, 'names': TD_HEADERLESS_COLUMNS},
+))
+register_bank_format(BankFormat(
+    'scotiabank', 'Scotiabank', sniff_scotiabank, normalize_scotiabank, ScotiabankTransaction, _scotiabank_records,
+    'Scotiabank', clean_columns=_strip_columns,
+))
+register_bank_format(BankFormat(
+    'amex', 'Amex', sniff_amex, normalize_amex, AmexTransaction, _amex_records, 'Amex',
+    read_options={'skiprows': AMEX_PREAMBLE_ROWS}, clean_columns=_amex_columns,
+))
+register_bank_format(BankFormat(
+    'td', 'TD', sniff_td, normalize_td, TDTransaction, _td_records, 'TD',
+    clean_columns=_strip_columns,
+))
+
+
+def add_fingerprints(frame: pd.DataFrame, account_id: int, ordinal_counts: Optional[Dict] = None) -> pd.DataFrame:
+    """
+    Add a ``fingerprint`` column identifying each row by content.
+
+    Identical rows (same date, description and amount) are numbered by their
+    order in the file, so two genuine identical purchases on one day keep
+    distinct fingerprints while a re-imported statement reproduces them.
+
+    When a file is processed in chunks, pass the same ``ordinal_counts`` dict
+    for every chunk so the numbering continues across chunk boundaries.
+    """
+    if ordinal_counts is None:
+        ordinal_counts = {}
+    cents = frame['amount'].round(2)
+    descriptions = frame['description'].map(normalize_description)
+    fingerprints = []
+    for txn_date, description, amount in zip(frame['date'], descriptions, cents):
+        key = (txn_date, description, amount)
+        ordinal = ordinal_counts.get(key, 0)
+        ordinal_counts[key] = ordinal + 1
+        fingerprints.append(transaction_fingerprint(account_id, txn_date, description, amount, ordinal))
+    frame = frame.copy()
+    frame['fingerprint'] = fingerprints
+    return frame
+
+
+def existing_fingerprints(account, fingerprints: List[str], batch_size: int = BULK_BATCH_SIZE) -> Set[str]:
+    """Return the subset of fingerprints already stored for the account, with one query per batch."""
+    found = set()
+    for start in range(0, len(fingerprints), batch_size):
+        found.update(
+            Transaction.objects.filter(
+                account=account,
+                fingerprint__in=fingerprints[start:start + batch_size]
+            ).values_list('fingerprint', flat=True)
+        )
+    return found
+
+
+def prepare_statement(df: pd.DataFrame, statement_format: str, account_id: int, ordinal_counts: Optional[Dict] = None) -> pd.DataFrame:
+    """Normalize a parsed statement (or chunk of one), fingerprint its rows and extract merchant keys. Touches no database tables."""
+    frame = BANK_FORMATS[statement_format].normalize(df)
+    if frame.empty:
+        return frame
+    frame = add_fingerprints(frame, account_id, ordinal_counts)
+    frame['merchant_key'] = frame['description'].map(merchant_key)
+    frame['similarity_key'] = frame['description'].map(similarity_key)
+    return frame
+
+
+def statement_total(transactions: List[Transaction]) -> Decimal:
+    """Sum of the amounts as the database stores them (rounded to cents), for the account balance delta."""
+    amount_field = Transaction._meta.get_field('amount')
+    cents = Decimal(1).scaleb(-amount_field.decimal_places)
+    return sum((amount_field.to_python(txn.amount).quantize(cents, rounding=ROUND_HALF_UP) for txn in transactions), Decimal(0))
+
+
+def write_statement(frame: pd.DataFrame, statement_format: str, account, user, batch_size: int = BULK_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Insert a prepared statement into the raw bank table and Transaction.
+
+    Rows whose fingerprint already exists for the account (e.g. from an
+    overlapping statement uploaded earlier) are skipped. The account balance
+    is adjusted by the inserted amounts in the same database transaction.
+
+    Returns:
+        Dictionary with rows_inserted and duplicates_skipped counts, plus
+        first_id/last_id of the inserted Transaction rows (None if nothing was inserted)
+    """
+    bank_format = BANK_FORMATS[statement_format]
+    result = {'rows_inserted': 0, 'duplicates_skipped': 0, 'first_id': None, 'last_id': None}
+    if frame.empty:
+        return result
+
+    with transaction.atomic():
+        duplicates = existing_fingerprints(account, frame['fingerprint'].tolist(), batch_size)
+        if duplicates:
+            frame = frame[~frame['fingerprint'].isin(duplicates)]
+            result['duplicates_skipped'] = len(duplicates)
+        if frame.empty:
+            return result
+
+        transactions = [
+            Transaction(
+                user=user,
+                date=row.date,
+                description=row.description,
+                amount=row.amount,
+                source=bank_format.source,
+                account=account,
+                fingerprint=row.fingerprint,
+                merchant_key=row.merchant_key,
+                similarity_key=row.similarity_key
+            )
+            for row in frame[['date', 'description', 'amount', 'fingerprint', 'merchant_key', 'similarity_key']].itertuples(index=False)
+        ]
+
+        bank_format.raw_model.objects.bulk_create(bank_format.build_records(frame), batch_size=batch_size)
+        Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+        refresh_spending_rollup({(user.id, account.id, txn_date.replace(day=1)) for txn_date in frame['date']})
+        Account.apply_balance_delta(account.id, statement_total(transactions))
+
+    inserted_ids = [txn.pk for txn in transactions if txn.pk is not None]
+    result['rows_inserted'] = len(transactions)
+    if inserted_ids:
+        result['first_id'] = min(inserted_ids)
+        result['last_id'] = max(inserted_ids)
+    return result
+
+
+def ingest_statement(df: pd.DataFrame, statement_format: str, account, user, batch_size: int = BULK_BATCH_SIZE) -> Dict[str, int]:
+    """
+    Normalize a parsed statement and insert its new rows.
+
+    Args:
+        df: DataFrame as read from the bank export
+        statement_format: BANK_FORMATS key ('td', 'td_headerless', 'amex', 'scotiabank')
+        account: Account the transactions belong to
+        user: Owner of the transactions
+        batch_size: Rows per INSERT statement and per duplicate lookup
+
+    Returns:
+        write_statement's counts
+    """
+    frame = prepare_statement(df, statement_format, account.id)
+    return write_statement(frame, statement_format, account, user, batch_size)
+
+
+def read_statement_file(file_path: str, file_type: str) -> Tuple[pd.DataFrame, str]:
+    """
+    Read an uploaded bank export.
+
+    Returns:
+        Tuple of (DataFrame, statement format key for BANK_FORMATS)
+    """
+    bank_format, sample = detect_bank_format(file_path, file_type)
+    return bank_format.read(sample), bank_format.key
+
+
+def iter_statement_chunks(file_path: str, file_type: str, chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[Iterator[pd.DataFrame], str]:
+    """
+    Read an uploaded bank export lazily, ``chunk_size`` rows at a time.
+
+    Returns:
+        Tuple of (iterator over DataFrame chunks, statement format key)
+    """
+    bank_format, sample = detect_bank_format(file_path, file_type)
+    return bank_format.read_chunks(sample, chunk_size), bank_format.key
+
+
+def should_stream(file_path: str) -> bool:
+    """Whether a file is large enough to be imported in chunks (see IMPORT_STREAMING_THRESHOLD_BYTES)."""
+    threshold = getattr(settings, 'IMPORT_STREAMING_THRESHOLD_BYTES', 5 * 1024 * 1024)
+    return os.path.getsize(file_path) >= threshold
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process in MB, or None where unavailable (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes elsewhere
+    if sys.platform == 'darwin':
+        peak /= 1024
+    return round(peak / 1024, 1)
+
+
+def prepare_file(file_path: str, file_type: str, account_id: int) -> Tuple[pd.DataFrame, str]:
+    """Read and prepare an uploaded bank export without writing anything."""
+    df, statement_format = read_statement_file(file_path, file_type)
+    return prepare_statement(df, statement_format, account_id), statement_format
+
+
+def stream_file(file_path: str, file_type: str, account, user, chunk_size: int = STREAM_CHUNK_SIZE) -> Dict[str, int]:
+    """
+    Import a bank export chunk by chunk.
+
+    Each chunk is written in its own transaction, so a failure part-way keeps
+    the chunks already imported; fingerprints make a retry of the same file
+    skip them.
+
+    Returns:
+        write_statement's counts, summed over all chunks
+    """
+    chunks, statement_format = iter_statement_chunks(file_path, file_type, chunk_size)
+    result = {'rows_inserted': 0, 'duplicates_skipped': 0, 'first_id': None, 'last_id': None}
+    ordinal_counts = {}
+
+    for chunk in chunks:
+        frame = prepare_statement(chunk, statement_format, account.id, ordinal_counts)
+        counts = write_statement(frame, statement_format, account, user)
+        result['rows_inserted'] += counts['rows_inserted']
+        result['duplicates_skipped'] += counts['duplicates_skipped']
+        if counts['first_id'] is not None:
+            # Chunks are inserted in order, so ids only grow
+            if result['first_id'] is None:
+                result['first_id'] = counts['first_id']
+            result['last_id'] = counts['last_id']
+    return result
+
+
+def ingest_file(file_path: str, file_type: str, account, user, stream: Optional[bool] = None) -> Dict[str, int]:
+    """
+    Read an uploaded bank export and insert its new transactions.
+
+    Args:
+        stream: Import in chunks; by default only files above the streaming threshold are streamed
+
+    Returns:
+        write_statement's counts plus throughput (rows_per_second) and
+        the process's peak RSS (peak_rss_mb) for sizing import workers
+    """
+    if stream is None:
+        stream = should_stream(file_path)
+
+    started = time.perf_counter()
+    if stream:
+        result = stream_file(file_path, file_type, account, user)
+    else:
+        frame, statement_format = prepare_file(file_path, file_type, account.id)
+        result = write_statement(frame, statement_format, account, user)
+    elapsed = time.perf_counter() - started
+
+    rows = result['rows_inserted'] + result['duplicates_skipped']
+    result['rows_per_second'] = round(rows / elapsed, 1) if elapsed > 0 else None
+    result['peak_rss_mb'] = peak_rss_mb()
+    logger.info(
+        "Imported %s (%s, %s): %d rows in %.2fs (%s rows/s), peak RSS %s MB",
+        os.path.basename(file_path), file_type, 'streamed' if stream else 'in memory',
+        rows, elapsed, result['rows_per_second'], result['peak_rss_mb']
+    )
+    return result
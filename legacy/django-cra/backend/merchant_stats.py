@@ -0,0 +1,91 @@
+"""
+Spending per merchant.
+
+Expenses are grouped on Transaction.merchant_key, the normalized merchant
+stored at import, so ``STARBUCKS #1234`` and ``STARBUCKS #5678`` count as
+one merchant and the grouping runs over a short indexed column instead of
+the raw description text.
+"""
+
+from decimal import Decimal
+from typing import Dict, List, Sequence
+
+from django.db.models import Avg, Count, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+
+CENTS = Decimal('0.01')
+
+
+def merchant_totals(expenses, limit: int = 10):
+    """
+    Merchants with the highest expense totals, in one grouped query.
+
+    Args:
+        expenses: QuerySet of expense transactions (already filtered by user, dates, account)
+        limit: Number of merchants returned
+
+    Returns:
+        values() rows with merchant_key, total_amount, transaction_count,
+        first_seen, last_seen and average_amount, largest total first
+    """
+    return (
+        expenses.exclude(merchant_key='')
+        .values('merchant_key')
+        .annotate(
+            total_amount=Sum('amount'),
+            transaction_count=Count('id'),
+            first_seen=Min('date'),
+            last_seen=Max('date'),
+            average_amount=Avg('amount'),
+        )
+        .order_by('-total_amount', 'merchant_key')[:limit]
+    )
+
+
+def merchant_monthly_trends(expenses, merchant_keys: Sequence[str]) -> Dict[str, List[dict]]:
+    """Monthly expense totals of the given merchants, oldest month first."""
+    trends: Dict[str, List[dict]] = {key: [] for key in merchant_keys}
+    if not trends:
+        return trends
+    rows = (
+        expenses.filter(merchant_key__in=merchant_keys)
+        .annotate(month=TruncMonth('date'))
+        .values('merchant_key', 'month')
+        .annotate(total_amount=Sum('amount'))
+        .order_by('merchant_key', 'month')
+    )
+    for row in rows:
+        trends[row['merchant_key']].append({'month': row['month'], 'total_amount': row['total_amount']})
+    return trends
+
+
+def _money(value) -> float:
+    return float(Decimal(value).quantize(CENTS))
+
+
+def top_merchants(expenses, limit: int = 10) -> List[dict]:
+    """
+    Top merchants by expense total with their monthly trend, in two queries.
+
+    Returns:
+        One dict per merchant: merchant, total_amount, transaction_count,
+        first_seen, last_seen, average_amount and monthly_trend
+        ([{month, total_amount}], months without spending omitted)
+    """
+    totals = list(merchant_totals(expenses, limit))
+    trends = merchant_monthly_trends(expenses, [row['merchant_key'] for row in totals])
+    return [
+        {
+            'merchant': row['merchant_key'],
+            'total_amount': _money(row['total_amount']),
+            'transaction_count': row['transaction_count'],
+            'first_seen': row['first_seen'].isoformat(),
+            'last_seen': row['last_seen'].isoformat(),
+            'average_amount': _money(row['average_amount']),
+            'monthly_trend': [
+                {'month': point['month'].strftime('%Y-%m'), 'total_amount': _money(point['total_amount'])}
+                for point in trends[row['merchant_key']]
+            ],
+        }
+        for row in totals
+    ]
@@ -0,0 +1,55 @@
+"""
+Merchant names extracted from transaction descriptions.
+
+Descriptions carry processor noise around the merchant, e.g.
+``POS TIM HORTONS #1234`` or ``DEBIT NETFLIX.COM REF: 998``. The noise is
+stripped with a pipeline of precompiled regular expressions: one leading
+prefix, then everything from the first suffix marker on.
+
+Transaction.merchant_key stores the uppercased, whitespace-collapsed
+merchant so merchant rules, charts and similarity lookups can read and
+index it instead of re-extracting it per use. Transaction.similarity_key
+additionally drops tokens carrying digits (store numbers, references,
+dates), so visits to different branches of a merchant share one key.
+"""
+
+import re
+
+MERCHANT_PREFIXES = [
+    'POS ', 'DEBIT ', 'CREDIT ', 'PURCHASE ', 'PAYMENT ',
+    'TRANSFER ', 'WITHDRAWAL ', 'DEPOSIT ', 'ATM '
+]
+
+MERCHANT_SUFFIXES = [
+    ' #', ' REF:', ' AUTH:', ' ID:', ' TID:',
+    ' TERM:', ' SEQ:', ' BATCH:'
+]
+
+MERCHANT_KEY_LENGTH = 255
+SIMILARITY_KEY_LENGTH = 32
+
+# Alternatives are tried in list order, so the first listed prefix wins as before
+_PREFIX = re.compile('^(?:{})'.format('|'.join(map(re.escape, MERCHANT_PREFIXES))), re.IGNORECASE)
+_SUFFIX = re.compile('|'.join(map(re.escape, MERCHANT_SUFFIXES)), re.IGNORECASE)
+_WHITESPACE = re.compile(r'\s+')
+_TOKEN = re.compile(r'(?:[^\W_]|&)+')
+
+
+def extract_merchant_name(description: str) -> str:
+    """Extract merchant name from transaction description."""
+    merchant = _PREFIX.sub('', description.strip(), count=1).strip()
+    suffix = _SUFFIX.search(merchant)
+    if suffix:
+        merchant = merchant[:suffix.start()].strip()
+    return merchant
+
+
+def merchant_key(description: str) -> str:
+    """Uppercased merchant name with whitespace collapsed, as stored in Transaction.merchant_key."""
+    return _WHITESPACE.sub(' ', extract_merchant_name(description)).upper()[:MERCHANT_KEY_LENGTH]
+
+
+def similarity_key(description: str) -> str:
+    """Merchant key without digit-bearing tokens or punctuation, as stored in Transaction.similarity_key."""
+    tokens = [token for token in _TOKEN.findall(merchant_key(description)) if not any(char.isdigit() for char in token)]
+    return ' '.join(tokens)[:SIMILARITY_KEY_LENGTH].rstrip()
@@ -0,0 +1,71 @@
+# Add content-hash fingerprints to transactions for idempotent imports
+
+import hashlib
+import re
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+# Frozen copies of backend.fingerprint as of this migration, so later changes
+# to that module do not change what the backfill computes
+
+_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_description(description):
+    return _WHITESPACE.sub(' ', str(description)).strip().upper()
+
+
+def transaction_fingerprint(account_id, transaction_date, description, amount, ordinal=0):
+    cents = Decimal(str(amount)).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP)
+    if cents == 0:
+        cents = Decimal('0.00')
+    canonical = '|'.join([
+        str(account_id),
+        transaction_date.isoformat(),
+        normalize_description(description),
+        str(cents),
+        str(ordinal),
+    ])
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def backfill_fingerprints(apps, schema_editor):
+    """Fingerprint existing transactions, numbering identical rows per account and day in id order"""
+    Transaction = apps.get_model('backend', 'Transaction')
+
+    batch = []
+    current_day = None
+    ordinals = {}
+    for txn in Transaction.objects.order_by('account_id', 'date', 'id').iterator(chunk_size=2000):
+        if (txn.account_id, txn.date) != current_day:
+            current_day = (txn.account_id, txn.date)
+            ordinals = {}
+        key = (normalize_description(txn.description), txn.amount)
+        ordinal = ordinals.get(key, 0)
+        ordinals[key] = ordinal + 1
+
+        txn.fingerprint = transaction_fingerprint(txn.account_id, txn.date, txn.description, txn.amount, ordinal)
+        batch.append(txn)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ['fingerprint'])
+            batch = []
+
+    if batch:
+        Transaction.objects.bulk_update(batch, ['fingerprint'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0016_make_user_fields_required'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, max_length=64, null=True),
+        ),
+        migrations.RunPython(backfill_fingerprints, migrations.RunPython.noop),
+    ]
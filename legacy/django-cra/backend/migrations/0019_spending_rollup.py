@@ -0,0 +1,69 @@
+# Pre-aggregated spending rollup for the visualization endpoint
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import ExtractWeekDay, TruncMonth
+
+
+def build_rollup(apps, schema_editor):
+    """Aggregate existing transactions into the spending rollup"""
+    Transaction = apps.get_model('backend', 'Transaction')
+    SpendingRollup = apps.get_model('backend', 'SpendingRollup')
+
+    rows = (
+        Transaction.objects
+        .annotate(month=TruncMonth('date'), week_day=ExtractWeekDay('date'))
+        .values('user_id', 'account_id', 'category_id', 'month', 'week_day')
+        .annotate(
+            expense_total=Sum('amount', filter=Q(amount__gt=0)),
+            expense_count=Count('id', filter=Q(amount__gt=0)),
+            income_total=Sum('amount', filter=Q(amount__lt=0)),
+            income_count=Count('id', filter=Q(amount__lt=0)),
+            transaction_count=Count('id'),
+        )
+        .order_by()
+    )
+    SpendingRollup.objects.bulk_create(
+        (
+            SpendingRollup(**{
+                **row,
+                'expense_total': row['expense_total'] or 0,
+                'income_total': row['income_total'] or 0,
+            })
+            for row in rows
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0018_import_jobs'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(help_text='First day of the month')),
+                ('week_day', models.PositiveSmallIntegerField(help_text='1 = Sunday ... 7 = Saturday, as returned by ExtractWeekDay')),
+                ('expense_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('expense_count', models.PositiveIntegerField(default=0)),
+                ('income_total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('income_count', models.PositiveIntegerField(default=0)),
+                ('transaction_count', models.PositiveIntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_rollups', to='backend.account')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='spending_rollups', to='backend.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'month'], name='backend_spe_user_id_de44e0_idx'), models.Index(fields=['user', 'account', 'month'], name='backend_spe_user_id_c35f5f_idx')],
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
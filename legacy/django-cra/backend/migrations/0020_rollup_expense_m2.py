@@ -0,0 +1,62 @@
+# Store Welford's M2 of expenses on the spending rollup for per-category statistics
+
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum, Variance
+from django.db.models.functions import ExtractWeekDay, TruncMonth
+
+
+def rebuild_rollup(apps, schema_editor):
+    """Rebuild the spending rollup from transactions, now including expense_m2"""
+    Transaction = apps.get_model('backend', 'Transaction')
+    SpendingRollup = apps.get_model('backend', 'SpendingRollup')
+
+    SpendingRollup.objects.all().delete()
+    rows = (
+        Transaction.objects
+        .annotate(month=TruncMonth('date'), week_day=ExtractWeekDay('date'))
+        .values('user_id', 'account_id', 'category_id', 'month', 'week_day')
+        .annotate(
+            expense_total=Sum('amount', filter=Q(amount__gt=0)),
+            expense_count=Count('id', filter=Q(amount__gt=0)),
+            expense_variance=Variance('amount', filter=Q(amount__gt=0)),
+            income_total=Sum('amount', filter=Q(amount__lt=0)),
+            income_count=Count('id', filter=Q(amount__lt=0)),
+            transaction_count=Count('id'),
+        )
+        .order_by()
+    )
+    SpendingRollup.objects.bulk_create(
+        (
+            SpendingRollup(
+                user_id=row['user_id'],
+                account_id=row['account_id'],
+                category_id=row['category_id'],
+                month=row['month'],
+                week_day=row['week_day'],
+                expense_total=row['expense_total'] or 0,
+                expense_count=row['expense_count'],
+                expense_m2=float(row['expense_variance'] or 0) * row['expense_count'],
+                income_total=row['income_total'] or 0,
+                income_count=row['income_count'],
+                transaction_count=row['transaction_count'],
+            )
+            for row in rows
+        ),
+        batch_size=2000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0019_spending_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='spendingrollup',
+            name='expense_m2',
+            field=models.FloatField(default=0, help_text="Sum of squared deviations of expenses from their mean (Welford's M2)"),
+        ),
+        migrations.RunPython(rebuild_rollup, migrations.RunPython.noop),
+    ]
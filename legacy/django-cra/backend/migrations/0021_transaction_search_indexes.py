@@ -0,0 +1,38 @@
+# Composite indexes for transaction filtering and a text index on descriptions
+
+from django.conf import settings
+from django.db import migrations, models
+
+from backend.description_index import drop_description_index, install_description_index
+
+
+def create_description_index(apps, schema_editor):
+    install_description_index(schema_editor.connection)
+
+
+def remove_description_index(apps, schema_editor):
+    drop_description_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0020_rollup_expense_m2'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'date'], name='backend_tra_user_id_afe5bc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'category'], name='backend_tra_user_id_813eb2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'account', 'date'], name='backend_tra_user_id_cee884_idx'),
+        ),
+        migrations.RunPython(create_description_index, remove_description_index),
+    ]
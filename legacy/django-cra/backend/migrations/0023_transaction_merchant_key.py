@@ -0,0 +1,43 @@
+# Store a normalized merchant key on transactions
+
+from django.conf import settings
+from django.db import migrations, models
+
+from backend.merchants import merchant_key
+
+
+def backfill_merchant_keys(apps, schema_editor):
+    """Extract the merchant key of every existing transaction"""
+    Transaction = apps.get_model('backend', 'Transaction')
+
+    batch = []
+    for txn in Transaction.objects.only('id', 'description').order_by('id').iterator(chunk_size=2000):
+        txn.merchant_key = merchant_key(txn.description)
+        batch.append(txn)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ['merchant_key'])
+            batch = []
+
+    if batch:
+        Transaction.objects.bulk_update(batch, ['merchant_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0022_category_closure'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='merchant_key',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.RunPython(backfill_merchant_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'merchant_key'], name='backend_tra_user_id_018492_idx'),
+        ),
+    ]
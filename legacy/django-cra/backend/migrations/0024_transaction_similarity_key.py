@@ -0,0 +1,43 @@
+# Store a similarity key on transactions for similar-transaction lookups
+
+from django.conf import settings
+from django.db import migrations, models
+
+from backend.merchants import similarity_key
+
+
+def backfill_similarity_keys(apps, schema_editor):
+    """Derive the similarity key of every existing transaction"""
+    Transaction = apps.get_model('backend', 'Transaction')
+
+    batch = []
+    for txn in Transaction.objects.only('id', 'description').order_by('id').iterator(chunk_size=2000):
+        txn.similarity_key = similarity_key(txn.description)
+        batch.append(txn)
+        if len(batch) >= 2000:
+            Transaction.objects.bulk_update(batch, ['similarity_key'])
+            batch = []
+
+    if batch:
+        Transaction.objects.bulk_update(batch, ['similarity_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('backend', '0023_transaction_merchant_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='similarity_key',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+        migrations.RunPython(backfill_similarity_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'similarity_key'], name='backend_tra_user_id_d64a0f_idx'),
+        ),
+    ]
@@ -1,8 +1,12 @@
-from django.db import models
-from django.db.models import Sum
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import models, transaction
+from django.db.models import F, Sum
 from django.utils import timezone
 from django.contrib.auth.models import User
 
+from .merchants import MERCHANT_KEY_LENGTH, SIMILARITY_KEY_LENGTH, merchant_key, similarity_key
+
 class Category(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='categories')
     name = models.CharField(max_length=255)
@@ -23,22 +27,43 @@ class Category(models.Model):
             return f"{self.parent.name} > {self.name}"
         return self.name
     
+    def save(self, *args, **kwargs):
+        """Save and keep the CategoryClosure rows in step with the parent pointer."""
+        is_new = self._state.adding
+        old_parent_id = None
+        if not is_new:
+            old_parent_id = Category.objects.filter(pk=self.pk).values_list('parent_id', flat=True).first()
+            if self.parent_id != old_parent_id and self.parent_id is not None:
+                if CategoryClosure.objects.filter(ancestor_id=self.pk, descendant_id=self.parent_id).exists():
+                    raise ValueError("A category cannot be moved under itself or one of its subcategories")
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                CategoryClosure.link_new(self)
+            elif self.parent_id != old_parent_id:
+                CategoryClosure.move_subtree(self)
+
+    def get_ancestors(self, include_self=False):
+        """Ancestors ordered from the root down, in one query"""
+        ancestors = Category.objects.filter(descendant_links__descendant=self)
+        if not include_self:
+            ancestors = ancestors.filter(descendant_links__depth__gt=0)
+        return ancestors.order_by('-descendant_links__depth')
+
     @property
     def full_path(self):
         """Get the full hierarchical path of the category"""
-        if self.parent:
-            return f"{self.parent.full_path} > {self.name}"
-        return self.name
+        if self.pk is None:
+            return f"{self.parent.full_path} > {self.name}" if self.parent else self.name
+        return " > ".join(self.get_ancestors(include_self=True).values_list('name', flat=True))
     
     @property
     def level(self):
         """Get the depth level of the category (0 for root categories)"""
-        level = 0
-        parent = self.parent
-        while parent:
-            level += 1
-            parent = parent.parent
-        return level
+        if self.parent_id is None:
+            return 0
+        return CategoryClosure.objects.filter(descendant=self, depth__gt=0).count()
     
     @property
     def is_root(self):
@@ -47,16 +72,55 @@ class Category(models.Model):
     
     def get_all_subcategories(self):
         """Get all subcategories recursively"""
-        subcategories = list(self.subcategories.all())
-        for subcategory in subcategories:
-            subcategories.extend(subcategory.get_all_subcategories())
-        return subcategories
+        return list(Category.objects.filter(ancestor_links__ancestor=self, ancestor_links__depth__gt=0))
     
     def get_transaction_count(self):
         """Get the count of transactions in this category and all its subcategories"""
-        from django.db.models import Count
-        subcategory_ids = [self.id] + [sub.id for sub in self.get_all_subcategories()]
-        return Transaction.objects.filter(user=self.user, category__in=subcategory_ids).count()
+        return Transaction.objects.filter(user=self.user, category__ancestor_links__ancestor=self).count()
+
+
+class CategoryClosure(models.Model):
+    """
+    Transitive closure of the category hierarchy: one row per (ancestor, descendant)
+    pair, including each category paired with itself at depth 0.
+
+    Maintained by Category.save; deleting a category cascades to its rows.
+    """
+    ancestor = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='descendant_links')
+    descendant = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='ancestor_links')
+    depth = models.PositiveIntegerField()
+
+    class Meta:
+        unique_together = ['ancestor', 'descendant']
+        indexes = [
+            models.Index(fields=['descendant', 'depth']),
+        ]
+
+    @classmethod
+    def link_new(cls, category):
+        """Add the rows of a newly created (childless) category."""
+        links = [cls(ancestor_id=category.pk, descendant_id=category.pk, depth=0)]
+        if category.parent_id is not None:
+            links += [
+                cls(ancestor_id=ancestor_id, descendant_id=category.pk, depth=depth + 1)
+                for ancestor_id, depth in cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth')
+            ]
+        cls.objects.bulk_create(links)
+
+    @classmethod
+    def move_subtree(cls, category):
+        """Re-link a category and its descendants after its parent changed."""
+        subtree = list(cls.objects.filter(ancestor_id=category.pk).values_list('descendant_id', 'depth'))
+        subtree_ids = [descendant_id for descendant_id, _ in subtree]
+        cls.objects.filter(descendant_id__in=subtree_ids).exclude(ancestor_id__in=subtree_ids).delete()
+        if category.parent_id is None:
+            return
+        new_ancestors = cls.objects.filter(descendant_id=category.parent_id).values_list('ancestor_id', 'depth')
+        cls.objects.bulk_create(
+            cls(ancestor_id=ancestor_id, descendant_id=descendant_id, depth=ancestor_depth + 1 + depth)
+            for ancestor_id, ancestor_depth in new_ancestors
+            for descendant_id, depth in subtree
+        )
 
 class Account(models.Model):
     ACCOUNT_TYPES = [
@@ -91,6 +155,19 @@ class Account(models.Model):
         self.balance = self.calculate_balance()
         self.save(update_fields=['balance'])
         return self.balance
+
+    @staticmethod
+    def apply_balance_delta(account_id, delta):
+        """
+        Add ``delta`` to an account's stored balance in the database.
+
+        Callers run this in the same database transaction as the change to
+        the account's transactions, so the balance never drifts from them.
+        """
+        if delta:
+            Account.objects.filter(pk=account_id).update(
+                balance=F('balance') + delta, last_updated=timezone.now()
+            )
        
 class Transaction(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='transactions')
@@ -104,6 +181,97 @@ class Transaction(models.Model):
     auto_categorized = models.BooleanField(default=False)  # Track if auto-categorized
     confidence_score = models.FloatField(null=True, blank=True)  # Confidence in categorization
     suggested_category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='suggested_transactions')  # Suggested category for uncategorized transactions
+    # Content hash (account, date, description, amount, intra-day ordinal) used to skip re-imported rows
+    fingerprint = models.CharField(max_length=64, null=True, blank=True, db_index=True)
+    # Normalized merchant extracted from the description (see merchants.merchant_key), kept in step on save
+    merchant_key = models.CharField(max_length=MERCHANT_KEY_LENGTH, blank=True, default='')
+    # Merchant key without store numbers and references (see merchants.similarity_key), used to find similar transactions
+    similarity_key = models.CharField(max_length=SIMILARITY_KEY_LENGTH, blank=True, default='')
+
+    # Stored values that place a transaction in the account balances and the spending rollup
+    TRACKED_FIELDS = ('user_id', 'account_id', 'date', 'amount', 'category_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the stored balance and rollup currently include, to apply only the difference on save
+        loaded = dict(zip(field_names, values))
+        if all(field in loaded for field in cls.TRACKED_FIELDS):
+            instance._stored_entry = tuple(loaded[field] for field in cls.TRACKED_FIELDS)
+        return instance
+
+    def _tracked_entry(self) -> tuple:
+        # The amount rounded to cents as a numeric column stores it, so balances add up what the rows hold
+        amount_field = self._meta.get_field('amount')
+        cents = Decimal(1).scaleb(-amount_field.decimal_places)
+        return (
+            self.user_id,
+            self.account_id,
+            self._meta.get_field('date').to_python(self.date),
+            amount_field.to_python(self.amount).quantize(cents, rounding=ROUND_HALF_UP),
+            self.category_id,
+        )
+
+    def save(self, *args, **kwargs):
+        """
+        Save, refreshing the merchant keys, applying the change in amount (or
+        account) to the account balances and re-aggregating the spending rollup
+        slices the transaction leaves and enters.
+        """
+        from .rollups import refresh_spending_rollup
+
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'description' in update_fields:
+            self.merchant_key = merchant_key(self.description)
+            self.similarity_key = similarity_key(self.description)
+            if update_fields is not None:
+                kwargs['update_fields'] = update_fields = {*update_fields, 'merchant_key', 'similarity_key'}
+        tracked = {'user', 'user_id', 'account', 'account_id', 'date', 'amount', 'category', 'category_id'}
+        if update_fields is not None and not tracked & set(update_fields):
+            return super().save(*args, **kwargs)
+
+        previous = None
+        if not self._state.adding:
+            previous = getattr(self, '_stored_entry', None)
+            if previous is None:
+                # Loaded without the tracked fields (e.g. deferred): read what is currently stored
+                previous = Transaction.objects.filter(pk=self.pk).values_list(*self.TRACKED_FIELDS).first()
+
+        current = self._tracked_entry()
+        # Store the rounded amount on every backend (SQLite would keep the extra digits)
+        self.amount = current[3]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if previous != current:
+                user_id, account_id, txn_date, amount, _ = current
+                if previous is None or previous[1] != account_id or previous[3] != amount:
+                    if previous is not None:
+                        Account.apply_balance_delta(previous[1], -previous[3])
+                    Account.apply_balance_delta(account_id, amount)
+                slices = {(user_id, account_id, txn_date.replace(day=1))}
+                if previous is not None:
+                    slices.add((previous[0], previous[1], previous[2].replace(day=1)))
+                refresh_spending_rollup(slices)
+        self._stored_entry = current
+
+    def delete(self, *args, **kwargs):
+        from .rollups import refresh_spending_rollup
+
+        user_id, account_id, txn_date, amount, _ = getattr(self, '_stored_entry', None) or self._tracked_entry()
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            Account.apply_balance_delta(account_id, -amount)
+            refresh_spending_rollup({(user_id, account_id, txn_date.replace(day=1))})
+        return result
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date']),
+            models.Index(fields=['user', 'category']),
+            models.Index(fields=['user', 'account', 'date']),
+            models.Index(fields=['user', 'merchant_key']),
+            models.Index(fields=['user', 'similarity_key']),
+        ]
 
     def __str__(self):
         return f"{self.date} - {self.description} - {self.amount}"
@@ -296,3 +464,80 @@ class DatabaseBackup(models.Model):
     
     def __str__(self):
         return f"Backup {self.id} - {self.backup_type} ({self.created_at.strftime('%Y-%m-%d %H:%M')})"
+
+class ImportJob(models.Model):
+    """A batch of uploaded statements parsed and imported in the background"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('parsing', 'Parsing'),
+        ('importing', 'Importing'),
+        ('categorizing', 'Categorizing'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='import_jobs')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='import_jobs')
+    file_type = models.CharField(max_length=50)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    rows_inserted = models.PositiveIntegerField(default=0)
+    duplicates_skipped = models.PositiveIntegerField(default=0)
+    categorization_stats = models.JSONField(default=dict, blank=True, help_text="Results of the follow-on categorization stage")
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Import {self.id} - {self.account} ({self.status})"
+
+class ImportJobFile(models.Model):
+    """Progress of a single file within an import job"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('parsing', 'Parsing'),
+        ('parsed', 'Parsed'),
+        ('imported', 'Imported'),
+        ('failed', 'Failed'),
+    ]
+
+    job = models.ForeignKey(ImportJob, on_delete=models.CASCADE, related_name='files')
+    filename = models.CharField(max_length=255)
+    file_path = models.CharField(max_length=500, help_text="Stored upload, removed once processed")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    rows_parsed = models.PositiveIntegerField(default=0)
+    rows_inserted = models.PositiveIntegerField(default=0)
+    duplicates_skipped = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['id']
+
+    def __str__(self):
+        return f"{self.filename} ({self.status})"
+
+class SpendingRollup(models.Model):
+    """Transaction totals per user, account, category, month and weekday, kept in sync by backend.rollups"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spending_rollups')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, related_name='spending_rollups')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='spending_rollups')
+    month = models.DateField(help_text="First day of the month")
+    week_day = models.PositiveSmallIntegerField(help_text="1 = Sunday ... 7 = Saturday, as returned by ExtractWeekDay")
+    expense_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Sum of positive amounts
+    expense_count = models.PositiveIntegerField(default=0)
+    income_total = models.DecimalField(max_digits=14, decimal_places=2, default=0)  # Sum of negative amounts
+    income_count = models.PositiveIntegerField(default=0)
+    transaction_count = models.PositiveIntegerField(default=0)  # All transactions, including zero amounts
+    expense_m2 = models.FloatField(default=0, help_text="Sum of squared deviations of expenses from their mean (Welford's M2)")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'month']),
+            models.Index(fields=['user', 'account', 'month']),
+        ]
+
+    def __str__(self):
+        return f"{self.account} - {self.category} - {self.month:%Y-%m} ({self.week_day})"
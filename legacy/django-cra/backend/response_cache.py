@@ -0,0 +1,118 @@
+"""
+Per-user response caching keyed on a data version.
+
+Every user has a data version in the cache. Anything that changes what the
+read-only endpoints would return (imports, recategorization, category, rule
+and account changes, deletes) calls bump_data_version, which makes every
+cached response of that user unreachable at once, with no need to know which
+entries exist.
+
+Responses of views wrapped in cached_response are stored under
+(view, user, data version, date, query parameters) and carry an ETag derived
+from that key; a request whose If-None-Match matches is answered 304 without
+running the view or reading the cache.
+"""
+
+import functools
+import hashlib
+import time
+from datetime import date
+from typing import Iterable
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from rest_framework.response import Response
+
+from .models import Account, Category, CategorizationRule
+
+CACHE_SECONDS = getattr(settings, 'RESPONSE_CACHE_SECONDS', 60 * 60)
+
+
+def _version_key(user_id: int) -> str:
+    return f'data_version:{user_id}'
+
+
+def get_data_version(user_id: int) -> int:
+    """Current data version of a user (created on first use)."""
+    # Seeded from the clock so a restarted local-memory cache never reuses an old version
+    return cache.get_or_set(_version_key(user_id), time.time_ns(), None)
+
+
+def bump_data_version(user_ids: Iterable[int]) -> None:
+    """Invalidate every cached response of these users once the current transaction commits."""
+    user_ids = set(user_ids)
+
+    def bump():
+        for user_id in user_ids:
+            try:
+                cache.incr(_version_key(user_id))
+            except ValueError:
+                cache.set(_version_key(user_id), time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def user_cache_key(prefix: str, user_id: int, *parts) -> str:
+    """Cache key scoped to a user's current data version."""
+    digest = hashlib.sha1(repr(parts).encode()).hexdigest()
+    return f'{prefix}:{user_id}:{get_data_version(user_id)}:{digest}'
+
+
+def _cacheable(response):
+    # DRF responses are stored unrendered so content negotiation still applies; plain ones as bytes
+    if isinstance(response, Response):
+        return ('data', response.data)
+    return ('content', response.content, response['Content-Type'])
+
+
+def _from_cache(cached):
+    if cached[0] == 'data':
+        return Response(cached[1])
+    return HttpResponse(cached[1], content_type=cached[2])
+
+
+def cached_response(view):
+    """
+    Cache successful responses of a GET function view per user and data version, with ETag/304 support.
+
+    Apply below @api_view/@permission_classes so request.user is authenticated.
+    The current date is part of the key because the views default their ranges to "today".
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        params = sorted(request.GET.lists())
+        key = user_cache_key(f'response:{view.__name__}', request.user.id, date.today().isoformat(), params, args, kwargs)
+        etag = '"{}"'.format(hashlib.sha1(key.encode()).hexdigest())
+
+        if etag in request.headers.get('If-None-Match', ''):
+            response = Response(status=304)
+        else:
+            cached = cache.get(key)
+            if cached is None:
+                response = view(request, *args, **kwargs)
+                if response.status_code != 200:
+                    return response
+                cache.set(key, _cacheable(response), CACHE_SECONDS)
+            else:
+                response = _from_cache(cached)
+
+        response['ETag'] = etag
+        # Let the browser keep the response but revalidate it on every use
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+
+    return wrapper
+
+
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=CategorizationRule)
+@receiver(post_delete, sender=CategorizationRule)
+def _user_data_changed(sender, instance, **kwargs):
+    bump_data_version([instance.user_id])
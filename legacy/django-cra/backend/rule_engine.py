@@ -0,0 +1,333 @@
+"""
+Compiled categorization rules.
+
+User rules are parsed once into ready-to-evaluate matchers and cached per user,
+keyed on a version stamp of the user's rules. Categorizing a batch of
+transactions then costs one cheap stamp query instead of re-querying,
+re-splitting and re-compiling every rule for every transaction.
+"""
+
+import re
+import json
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from django.db.models import Count, Max
+
+from .aho_corasick import AhoCorasick
+from .merchants import extract_merchant_name, merchant_key
+from .models import CategorizationRule
+
+
+def _parse_date(value) -> Optional[date]:
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_float(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class PreparedTransaction:
+    """
+    Per-transaction values shared by every matcher of a rule set, so the
+    description is uppercased and the merchant extracted at most once.
+    The uppercased merchant comes from the stored Transaction.merchant_key
+    when the transaction has one.
+    """
+
+    __slots__ = ('transaction', 'description', 'description_upper', 'amount', 'date',
+                 'is_recurring', '_merchant', '_merchant_upper')
+
+    def __init__(self, transaction, is_recurring: Optional[Callable] = None):
+        self.transaction = transaction
+        self.description = transaction.description
+        self.description_upper = self.description.upper()
+        self.amount = abs(float(transaction.amount))
+        self.date = transaction.date
+        self.is_recurring = is_recurring
+        self._merchant = None
+        self._merchant_upper = getattr(transaction, 'merchant_key', None) or None
+
+    @property
+    def merchant(self) -> str:
+        if self._merchant is None:
+            self._merchant = extract_merchant_name(self.description)
+        return self._merchant
+
+    @property
+    def merchant_upper(self) -> str:
+        if self._merchant_upper is None:
+            self._merchant_upper = merchant_key(self.description)
+        return self._merchant_upper
+
+
+def _never(prepared: PreparedTransaction) -> bool:
+    return False
+
+
+class CompiledRule:
+    """A single categorization rule pre-parsed into a matcher function."""
+
+    def __init__(self, rule: CategorizationRule):
+        self.rule = rule
+        self.rule_id = rule.id
+        self.category = rule.category
+        self.is_subcategory_rule = rule.category.parent_id is not None
+        self.matcher = self._compile(rule)
+
+    def matches(self, prepared: PreparedTransaction) -> bool:
+        return self.matcher(prepared)
+
+    def _compile(self, rule: CategorizationRule) -> Callable[[PreparedTransaction], bool]:
+        compiler = getattr(self, f'_compile_{rule.rule_type}', None)
+        if compiler is None:
+            return _never
+        return compiler(rule)
+
+    # Description rules
+
+    def _compile_keyword(self, rule):
+        keywords = [k.strip() for k in rule.pattern.split(',')]
+        if rule.case_sensitive:
+            return lambda p: any(keyword in p.description for keyword in keywords)
+        keywords = [k.upper() for k in keywords]
+        return lambda p: any(keyword in p.description_upper for keyword in keywords)
+
+    def _compile_contains(self, rule):
+        if rule.case_sensitive:
+            pattern = rule.pattern
+            return lambda p: pattern in p.description
+        pattern = rule.pattern.upper()
+        return lambda p: pattern in p.description_upper
+
+    def _compile_exact(self, rule):
+        if rule.case_sensitive:
+            pattern = rule.pattern
+            return lambda p: p.description == pattern
+        pattern = rule.pattern.upper()
+        return lambda p: p.description_upper == pattern
+
+    def _compile_regex(self, rule):
+        try:
+            regex = re.compile(rule.pattern, 0 if rule.case_sensitive else re.IGNORECASE)
+        except re.error:
+            return _never
+        return lambda p: regex.search(p.description) is not None
+
+    def _compile_merchant(self, rule):
+        if rule.case_sensitive:
+            pattern = rule.pattern
+            return lambda p: pattern in p.merchant
+        pattern = rule.pattern.upper()
+        return lambda p: pattern in p.merchant_upper
+
+    # Amount rules
+
+    def _compile_amount_range(self, rule):
+        try:
+            range_data = json.loads(rule.pattern)
+            min_amount = range_data.get('min', 0)
+            max_amount = range_data.get('max', float('inf'))
+        except (json.JSONDecodeError, AttributeError):
+            return _never
+        return lambda p: min_amount <= p.amount <= max_amount
+
+    def _compile_amount_exact(self, rule):
+        target_amount = _parse_float(rule.pattern)
+        if target_amount is None:
+            return _never
+        return lambda p: abs(p.amount - target_amount) < 0.01
+
+    def _compile_amount_greater(self, rule):
+        min_amount = _parse_float(rule.pattern)
+        if min_amount is None:
+            return _never
+        return lambda p: p.amount > min_amount
+
+    def _compile_amount_less(self, rule):
+        max_amount = _parse_float(rule.pattern)
+        if max_amount is None:
+            return _never
+        return lambda p: p.amount < max_amount
+
+    # Date rules
+
+    def _compile_date_range(self, rule):
+        try:
+            range_data = json.loads(rule.pattern)
+            start_date = _parse_date(range_data.get('start', ''))
+            end_date = _parse_date(range_data.get('end', ''))
+        except (json.JSONDecodeError, AttributeError):
+            return _never
+        if start_date is None or end_date is None:
+            return _never
+        return lambda p: start_date <= p.date <= end_date
+
+    def _compile_day_of_week(self, rule):
+        try:
+            target_days = frozenset(int(d) for d in rule.pattern.split(','))  # 0=Monday, 6=Sunday
+        except ValueError:
+            return _never
+        return lambda p: p.date.weekday() in target_days
+
+    # Other rules
+
+    def _compile_recurring(self, rule):
+        return lambda p: p.is_recurring is not None and p.is_recurring(p.transaction)
+
+    def _compile_combined(self, rule):
+        conditions = rule.conditions or {}
+        operator = str(conditions.get('operator', 'AND')).upper()
+        checks = []
+
+        if 'description_contains' in conditions:
+            if rule.case_sensitive:
+                text = conditions['description_contains']
+                checks.append(lambda p: text in p.description)
+            else:
+                text_upper = conditions['description_contains'].upper()
+                checks.append(lambda p: text_upper in p.description_upper)
+
+        if 'description_regex' in conditions:
+            try:
+                regex = re.compile(conditions['description_regex'], 0 if rule.case_sensitive else re.IGNORECASE)
+                checks.append(lambda p: regex.search(p.description) is not None)
+            except re.error:
+                checks.append(_never)
+
+        amount_checks = [
+            ('amount_min', lambda target: (lambda p: p.amount >= target)),
+            ('amount_max', lambda target: (lambda p: p.amount <= target)),
+            ('amount_exact', lambda target: (lambda p: abs(p.amount - target) < 0.01)),
+        ]
+        for key, build in amount_checks:
+            if key in conditions:
+                target = _parse_float(conditions[key])
+                checks.append(_never if target is None else build(target))
+
+        date_checks = [
+            ('date_after', lambda target: (lambda p: p.date >= target)),
+            ('date_before', lambda target: (lambda p: p.date <= target)),
+        ]
+        for key, build in date_checks:
+            if key in conditions:
+                target = _parse_date(conditions[key])
+                checks.append(_never if target is None else build(target))
+
+        if not checks:
+            return _never
+        if operator == 'OR':
+            return lambda p: any(check(p) for check in checks)
+        return lambda p: all(check(p) for check in checks)
+
+
+class CompiledRuleSet:
+    """
+    All active rules of one user, compiled and ordered by priority.
+
+    Substring rules (``keyword``, ``contains`` and ``merchant``) are folded
+    into Aho-Corasick automata, so a single pass over the description (and
+    merchant name) finds every one of them that matches.
+    """
+
+    def __init__(self, rules: List[CategorizationRule], version: Tuple = ()):
+        self.version = version
+        # Only rules pointing at subcategories can categorize a transaction
+        self.rules = [compiled for compiled in map(CompiledRule, rules) if compiled.is_subcategory_rule]
+        self._automata: Dict[str, AhoCorasick] = {}  # PreparedTransaction attribute -> automaton
+        self._automaton_rules = set()  # Indexes of rules evaluated through the automata
+        for index, compiled in enumerate(self.rules):
+            self._add_to_automata(index, compiled.rule)
+        for automaton in self._automata.values():
+            automaton.build()
+
+    def __len__(self):
+        return len(self.rules)
+
+    def _add_to_automata(self, index: int, rule: CategorizationRule) -> None:
+        if rule.rule_type == 'keyword':
+            patterns = [k.strip() for k in rule.pattern.split(',')]
+            source = 'description'
+        elif rule.rule_type == 'contains':
+            patterns = [rule.pattern]
+            source = 'description'
+        elif rule.rule_type == 'merchant':
+            patterns = [rule.pattern]
+            source = 'merchant'
+        else:
+            return
+
+        # An empty pattern matches everything; leave such rules to their own matcher
+        if not all(patterns):
+            return
+
+        if not rule.case_sensitive:
+            patterns = [pattern.upper() for pattern in patterns]
+            source = f'{source}_upper'
+
+        automaton = self._automata.setdefault(source, AhoCorasick())
+        for pattern in patterns:
+            automaton.add(pattern, index)
+        self._automaton_rules.add(index)
+
+    def match(self, prepared: PreparedTransaction) -> Optional[CompiledRule]:
+        """Return the highest-priority rule matching the transaction."""
+        hits = set()
+        for source, automaton in self._automata.items():
+            hits.update(automaton.find_values(getattr(prepared, source)))
+
+        for index, compiled in enumerate(self.rules):
+            if index in self._automaton_rules:
+                if index in hits:
+                    return compiled
+            elif compiled.matches(prepared):
+                return compiled
+        return None
+
+
+# user_id -> CompiledRuleSet, reused for as long as the user's rules version is unchanged
+_rule_set_cache: Dict[int, CompiledRuleSet] = {}
+
+
+def get_rules_version(user_id: int) -> Tuple:
+    """
+    Cheap version stamp of a user's rules.
+
+    Any rule create/update/delete changes the count or the latest
+    ``updated_at``; recategorizing a rule's target category bumps the
+    category's ``updated_at``. Match statistics are saved with
+    ``update_fields`` and therefore do not invalidate the stamp.
+    """
+    stamp = CategorizationRule.objects.filter(user_id=user_id).aggregate(
+        count=Count('id'),
+        rules_updated=Max('updated_at'),
+        categories_updated=Max('category__updated_at'),
+    )
+    return (stamp['count'], stamp['rules_updated'], stamp['categories_updated'])
+
+
+def get_compiled_rule_set(user_id: int) -> CompiledRuleSet:
+    """Return the compiled rule set for a user, recompiling only if their rules changed."""
+    version = get_rules_version(user_id)
+    rule_set = _rule_set_cache.get(user_id)
+    if rule_set is None or rule_set.version != version:
+        rules = (
+            CategorizationRule.objects
+            .filter(user_id=user_id, is_active=True)
+            .select_related('category')
+            .order_by('-priority')
+        )
+        rule_set = CompiledRuleSet(list(rules), version=version)
+        _rule_set_cache[user_id] = rule_set
+    return rule_set
+
+
+def clear_rule_set_cache() -> None:
+    """Forget every compiled rule set (e.g. after the database was replaced)."""
+    _rule_set_cache.clear()
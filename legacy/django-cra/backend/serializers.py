@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Transaction, Category, CategorizationRule, RuleGroup, RuleUsage, BackupSettings, DatabaseBackup
+from .models import Transaction, Category, CategoryClosure, CategorizationRule, RuleGroup, RuleUsage, BackupSettings, DatabaseBackup
 
 class TransactionSerializer(serializers.ModelSerializer):
     account_name = serializers.CharField(source='account.name', read_only=True)
@@ -32,6 +32,13 @@ class CategorySerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['created_at', 'updated_at']
     
+    def validate_parent(self, value):
+        """Reject moving a category under itself or one of its subcategories"""
+        if value is not None and self.instance is not None:
+            if CategoryClosure.objects.filter(ancestor_id=self.instance.pk, descendant_id=value.pk).exists():
+                raise serializers.ValidationError("A category cannot be moved under itself or one of its subcategories")
+        return value
+    
     def get_subcategories(self, obj):
         """Get immediate subcategories (not recursive)"""
         subcategories = obj.subcategories.filter(is_active=True)
@@ -258,4 +258,18 @@ SIMPLE_JWT = {
     'SIGNING_KEY': SECRET_KEY,
     'AUTH_HEADER_TYPES': ('Bearer',),
     'AUTH_TOKEN_CLASSES': ('rest_framework_simplejwt.tokens.AccessToken',),
-}
\ No newline at end of file
+}
+
+# Background statement imports
+IMPORT_WORKER_THREADS = int(os.environ.get('IMPORT_WORKER_THREADS', '4'))
+IMPORT_STREAMING_THRESHOLD_BYTES = int(os.environ.get('IMPORT_STREAMING_THRESHOLD_BYTES', str(5 * 1024 * 1024)))
+
+# Per-user response cache (dashboard, visualizations, category tree). Data changes invalidate entries;
+# RESPONSE_CACHE_SECONDS only bounds how long an unused entry is kept
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'myfinance',
+    }
+}
+RESPONSE_CACHE_SECONDS = int(os.environ.get('RESPONSE_CACHE_SECONDS', str(60 * 60)))
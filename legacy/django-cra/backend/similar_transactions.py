@@ -0,0 +1,126 @@
+"""
+Similar-transaction lookups on the indexed Transaction.similarity_key.
+
+Transactions are similar when they share a similarity key (see
+merchants.similarity_key). Instead of scanning descriptions per
+transaction, the index loads, for a batch of keys, one aggregated row per
+(key, account, amount, category) from the (user, similarity_key) index and
+answers every recurring-payment and neighbour-category question of the
+batch from memory. Bulk runs prefetch each chunk of transactions with one
+query, so their cost grows with the chunk, not with the table.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from django.db.models import Count
+
+from .merchants import similarity_key
+from .models import Category, Transaction
+
+CENTS = Decimal('0.01')
+
+# (account_id, amount, category_id, count) per distinct combination
+Group = Tuple[int, Decimal, Optional[int], int]
+
+
+def _amount(value) -> Decimal:
+    return Decimal(str(value)).quantize(CENTS)
+
+
+def _key(transaction) -> str:
+    return transaction.similarity_key or similarity_key(transaction.description)
+
+
+class SimilarTransactionIndex:
+    """
+    Neighbour statistics of transactions, cached per (user, similarity key).
+
+    Lookups load missing keys on demand; bulk callers call prefetch() with a
+    whole chunk first and clear() after writing categories back.
+    """
+
+    def __init__(self):
+        self._groups: Dict[Tuple[int, str], List[Group]] = {}
+        self._categories: Dict[int, Category] = {}
+
+    def clear(self) -> None:
+        """Forget loaded neighbours (call after categories were written)."""
+        self._groups.clear()
+
+    def prefetch(self, transactions: Iterable[Transaction]) -> None:
+        """Load the neighbours of all given transactions, one query per user."""
+        missing = defaultdict(set)
+        for transaction in transactions:
+            key = _key(transaction)
+            if key and (transaction.user_id, key) not in self._groups:
+                missing[transaction.user_id].add(key)
+
+        category_ids = set()
+        for user_id, keys in missing.items():
+            for key in keys:
+                self._groups[(user_id, key)] = []
+            rows = (
+                Transaction.objects.filter(user_id=user_id, similarity_key__in=keys)
+                .values('similarity_key', 'account_id', 'amount', 'category_id')
+                .annotate(count=Count('id'))
+                .order_by()
+                .values_list('similarity_key', 'account_id', 'amount', 'category_id', 'count')
+            )
+            for key, account_id, amount, category_id, count in rows:
+                self._groups[(user_id, key)].append((account_id, _amount(amount), category_id, count))
+                if category_id is not None:
+                    category_ids.add(category_id)
+
+        category_ids -= self._categories.keys()
+        if category_ids:
+            self._categories.update(Category.objects.in_bulk(category_ids))
+
+    def _neighbours(self, transaction) -> List[Group]:
+        key = _key(transaction)
+        if not key:
+            return []
+        if (transaction.user_id, key) not in self._groups:
+            self.prefetch([transaction])
+        return self._groups[(transaction.user_id, key)]
+
+    def _own_group(self, transaction) -> Optional[Tuple]:
+        # A stored transaction is counted among its own neighbours; callers subtract it
+        if transaction.pk is None or transaction._state.adding:
+            return None
+        return (transaction.account_id, _amount(transaction.amount), transaction.category_id)
+
+    def count_similar(self, transaction, same_account: bool = True, same_amount: bool = False) -> int:
+        """Number of other transactions sharing the similarity key (and account/amount if asked)."""
+        amount = _amount(transaction.amount)
+        total = sum(
+            count for account_id, group_amount, _, count in self._neighbours(transaction)
+            if (not same_account or account_id == transaction.account_id)
+            and (not same_amount or group_amount == amount)
+        )
+        if total and self._own_group(transaction) is not None:
+            total -= 1
+        return total
+
+    def category_counts(self, transaction, same_account: bool = False) -> List[Tuple[Category, int]]:
+        """
+        Categories of the other categorized transactions sharing the similarity key.
+
+        Returns:
+            (Category, count) pairs, most frequent first
+        """
+        counts = defaultdict(int)
+        for account_id, _, category_id, count in self._neighbours(transaction):
+            if category_id is not None and (not same_account or account_id == transaction.account_id):
+                counts[category_id] += count
+
+        own = self._own_group(transaction)
+        if own is not None and own[2] in counts:
+            counts[own[2]] -= 1
+
+        ranked = sorted(
+            (item for item in counts.items() if item[1] > 0),
+            key=lambda item: (-item[1], item[0])
+        )
+        return [(self._categories[category_id], count) for category_id, count in ranked if category_id in self._categories]
@@ -0,0 +1,147 @@
+"""
+Keyset-paginated, column-projected transaction listing.
+
+Pages are ordered newest first on ``(date, id)`` and continue from an opaque
+cursor holding the last row's key, so fetching a page costs one indexed range
+scan of ``limit + 1`` rows no matter how deep into the history it is (OFFSET
+pagination would scan and discard every earlier row).
+
+Rows are read with ``.values()`` over only the requested fields, joining the
+account and category tables in the same query, and rendered with the
+TransactionSerializer field representations, so the output matches the
+serializer without building model instances.
+"""
+
+import base64
+import binascii
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from django.db.models import Q
+from rest_framework.relations import RelatedField
+
+from .serializers import TransactionSerializer
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Serializer field -> lookup passed to QuerySet.values()
+FIELD_LOOKUPS: Dict[str, str] = {
+    'id': 'id',
+    'date': 'date',
+    'description': 'description',
+    'amount': 'amount',
+    'source': 'source',
+    'account': 'account_id',
+    'account_name': 'account__name',
+    'category': 'category_id',
+    'category_name': 'category__name',
+    'auto_categorized': 'auto_categorized',
+    'confidence_score': 'confidence_score',
+    'suggested_category': 'suggested_category_id',
+    'suggested_category_name': 'suggested_category__name',
+}
+
+
+def _representation(field):
+    # values() already yields the primary key of related objects
+    if isinstance(field, RelatedField):
+        return lambda pk: pk
+    return field.to_representation
+
+
+_SERIALIZER_FIELDS = TransactionSerializer().fields
+_REPRESENTATIONS = {name: _representation(field) for name, field in _SERIALIZER_FIELDS.items()}
+# The serializer omits fields sourced through a null relation (category.name of an uncategorized row)
+_OMITTED_WHEN_NULL = {name for name, field in _SERIALIZER_FIELDS.items() if '.' in field.source}
+
+
+class InvalidPageRequest(ValueError):
+    """Raised for an unknown field name, a malformed cursor or a bad page size."""
+
+
+def parse_fields(value: Optional[str]) -> List[str]:
+    """Split a comma separated ``fields`` parameter; empty means every serializer field."""
+    if not value:
+        return list(FIELD_LOOKUPS)
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in FIELD_LOOKUPS]
+    if unknown:
+        raise InvalidPageRequest(f"Unknown field(s): {', '.join(unknown)}")
+    return fields
+
+
+def parse_limit(value: Optional[str]) -> int:
+    if not value:
+        return DEFAULT_PAGE_SIZE
+    try:
+        limit = int(value)
+    except ValueError:
+        raise InvalidPageRequest("limit must be an integer")
+    if limit < 1:
+        raise InvalidPageRequest("limit must be positive")
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def encode_cursor(row_date: date, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{row_date.isoformat()}|{row_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        row_date, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return date.fromisoformat(row_date), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidPageRequest("Invalid cursor")
+
+
+def serialize_rows(queryset, fields: Sequence[str]) -> List[dict]:
+    """Render ``fields`` of every row like TransactionSerializer, reading only those columns."""
+    lookups = [FIELD_LOOKUPS[name] for name in fields]
+    representations = [_REPRESENTATIONS[name] for name in fields]
+    rows = []
+    for values in queryset.values_list(*lookups):
+        row = {}
+        for name, represent, value in zip(fields, representations, values):
+            if value is not None:
+                row[name] = represent(value)
+            elif name not in _OMITTED_WHEN_NULL:
+                row[name] = None
+        rows.append(row)
+    return rows
+
+
+def transaction_page(queryset, fields: Sequence[str], limit: int, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    One page of transactions, newest first.
+
+    Args:
+        queryset: Filtered Transaction QuerySet (ordering is replaced)
+        fields: Serializer field names to include
+        limit: Page size
+        cursor: next_cursor of the previous page, or None for the first page
+
+    Returns:
+        Tuple of (rows, next_cursor); next_cursor is None on the last page
+    """
+    queryset = queryset.order_by('-date', '-id')
+    if cursor:
+        after_date, after_id = decode_cursor(cursor)
+        queryset = queryset.filter(Q(date__lt=after_date) | Q(date=after_date, id__lt=after_id))
+
+    # The key columns are always read so the cursor can be built, then dropped if not requested
+    keyed_fields = list(dict.fromkeys([*fields, 'date', 'id']))
+    rows = serialize_rows(queryset[:limit + 1], keyed_fields)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(date.fromisoformat(last['date']), last['id'])
+
+    extra = set(keyed_fields) - set(fields)
+    if extra:
+        for row in rows:
+            for name in extra:
+                row.pop(name, None)
+    return rows, next_cursor
@@ -0,0 +1,177 @@
+"""
+Server-side filtering of the transaction list.
+
+Every filter maps onto an indexed column: (user, date), (user, account, date)
+and (user, category) composite indexes cover the structured filters, and the
+description search goes through the FTS5 table on SQLite or the pg_trgm index
+on PostgreSQL (see description_index).
+"""
+
+import re
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+from .description_index import FTS_TABLE, has_fts_index
+from .merchants import merchant_key
+
+_SEARCH_TOKEN = re.compile(r'\w+')
+
+# Searches matching at most this many rows (across all users) are resolved to an id list first
+SELECTIVE_MATCH_LIMIT = 2000
+
+_TRUE_VALUES = ('1', 'true', 'yes')
+_FALSE_VALUES = ('0', 'false', 'no')
+
+
+class InvalidFilter(ValueError):
+    """Raised for a malformed filter parameter."""
+
+
+def search_terms(text: str) -> List[str]:
+    """Words of a search string; each must occur in the description."""
+    return _SEARCH_TOKEN.findall(text)
+
+
+def _contains_all(queryset, terms: List[str]):
+    for term in terms:
+        queryset = queryset.filter(description__icontains=term)
+    return queryset
+
+
+def description_search(queryset, text: str):
+    """
+    Restrict ``queryset`` to descriptions containing every search term.
+
+    Other databases use one ``icontains`` per term, which PostgreSQL serves
+    from the trigram index, so a term matches anywhere in the description.
+    SQLite answers from the FTS5 index, which only matches terms at the start
+    of a word; when that finds nothing the search falls back to
+    ``icontains``, so "BUCKS" still finds "STARBUCKS". When some description
+    has a word starting with every term, SQLite returns only those.
+    """
+    terms = search_terms(text)
+    if not terms:
+        return queryset
+    if not has_fts_index(connection):
+        return _contains_all(queryset, terms)
+
+    match = ' '.join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+    matches_sql = f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s"
+    with connection.cursor() as cursor:
+        cursor.execute(f"{matches_sql} LIMIT %s", [match, SELECTIVE_MATCH_LIMIT + 1])
+        ids = [row[0] for row in cursor.fetchall()]
+    if not ids:
+        # No word starts with a term; it may still occur inside one
+        return _contains_all(queryset, terms)
+    if len(ids) <= SELECTIVE_MATCH_LIMIT:
+        # Few matches: look them up by primary key instead of walking the date index past non-matches
+        return queryset.filter(id__in=ids)
+    return queryset.filter(id__in=RawSQL(matches_sql, [match]))
+
+
+def same_description(queryset, description: str):
+    """
+    Restrict ``queryset`` to transactions whose description equals ``description``.
+
+    The match is located through the (user, merchant_key) index: equal
+    descriptions share a merchant key, so only that merchant's rows are compared.
+    """
+    return queryset.filter(merchant_key=merchant_key(description), description=description)
+
+
+def _parse_date(params, name: str) -> Optional[date]:
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise InvalidFilter(f"{name} must be a YYYY-MM-DD date")
+
+
+def _parse_decimal(params, name: str) -> Optional[Decimal]:
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        result = Decimal(value)
+    except InvalidOperation:
+        raise InvalidFilter(f"{name} must be a number")
+    if not result.is_finite():
+        raise InvalidFilter(f"{name} must be a finite number")
+    return result
+
+
+def _parse_int(params, name: str) -> Optional[int]:
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidFilter(f"{name} must be an integer id")
+
+
+def _parse_bool(params, name: str) -> Optional[bool]:
+    value = params.get(name)
+    if not value:
+        return None
+    value = value.lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise InvalidFilter(f"{name} must be true or false")
+
+
+def filter_transactions(queryset, params):
+    """
+    Apply the transaction list query parameters to ``queryset``.
+
+    Supported parameters:
+        q: Description search; every word must occur in the description (on SQLite,
+            word-prefix matches take precedence, see description_search)
+        min_amount / max_amount: Inclusive amount range
+        start_date / end_date: Inclusive date range (YYYY-MM-DD)
+        account: Account id
+        category: Category id; subcategories are included
+        uncategorized: 'true' for transactions without a category
+        auto_categorized: 'true' or 'false'
+    """
+    start_date = _parse_date(params, 'start_date')
+    end_date = _parse_date(params, 'end_date')
+    if start_date:
+        queryset = queryset.filter(date__gte=start_date)
+    if end_date:
+        queryset = queryset.filter(date__lte=end_date)
+
+    min_amount = _parse_decimal(params, 'min_amount')
+    max_amount = _parse_decimal(params, 'max_amount')
+    if min_amount is not None:
+        queryset = queryset.filter(amount__gte=min_amount)
+    if max_amount is not None:
+        queryset = queryset.filter(amount__lte=max_amount)
+
+    account_id = _parse_int(params, 'account')
+    if account_id is not None:
+        queryset = queryset.filter(account_id=account_id)
+
+    category_id = _parse_int(params, 'category')
+    if category_id is not None:
+        # The closure table pairs every category with itself, so this also matches the category itself
+        queryset = queryset.filter(category__ancestor_links__ancestor_id=category_id)
+
+    if _parse_bool(params, 'uncategorized'):
+        queryset = queryset.filter(category__isnull=True)
+
+    auto_categorized = _parse_bool(params, 'auto_categorized')
+    if auto_categorized is not None:
+        queryset = queryset.filter(auto_categorized=auto_categorized)
+
+    if params.get('q'):
+        queryset = description_search(queryset, params['q'])
+    return queryset
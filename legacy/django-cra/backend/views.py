@@ -8,13 +8,26 @@ from django.conf import settings
 from django.conf.urls.static import static
 import pandas as pd
 import os
+from django.db import transaction as db_transaction
 import json
 from django.db.models.functions import TruncMonth
 from .models import Account
 from django.views.decorators.csrf import csrf_exempt
 
-from backend.models import Transaction, Category, TDTransaction, AmexTransaction, ScotiabankTransaction, CategorizationRule, RuleUsage, RuleGroup, DatabaseBackup, BackupSettings  # ✅ Import all models
+from backend.models import Transaction, Category, TDTransaction, AmexTransaction, ScotiabankTransaction, CategorizationRule, RuleUsage, RuleGroup, DatabaseBackup, BackupSettings, ImportJob, ImportJobFile  # ✅ Import all models
 from backend.serializers import TransactionSerializer, CategorySerializer  # ✅ Import Serializer
+from backend.ingestion import ingest_file, UnsupportedFileType
+from backend.import_jobs import enqueue_import_job
+from backend.rollups import refresh_spending_rollup, slices_for_queryset, spending_groups
+from backend.balance_history import DEFAULT_MAX_POINTS, balance_history
+from backend.account_balances import verify_account_balances
+from backend.response_cache import cached_response
+from backend.category_tree import cached_category_tree
+from backend.category_classifier import record_categorization
+from backend.merchant_stats import merchant_totals, top_merchants
+from backend.amount_stats import category_expense_stats, find_unusual_transactions
+from backend.transaction_search import InvalidFilter, filter_transactions, same_description
+from backend.transaction_pages import InvalidPageRequest, parse_fields, parse_limit, serialize_rows, transaction_page
 
 UPLOAD_DIR = "uploads/"
 
@@ -48,65 +61,25 @@ def upload_file(request):
     except Account.DoesNotExist:
         return Response({"error": f"Account '{account_name}' not found for bank '{bank}'"}, status=400)
 
+    # Optional "stream" flag forces (true) or disables (false) chunked import; by default large files stream
+    stream = request.POST.get('stream')
+    if stream is not None:
+        stream = stream.lower() in ('1', 'true', 'yes')
+
     # Save file to local directory
-    file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-    default_storage.save(file_path, uploaded_file)
+    file_path = default_storage.path(default_storage.save(os.path.join(UPLOAD_DIR, uploaded_file.name), uploaded_file))
 
-    df = None
     try:
-        if file_type == "TD":
-            # Read TD CSV and detect if headers are present
-            df = pd.read_csv(file_path)
-            # Clean column names
-            df.columns = df.columns.str.strip()
-            
-            # Check if this is the headerless format (DATE, DESCRIPTION, CREDIT, DEBIT, BALANCE)
-            # Look for patterns that indicate headerless format:
-            # 1. 5 columns
-            # 2. First column looks like a date (MM/DD/YYYY format)
-            # 3. Second column looks like a description (not a typical header word)
-            is_headerless = (
-                len(df.columns) == 5 and 
-                str(df.columns[0]).count('/') == 2 and  # Date format MM/DD/YYYY
-                not any(header_word in str(df.columns[1]).upper() for header_word in ['DESCRIPTION', 'MERCHANT'])
-            )
-            
-            if is_headerless:
-                # This is a headerless file, assign proper column names
-                df.columns = ['DATE', 'DESCRIPTION', 'CREDIT', 'DEBIT', 'BALANCE']
-                process_td_data_headerless(df, account)
-            else:
-                # This is the standard format with headers
-                process_td_data(df, account)
-        elif file_type == "Amex":
-            # Try different encodings for Amex files
-            try:
-                df = pd.read_excel(file_path, skiprows=11)
-            except (UnicodeDecodeError, Exception) as e:
-                # If Excel reading fails due to encoding, try reading as CSV with different encodings
-                print(f"Excel read failed: {e}, trying CSV with different encodings")
-                try:
-                    df = pd.read_csv(file_path, skiprows=11, encoding='latin-1')
-                except UnicodeDecodeError:
-                    try:
-                        df = pd.read_csv(file_path, skiprows=11, encoding='cp1252')
-                    except UnicodeDecodeError:
-                        df = pd.read_csv(file_path, skiprows=11, encoding='iso-8859-1')
-            
-                df.columns = df.columns.str.lower().str.replace(' ', '_')
-                df.rename(columns={'exchange_rate': 'exc_rate'}, inplace=True)
-                process_amex_data(df, account, request.user)
-            elif file_type == "Scotiabank":
-                # Read Scotiabank CSV
-                df = pd.read_csv(file_path)
-                # Clean column names
-                df.columns = df.columns.str.strip()
-                process_scotiabank_data(df, account, request.user)
-        else:
-            return Response({"error": "Unsupported file type"}, status=400)
-
-        if df is not None:
-            return Response({"message": f"{file_type} file uploaded successfully", "rows_processed": len(df)})
+        result = ingest_file(file_path, file_type, account, request.user, stream=stream)
+        return Response({
+            "message": f"{file_type} file uploaded successfully",
+            "rows_processed": result['rows_inserted'],
+            "duplicates_skipped": result['duplicates_skipped'],
+            "rows_per_second": result['rows_per_second'],
+            "peak_rss_mb": result['peak_rss_mb']
+        })
+    except UnsupportedFileType:
+        return Response({"error": "Unsupported file type"}, status=400)
     except Exception as e:
         return Response({"error": f"Error processing file: {str(e)}"}, status=500)
     finally:
@@ -114,12 +87,15 @@ def upload_file(request):
         if os.path.exists(file_path):
             os.remove(file_path)
 
-    return Response({"error": "Failed to process file"}, status=500)
-
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def upload_multiple_files(request):
-    """Handles multiple CSV/XLS file uploads and inserts data into the database."""
+    """
+    Handles multiple CSV/XLS file uploads.
+
+    The files are stored and imported by a background job; the response carries
+    the job id, whose progress is reported by get_import_job_status.
+    """
     print(f"DEBUG: Request method: {request.method}")
     print(f"DEBUG: Request FILES: {request.FILES}")
     print(f"DEBUG: Request POST: {request.POST}")
@@ -146,332 +122,69 @@ def upload_multiple_files(request):
     except Account.DoesNotExist:
         return Response({"error": f"Account '{account_name}' not found for bank '{bank}'"}, status=400)
 
-    results = []
-    total_rows_processed = 0
-    successful_uploads = 0
-    failed_uploads = 0
-
-    for uploaded_file in uploaded_files:
-        file_result = {
-            "filename": uploaded_file.name,
-            "success": False,
-            "rows_processed": 0,
-            "error": None
-        }
-        
-        # Save file to local directory
-        file_path = os.path.join(UPLOAD_DIR, uploaded_file.name)
-        default_storage.save(file_path, uploaded_file)
+    # Store the files and hand them to a background import job
+    with db_transaction.atomic():
+        job = ImportJob.objects.create(user=request.user, account=account, file_type=file_type or '')
+        for uploaded_file in uploaded_files:
+            file_path = default_storage.save(os.path.join(UPLOAD_DIR, uploaded_file.name), uploaded_file)
+            ImportJobFile.objects.create(
+                job=job,
+                filename=uploaded_file.name,
+                file_path=default_storage.path(file_path),
+            )
+        enqueue_import_job(job)
 
-        df = None
-        try:
-            if file_type == "TD":
-                # Read TD CSV and detect if headers are present
-                df = pd.read_csv(file_path)
-                # Clean column names
-                df.columns = df.columns.str.strip()
-                
-                # Check if this is the headerless format (DATE, DESCRIPTION, CREDIT, DEBIT, BALANCE)
-                is_headerless = (
-                    len(df.columns) == 5 and 
-                    str(df.columns[0]).count('/') == 2 and  # Date format MM/DD/YYYY
-                    not any(header_word in str(df.columns[1]).upper() for header_word in ['DESCRIPTION', 'MERCHANT'])
-                )
-                
-                if is_headerless:
-                    # This is a headerless file, assign proper column names
-                    df.columns = ['DATE', 'DESCRIPTION', 'CREDIT', 'DEBIT', 'BALANCE']
-                    process_td_data_headerless(df, account, request.user)
-                else:
-                    # This is the standard format with headers
-                    process_td_data(df, account, request.user)
-            elif file_type == "Amex":
-                # Try different encodings for Amex files
-                try:
-                    df = pd.read_excel(file_path, skiprows=11)
-                except (UnicodeDecodeError, Exception) as e:
-                    print(f"Excel read failed: {e}, trying CSV with different encodings")
-                    try:
-                        df = pd.read_csv(file_path, skiprows=11, encoding='latin-1')
-                    except UnicodeDecodeError:
-                        try:
-                            df = pd.read_csv(file_path, skiprows=11, encoding='cp1252')
-                        except UnicodeDecodeError:
-                            df = pd.read_csv(file_path, skiprows=11, encoding='iso-8859-1')
-                
-                df.columns = df.columns.str.lower().str.replace(' ', '_')
-                df.rename(columns={'exchange_rate': 'exc_rate'}, inplace=True)
-                process_amex_data(df, account, request.user)
-            elif file_type == "Scotiabank":
-                # Read Scotiabank CSV
-                df = pd.read_csv(file_path)
-                # Clean column names
-                df.columns = df.columns.str.strip()
-                process_scotiabank_data(df, account, request.user)
-            else:
-                file_result["error"] = "Unsupported file type"
-                results.append(file_result)
-                failed_uploads += 1
-                continue
-
-            if df is not None:
-                file_result["success"] = True
-                file_result["rows_processed"] = len(df)
-                total_rows_processed += len(df)
-                successful_uploads += 1
-            else:
-                file_result["error"] = "Failed to process file"
-                failed_uploads += 1
-                
-        except Exception as e:
-            file_result["error"] = f"Error processing file: {str(e)}"
-            failed_uploads += 1
-        finally:
-            # Clean up the uploaded file
-            if os.path.exists(file_path):
-                os.remove(file_path)
-        
-        results.append(file_result)
+    return Response({
+        "message": f"Import queued: {len(uploaded_files)} file(s)",
+        "job_id": job.id,
+        "status_url": f"/api/transactions/import-jobs/{job.id}/",
+        "file_results": [
+            {"filename": uploaded_file.name, "status": "queued"}
+            for uploaded_file in uploaded_files
+        ]
+    }, status=202)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_import_job_status(request, job_id):
+    """Reports the progress of a background import job."""
+    try:
+        job = ImportJob.objects.get(id=job_id, user=request.user)
+    except ImportJob.DoesNotExist:
+        return Response({"error": "Import job not found"}, status=404)
+
+    file_results = [
+        {
+            "filename": job_file.filename,
+            "status": job_file.status,
+            "success": job_file.status == 'imported',
+            "rows_parsed": job_file.rows_parsed,
+            "rows_processed": job_file.rows_inserted,
+            "duplicates_skipped": job_file.duplicates_skipped,
+            "error": job_file.error or None
+        }
+        for job_file in job.files.all()
+    ]
+    successful_uploads = sum(1 for result in file_results if result["success"])
+    failed_uploads = sum(1 for result in file_results if result["status"] == 'failed')
 
     return Response({
-        "message": f"Upload completed: {successful_uploads} successful, {failed_uploads} failed",
-        "total_rows_processed": total_rows_processed,
+        "job_id": job.id,
+        "status": job.status,
+        "account": job.account.name,
+        "bank": job.account.bank,
+        "total_rows_processed": job.rows_inserted,
+        "duplicates_skipped": job.duplicates_skipped,
         "successful_uploads": successful_uploads,
         "failed_uploads": failed_uploads,
-        "file_results": results
+        "categorization": job.categorization_stats,
+        "error": job.error or None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+        "file_results": file_results
     })
 
-def process_td_data(df, account, user):
-    """Process and insert TD data into the database."""
-    from datetime import datetime
-    
-    # Convert date column to proper format
-    def convert_date(date_str):
-        try:
-            return datetime.strptime(date_str, "%d %b %Y").strftime("%Y-%m-%d")
-        except ValueError:
-            return None
-    
-    df['Date'] = df['Date'].astype(str).apply(convert_date)
-    
-    # Process each row
-    for row in df.itertuples(index=False):
-        if row.Date is None:
-            continue  # Skip rows with invalid dates
-            
-        # Handle amount - TD files have a single Amount column
-        amount_str = str(row.Amount).replace('$', '').replace(',', '')
-        try:
-            amount = float(amount_str) if amount_str != 'nan' else 0.0
-        except ValueError:
-            amount = 0.0
-        
-        # Convert description to uppercase for consistency
-        description_upper = str(row.Description).upper()
-        
-        # Create TDTransaction record
-        TDTransaction.objects.create(
-            date=row.Date,
-            charge_name=description_upper,
-            credit_amt=amount if amount > 0 else None,
-            debit_amt=abs(amount) if amount < 0 else None,
-            balance=None  # Not available in this format
-        )
-        
-        # Create Transaction record with user
-        Transaction.objects.create(
-            user=user,
-            date=row.Date,
-            description=description_upper,
-            amount=amount,
-            source="TD",
-            account=account
-        )
-    
-    # Update account balance after processing all transactions
-    account.update_balance()
-
-def process_td_data_headerless(df, account, user):
-    """Process and insert TD data from headerless CSV format (DATE, DESCRIPTION, CREDIT, DEBIT, BALANCE)."""
-    from datetime import datetime
-    
-    # Convert date column to proper format (MM/DD/YYYY -> YYYY-MM-DD)
-    def convert_date(date_str):
-        try:
-            # Handle MM/DD/YYYY format
-            return datetime.strptime(str(date_str), "%m/%d/%Y").strftime("%Y-%m-%d")
-        except ValueError:
-            return None
-    
-    df['DATE'] = df['DATE'].astype(str).apply(convert_date)
-    
-    # Process each row
-    for row in df.itertuples(index=False):
-        if row.DATE is None or pd.isna(row.DATE):
-            continue  # Skip rows with invalid dates
-            
-        # Handle credit and debit amounts
-        credit_str = str(row.CREDIT).replace('$', '').replace(',', '') if not pd.isna(row.CREDIT) else '0'
-        debit_str = str(row.DEBIT).replace('$', '').replace(',', '') if not pd.isna(row.DEBIT) else '0'
-        
-        try:
-            credit_amount = float(credit_str) if credit_str != 'nan' and credit_str != '' else 0.0
-            debit_amount = float(debit_str) if debit_str != 'nan' and debit_str != '' else 0.0
-        except ValueError:
-            credit_amount = 0.0
-            debit_amount = 0.0
-        
-        # Calculate net amount (negative for charges/expenses, positive for payments/credits)
-        # In TD format: CREDIT column = charges (should be negative), DEBIT column = payments (should be positive)
-        net_amount = debit_amount - credit_amount
-        
-        # Convert description to uppercase for consistency
-        description_upper = str(row.DESCRIPTION).upper() if not pd.isna(row.DESCRIPTION) else ''
-        
-        # Skip empty rows
-        if not description_upper.strip():
-            continue
-        
-        # Create TDTransaction record
-        # In TD format: CREDIT column = charges (expenses), DEBIT column = payments (credits)
-        # TDTransaction: credit_amt = charges/expenses (negative amounts), debit_amt = payments/credits (positive amounts)
-        TDTransaction.objects.create(
-            date=row.DATE,
-            charge_name=description_upper,
-            credit_amt=credit_amount if credit_amount > 0 else None,  # CREDIT column = charges/expenses
-            debit_amt=debit_amount if debit_amount > 0 else None,  # DEBIT column = payments/credits
-            balance=None  # Balance column is ignored as requested
-        )
-        
-        # Create Transaction record with user
-        Transaction.objects.create(
-            user=user,
-            date=row.DATE,
-            description=description_upper,
-            amount=net_amount,
-            source="TD",
-            account=account
-        )
-    
-    # Update account balance after processing all transactions
-    account.update_balance()
-
-def process_amex_data(df, account, user):
-    """Process and insert Amex data into the database, ensuring correct formats."""
-    from datetime import datetime
-
-    # Convert 'date' and 'date_processed' columns to proper format
-    def convert_date(date_str):
-        try:
-            return datetime.strptime(date_str, "%d %b %Y").strftime("%Y-%m-%d")  # "01 Jan 2025" -> "2025-01-01"
-        except ValueError:
-            return None  # Return None if date conversion fails
-
-    def clean_amount(amount_str):
-        """Clean amount string by removing dollar signs, commas, and converting to float."""
-        if pd.isna(amount_str) or amount_str == '':
-            return 0.0
-        try:
-            # Remove dollar signs, commas, and any whitespace
-            cleaned = str(amount_str).replace('$', '').replace(',', '').strip()
-            return float(cleaned)
-        except (ValueError, TypeError):
-            return 0.0
-
-    df['date'] = df['date'].astype(str).apply(convert_date)
-    df['date_processed'] = df['date_processed'].astype(str).apply(convert_date)
-
-    # Clean and convert amount column
-    df['amount'] = df['amount'].apply(clean_amount)
-    
-    # Ensure other numeric values are properly formatted and NaN is replaced with 0
-    numeric_columns = ['commission', 'exc_rate']
-    for col in numeric_columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce').fillna(0)  # Convert to numeric, replace NaN with 0
-
-    # Insert into database
-    for row in df.itertuples(index=False):
-        if row.date is None or row.date_processed is None:
-            continue  # Skip rows with invalid dates
-
-        # Convert description to uppercase for consistency
-        description_upper = str(row.description).upper()
-        
-        AmexTransaction.objects.create(
-            date=row.date,
-            date_processed=row.date_processed,
-            description=description_upper,
-            cardmember=row.cardmember,
-            amount=row.amount,
-            commission=row.commission,
-            exc_rate=row.exc_rate,
-            merchant=row.merchant
-        )
-
-        # Insert into the combined transactions table with user
-        Transaction.objects.create(
-            user=user,
-            date=row.date,
-            description=description_upper,
-            amount=row.amount,
-            source="Amex",
-            account=account
-        )
-    
-    # Update account balance after processing all transactions
-    account.update_balance()
-
-def process_scotiabank_data(df, account, user):
-    """Process and insert Scotiabank data into the database."""
-    from datetime import datetime
-    
-    # Convert date column to proper format
-    def convert_date(date_str):
-        try:
-            # Scotiabank uses YYYY-MM-DD format
-            return datetime.strptime(date_str, "%Y-%m-%d").strftime("%Y-%m-%d")
-        except ValueError:
-            return None
-    
-    df['Date'] = df['Date'].astype(str).apply(convert_date)
-    
-    # Process each row
-    for row in df.itertuples(index=False):
-        if row.Date is None:
-            continue  # Skip rows with invalid dates
-            
-        # Handle amount - Scotiabank files have a single Amount column
-        amount_str = str(row.Amount).replace('$', '').replace(',', '')
-        try:
-            amount = float(amount_str) if amount_str != 'nan' else 0.0
-        except ValueError:
-            amount = 0.0
-        
-        # Convert description to uppercase for consistency
-        description_upper = str(row.Description).upper()
-        
-        # Create ScotiabankTransaction record
-        ScotiabankTransaction.objects.create(
-            date=row.Date,
-            description=description_upper,
-            sub_description=row.Sub_description if hasattr(row, 'Sub_description') else '',
-            status=row.Status if hasattr(row, 'Status') else '',
-            transaction_type=row.Type_of_Transaction if hasattr(row, 'Type_of_Transaction') else '',
-            amount=amount
-        )
-        
-        # Create Transaction record
-        Transaction.objects.create(
-            date=row.Date,
-            description=description_upper,
-            amount=amount,
-            source="Scotiabank",
-            account=account
-        )
-    
-    # Update account balance after processing all transactions
-    account.update_balance()
-
 @csrf_exempt
 def manage_accounts(request):
     if request.method == "POST":
@@ -507,7 +220,9 @@ def manage_accounts(request):
 @permission_classes([IsAuthenticated])
 def transactions_missing_categories(request):
     """Fetches transactions that are missing categories."""
-    transactions = Transaction.objects.filter(user=request.user, category__isnull=True)
+    transactions = Transaction.objects.filter(user=request.user, category__isnull=True).select_related(
+        'account', 'category', 'suggested_category'
+    )
     serializer = TransactionSerializer(transactions, many=True)
     return Response(serializer.data)
 
@@ -520,9 +235,7 @@ def get_categories(request):
     
     if tree_view:
         # Return hierarchical tree structure
-        from .serializers import CategoryTreeSerializer
-        categories = Category.objects.filter(user=request.user, parent__isnull=True, is_active=True)
-        serializer = CategoryTreeSerializer(categories, many=True)
+        return Response(cached_category_tree(request.user), content_type="application/json")
     elif root_only:
         # Return only root categories
         categories = Category.objects.filter(user=request.user, parent__isnull=True, is_active=True)
@@ -595,16 +308,30 @@ def get_accounts(request):
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def get_transactions(request):
-    """Fetch all transactions."""
-    transactions = Transaction.objects.filter(user=request.user).select_related('account').all().order_by("-date")  # Order by latest
-    
-    # Filter for uncategorized transactions if requested
-    uncategorized = request.GET.get('uncategorized', 'false').lower() == 'true'
-    if uncategorized:
-        transactions = transactions.filter(category__isnull=True)
-    
-    serializer = TransactionSerializer(transactions, many=True)
-    return Response(serializer.data)
+    """
+    Fetch the user's transactions, newest first.
+
+    Query params:
+        q, min_amount, max_amount, start_date, end_date, account, category,
+            uncategorized, auto_categorized: Filters, see transaction_search.filter_transactions
+        fields: Comma separated subset of TransactionSerializer fields to return
+        limit / cursor: Opt into keyset pagination; the response becomes
+            {"results": [...], "next_cursor": ...} and next_cursor is passed back
+            as cursor to fetch the following page. Without them the full list is
+            returned as an array.
+    """
+    try:
+        transactions = filter_transactions(Transaction.objects.filter(user=request.user), request.GET)
+        fields = parse_fields(request.GET.get('fields'))
+        if 'limit' in request.GET or 'cursor' in request.GET:
+            rows, next_cursor = transaction_page(
+                transactions, fields, parse_limit(request.GET.get('limit')), request.GET.get('cursor')
+            )
+            return Response({"results": rows, "next_cursor": next_cursor})
+    except (InvalidFilter, InvalidPageRequest) as e:
+        return Response({"error": str(e)}, status=400)
+
+    return Response(serialize_rows(transactions.order_by('-date', '-id'), fields))
 
 @api_view(["POST"])
 @permission_classes([IsAuthenticated])
@@ -635,11 +362,11 @@ from django.db.models import Sum, Count
 from backend.models import Transaction, Category
 from datetime import datetime
 import numpy as np
-from django.db.models.functions import Abs, TruncMonth
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@cached_response
 def get_visualization_data(request):
     """API to get transaction data for visualizations"""
 
@@ -662,57 +389,69 @@ def get_visualization_data(request):
             account_id = int(account_id)
             transactions = transactions.filter(account_id=account_id)
         except (ValueError, TypeError):
-            pass  # Invalid account_id, ignore filter
+            account_id = None  # Invalid account_id, ignore filter
+    else:
+        account_id = None
+
+    # Sums and counts by category, month and weekday, served from the spending rollup
+    range_start = datetime.strptime(start_date, '%Y-%m-%d').date()
+    range_end = datetime.strptime(end_date, '%Y-%m-%d').date()
+    groups = spending_groups(request.user, range_start, range_end, account_id)
+    expense_groups = [group for group in groups if group['expense_count']]
+    income_groups = [group for group in groups if group['income_count']]
+
+    def _totals(rows, key):
+        totals = {}
+        for row in rows:
+            totals[row[key]] = totals.get(row[key], 0) + row['expense_total']
+        return totals
 
     # Only expenses for category pie (positive values for charting)
     expenses = transactions.filter(amount__gt=0)
-    category_spending = (
-        expenses.values("category__name")
-        .annotate(total_amount=Sum("amount"))
-        .order_by("-total_amount")
+    category_spending = sorted(
+        ({"category__name": name, "total_amount": total} for name, total in _totals(expense_groups, 'category__name').items()),
+        key=lambda item: item["total_amount"],
+        reverse=True
     )
 
     # Monthly spending trend (sum of expenses by month)
-    monthly_trend = (
-        expenses.annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total_amount=Sum("amount"))
-        .order_by("month")
-    )
+    monthly_trend = [
+        {"month": month, "total_amount": total}
+        for month, total in sorted(_totals(expense_groups, 'month').items())
+    ]
 
     # Monthly income trend (sum of negative amounts by month, converted to positive)
     income = transactions.filter(amount__lt=0)
-    monthly_income = (
-        income.annotate(month=TruncMonth("date"))
-        .values("month")
-        .annotate(total_amount=Abs(Sum("amount")))
-        .order_by("month")
-    )
-
-    # Standard deviation per category (spending consistency)
-    category_variance = {}
-    category_names = transactions.values_list("category__name", flat=True).distinct()
-
-    for category in category_names:
-        category_transactions = transactions.filter(category__name=category).values_list(
-            "amount", flat=True
-        )
-        category_variance[category] = float(np.std(list(category_transactions))) if category_transactions else 0
+    monthly_income_totals = {}
+    for group in income_groups:
+        monthly_income_totals[group['month']] = monthly_income_totals.get(group['month'], 0) + group['income_total']
+    monthly_income = [
+        {"month": month, "total_amount": abs(total)}
+        for month, total in sorted(monthly_income_totals.items())
+    ]
+
+    # Standard deviation per category (spending consistency), from one fetch of all amounts in range
+    category_names = list(dict.fromkeys(group['category__name'] for group in groups))
+    category_amounts = {category: [] for category in category_names}
+    for category, amount in transactions.values_list("category__name", "amount").order_by().iterator():
+        category_amounts.setdefault(category, []).append(amount)
+    category_variance = {
+        category: float(np.std(amounts)) if amounts else 0
+        for category, amounts in category_amounts.items()
+    }
 
     # NEW: Weekly spending patterns (day of week analysis)
-    from django.db.models.functions import Extract
-    weekly_patterns = (
-        expenses.annotate(day_of_week=Extract('date', 'week_day'))
-        .values('day_of_week')
-        .annotate(total_amount=Sum('amount'), transaction_count=Count('id'))
-        .order_by('day_of_week')
-    )
+    weekly_patterns = {}
+    for group in expense_groups:
+        day = weekly_patterns.setdefault(group['week_day'], {'total_amount': 0, 'transaction_count': 0})
+        day['total_amount'] += group['expense_total']
+        day['transaction_count'] += group['expense_count']
     
     # Convert day numbers to names
     day_names = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
     weekly_data = []
-    for item in weekly_patterns:
-        day_num = item['day_of_week'] - 1  # Convert from 1-7 to 0-6
+    for day_of_week, item in sorted(weekly_patterns.items()):
+        day_num = day_of_week - 1  # Convert from 1-7 to 0-6
         weekly_data.append({
             'day': day_names[day_num],
             'amount': float(item['total_amount']),
@@ -720,36 +459,34 @@ def get_visualization_data(request):
         })
 
     # NEW: Top merchants analysis
-    top_merchants = (
-        expenses.values('description')
-        .annotate(total_amount=Sum('amount'), transaction_count=Count('id'))
-        .order_by('-total_amount')[:10]
-    )
-
-    # NEW: Category spending trends over time (monthly)
-    category_trends = {}
-    for category in category_names:
-        if category:
-            category_monthly = (
-                expenses.filter(category__name=category)
-                .annotate(month=TruncMonth("date"))
-                .values("month")
-                .annotate(total_amount=Sum("amount"))
-                .order_by("month")
-            )
-            category_trends[category] = list(category_monthly)
+    # Grouped on the normalized merchant; exposed as "description" for the chart
+    top_merchant_totals = [
+        {"description": row["merchant_key"], "total_amount": row["total_amount"], "transaction_count": row["transaction_count"]}
+        for row in merchant_totals(expenses, limit=10)
+    ]
+
+    # NEW: Category spending trends over time (monthly), in a single pass over the groups
+    category_monthly = {category: {} for category in category_names if category}
+    for group in expense_groups:
+        if group['category__name']:
+            months = category_monthly[group['category__name']]
+            months[group['month']] = months.get(group['month'], 0) + group['expense_total']
+    category_trends = {
+        category: [{"month": month, "total_amount": total} for month, total in sorted(months.items())]
+        for category, months in category_monthly.items()
+    }
 
     # NEW: Spending summary metrics
-    total_spending = expenses.aggregate(total=Sum('amount'))['total'] or 0
-    total_income = income.aggregate(total=Sum('amount'))['total'] or 0
+    total_spending = sum(group['expense_total'] for group in expense_groups)
+    total_income = sum(group['income_total'] for group in income_groups)
     avg_daily_spending = total_spending / max(1, (datetime.strptime(end_date, '%Y-%m-%d') - datetime.strptime(start_date, '%Y-%m-%d')).days)
-    total_transactions = expenses.count()
+    total_transactions = sum(group['expense_count'] for group in expense_groups)
     
     # NEW: Month-over-month comparison
     current_month_spending = 0
     previous_month_spending = 0
     if monthly_trend:
-        current_month = monthly_trend.last()
+        current_month = monthly_trend[-1]
         if current_month:
             current_month_spending = float(current_month['total_amount'])
         
@@ -762,24 +499,19 @@ def get_visualization_data(request):
     if previous_month_spending > 0:
         mom_change = ((current_month_spending - previous_month_spending) / previous_month_spending) * 100
 
-    # NEW: Unusual spending detection (transactions > 2 standard deviations from mean)
-    if expenses.exists():
-        amounts = list(expenses.values_list('amount', flat=True))
-        mean_amount = np.mean(amounts)
-        std_amount = np.std(amounts)
-        threshold = mean_amount + (2 * std_amount)
-        unusual_transactions = expenses.filter(amount__gt=threshold).values(
-            'date', 'description', 'amount', 'category__name'
-        )[:5]
+    # NEW: Unusual spending detection, per category (robust z-score, see backend.amount_stats)
+    unusual_transactions = find_unusual_transactions(
+        expenses, category_expense_stats(request.user, range_start, range_end, account_id)
+    )
 
     # Construct JSON response
     response_data = {
-        "category_spending": list(category_spending),
-        "monthly_trend": list(monthly_trend),
-        "monthly_income": list(monthly_income),
+        "category_spending": category_spending,
+        "monthly_trend": monthly_trend,
+        "monthly_income": monthly_income,
         "category_variance": category_variance,
         "weekly_patterns": weekly_data,
-        "top_merchants": list(top_merchants),
+        "top_merchants": top_merchant_totals,
         "category_trends": category_trends,
         "summary_metrics": {
             "total_spending": float(total_spending),
@@ -789,7 +521,7 @@ def get_visualization_data(request):
             "total_transactions": total_transactions,
             "mom_change_percent": round(mom_change, 2)
         },
-        "unusual_transactions": list(unusual_transactions) if 'unusual_transactions' in locals() else []
+        "unusual_transactions": list(unusual_transactions)
     }
 
     return JsonResponse(response_data, safe=False)
@@ -887,39 +619,41 @@ def get_category_subcategories(request, category_id):
 @permission_classes([IsAuthenticated])
 def get_category_tree(request):
     """Gets the complete category tree structure."""
-    from .serializers import CategoryTreeSerializer
-    categories = Category.objects.filter(user=request.user, parent__isnull=True, is_active=True)
-    serializer = CategoryTreeSerializer(categories, many=True)
-    return Response(serializer.data)
+    return Response(cached_category_tree(request.user))
 
 @api_view(['PUT'])
 @permission_classes([IsAuthenticated])
 def update_transaction_category(request, transaction_id):
-    """Updates a transaction's category and all other transactions with the same description."""
+    """
+    Updates a transaction's category and all other transactions with the same description.
+
+    All of them are changed with a single UPDATE located through the merchant
+    key index; the spending rollup and caches are refreshed once.
+    """
     try:
         transaction = Transaction.objects.get(user=request.user, id=transaction_id)
         category_id = request.data.get('category')
         category = Category.objects.get(user=request.user, id=category_id)
         
-        # Update the original transaction
-        transaction.category = category
-        transaction.save()
-        
-        # Find and update all other transactions with the same description (same user)
-        description = transaction.description
-        other_transactions = Transaction.objects.filter(
-            user=request.user,
-            description=description
-        ).exclude(id=transaction_id)
+        # The transaction and every other transaction with the same description (same user)
+        matching_transactions = same_description(Transaction.objects.filter(user=request.user), transaction.description)
         
-        # Update all matching transactions
-        updated_count = other_transactions.update(category=category)
+        with db_transaction.atomic():
+            rollup_slices = slices_for_queryset(matching_transactions)
+            classifier_changes = [
+                (transaction.similarity_key, old_category_id, category.id, count)
+                for old_category_id, count in matching_transactions.values('category_id').annotate(count=Count('id')).order_by().values_list('category_id', 'count')
+            ]
+            updated_count = matching_transactions.update(category=category)
+            refresh_spending_rollup(rollup_slices)
+        record_categorization(request.user.id, classifier_changes)
+        transaction.category = category
         
         return Response({
             'success': True,
             'transaction': TransactionSerializer(transaction).data,
-            'message': f'Updated {updated_count + 1} transactions with the same description',
-            'updated_count': updated_count + 1
+            'message': f'Updated {updated_count} transactions with the same description',
+            'updated_count': updated_count
         })
         
     except Transaction.DoesNotExist:
@@ -933,68 +667,129 @@ def update_account(request, account_id):
     try:
         data = request.data
         account = Account.objects.get(user=request.user, id=account_id)
-            
-            account.name = data.get("name", account.name)
-            account.bank = data.get("bank", account.bank)
-            account.type = data.get("type", account.type)
-            account.save()
 
-            return JsonResponse({
-                "message": "Account updated successfully",
-                "account": {
-                    "id": account.id,
-                    "name": account.name,
-                    "bank": account.bank,
-                    "type": account.type,
-                    "balance": float(account.balance),
-                    "lastUpdated": account.last_updated.isoformat()
-                }
-            })
-        except Account.DoesNotExist:
-            return JsonResponse({"error": "Account not found"}, status=404)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+        account.name = data.get("name", account.name)
+        account.bank = data.get("bank", account.bank)
+        account.type = data.get("type", account.type)
+        account.save()
+
+        return JsonResponse({
+            "message": "Account updated successfully",
+            "account": {
+                "id": account.id,
+                "name": account.name,
+                "bank": account.bank,
+                "type": account.type,
+                "balance": float(account.balance),
+                "lastUpdated": account.last_updated.isoformat()
+            }
+        })
+    except Account.DoesNotExist:
+        return JsonResponse({"error": "Account not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
 @api_view(['DELETE'])
 @permission_classes([IsAuthenticated])
 def delete_account(request, account_id):
     try:
         account = Account.objects.get(user=request.user, id=account_id)
-            account.delete()
-            return JsonResponse({"message": "Account deleted successfully"})
-        except Account.DoesNotExist:
-            return JsonResponse({"error": "Account not found"}, status=404)
-        except Exception as e:
-            return JsonResponse({"error": str(e)}, status=500)
+        account.delete()
+        return JsonResponse({"message": "Account deleted successfully"})
+    except Account.DoesNotExist:
+        return JsonResponse({"error": "Account not found"}, status=404)
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def refresh_account_balances(request):
-    """Refresh all account balances by recalculating from transactions."""
+    """
+    Recompute all account balances from their transactions in one grouped query.
+
+    Balances are kept up to date incrementally, so this only repairs drift.
+    Pass dry_run=true to report the drift without changing anything.
+    """
     try:
-        accounts = Account.objects.filter(user=request.user)
-        updated_accounts = []
-        
-        for account in accounts:
-            old_balance = account.balance
-            new_balance = account.update_balance()
-            updated_accounts.append({
-                'id': account.id,
-                'name': account.name,
-                'bank': account.bank,
-                'old_balance': float(old_balance),
-                'new_balance': float(new_balance)
-            })
-        
+        dry_run = str(request.data.get('dry_run', request.GET.get('dry_run', 'false'))).lower() == 'true'
+        accounts = verify_account_balances(Account.objects.filter(user=request.user), fix=not dry_run)
+        drifted = sum(1 for account in accounts if account['drift'])
+
+        if dry_run:
+            message = f'{drifted} of {len(accounts)} account balances have drifted'
+        else:
+            message = f'Successfully updated {len(accounts)} account balances'
         return Response({
-            'message': f'Successfully updated {len(updated_accounts)} account balances',
-            'accounts': updated_accounts
+            'message': message,
+            'drifted': drifted,
+            'accounts': accounts
         })
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def get_account_balance_history(request, account_id):
+    """
+    Balance of an account over time.
+
+    Query params:
+        start_date / end_date: Inclusive YYYY-MM-DD range (default: all history)
+        interval: day, week, month, year or auto (default day)
+        max_points: Bucket limit used by interval=auto (default 1000)
+    """
+    try:
+        account = Account.objects.get(user=request.user, id=account_id)
+    except Account.DoesNotExist:
+        return Response({'error': 'Account not found'}, status=404)
+
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        history = balance_history(
+            account,
+            start_date=datetime.strptime(start_date, '%Y-%m-%d').date() if start_date else None,
+            end_date=datetime.strptime(end_date, '%Y-%m-%d').date() if end_date else None,
+            interval=request.GET.get('interval', 'day'),
+            max_points=max(int(request.GET.get('max_points', DEFAULT_MAX_POINTS)), 1),
+        )
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    return Response({'account_id': account.id, 'balance': float(account.balance), **history})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response
+def get_top_merchants(request):
+    """
+    Merchants with the highest spending, grouped on the normalized merchant.
+
+    Query params:
+        start_date / end_date: Inclusive YYYY-MM-DD range (default: all history)
+        account_id: Limit to one account (optional)
+        limit: Number of merchants (default 10, max 100)
+    """
+    expenses = Transaction.objects.filter(user=request.user, amount__gt=0)
+    try:
+        start_date = request.GET.get('start_date')
+        end_date = request.GET.get('end_date')
+        if start_date:
+            expenses = expenses.filter(date__gte=datetime.strptime(start_date, '%Y-%m-%d').date())
+        if end_date:
+            expenses = expenses.filter(date__lte=datetime.strptime(end_date, '%Y-%m-%d').date())
+        account_id = request.GET.get('account_id')
+        if account_id and account_id != 'all':
+            expenses = expenses.filter(account_id=int(account_id))
+        limit = min(max(int(request.GET.get('limit', 10)), 1), 100)
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    return Response({'merchants': top_merchants(expenses, limit)})
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@cached_response
 def get_dashboard_data(request):
     try:
         # Get account_id from query parameters (optional)
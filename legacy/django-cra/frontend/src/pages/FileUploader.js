@@ -33,6 +33,10 @@ import ErrorIcon from '@mui/icons-material/Error';
 import UploadFileIcon from '@mui/icons-material/UploadFile';
 import { useTheme } from "@mui/material/styles";
 
+// Background imports are polled once a second for at most 10 minutes
+const JOB_POLL_INTERVAL_MS = 1000;
+const JOB_POLL_TIMEOUT_MS = 10 * 60 * 1000;
+
 const FileUploader = () => {
     const theme = useTheme();
     const navigate = useNavigate();
@@ -177,8 +181,28 @@ const FileUploader = () => {
         formData.append("account", account);
 
         const response = await axios.post("http://127.0.0.1:8000/api/upload-multiple/", formData);
-        setUploadResults(response.data.file_results);
         setMessage(response.data.message);
+
+        // Files are imported in the background; poll the job until it finishes
+        const statusUrl = `http://127.0.0.1:8000${response.data.status_url}`;
+        const deadline = Date.now() + JOB_POLL_TIMEOUT_MS;
+        let job = null;
+        do {
+          if (Date.now() > deadline) {
+            setUploadResults(job ? job.file_results : []);
+            setMessage("Upload is taking too long to finish. Check the transactions page later, or upload the files again.");
+            return;
+          }
+          await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+          job = (await axios.get(statusUrl)).data;
+          const doneFiles = job.file_results.filter(r => r.status === "imported" || r.status === "failed").length;
+          setUploadProgress(Math.round((doneFiles / job.file_results.length) * 100));
+        } while (job.status !== "completed" && job.status !== "failed");
+
+        setUploadResults(job.file_results);
+        setMessage(job.status === "failed"
+          ? `Upload failed: ${job.error}`
+          : `Upload completed: ${job.successful_uploads} successful, ${job.failed_uploads} failed`);
         setUploadProgress(100);
       } else {
         // Single file upload